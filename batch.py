@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+batch.py
+
+Description: Build (or destroy) many environments of the simple blog application in one process.
+
+batch.py <spec file> [--destroy [--parallel <n>]] [--max-api-concurrency <n>] [--ssh-pool-size <n>]
+         [--recycle-floating-ips] [--checkpoint-directory <directory>]
+
+The spec file has one environment per line, with the same positional arguments as build.py:
+
+    # app        environment  num_servers  server_size
+    hello_world  ci-1         2            m1.small
+    hello_world  ci-2         1            m1.small
+
+The environments share one OpenStack connection (so there is one authentication and one connection pool), and a
+cache of the shared catalog (images, flavors, key pairs, the public network). The number of API calls in flight, and
+their rate, is capped across all of the environments. A failure in one environment is reported but does not stop the
+others, and the exit status is 1 if any environment failed.
+
+Builds run one at a time, as the load balancers, their security groups and the salt-cloud key pair have the same names
+in every environment of a project. Destroys can run in parallel, as each leaves alone the load balancers (and their
+security groups and key pair) of other environments.
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import logging
+import sys
+import time
+
+import build
+from openstack_infrastructure import facade as osf, middleware
+
+DEFAULT_PARALLEL = 1  # builds must not run in parallel - see run_batch
+DEFAULT_MAX_API_CONCURRENCY = 8
+
+logger = logging.getLogger(__name__)
+
+
+class EnvironmentSpec(collections.namedtuple('EnvironmentSpec', 'app environment num_servers server_size')):
+
+    @property
+    def label(self):
+        return '%s %s' % (self.app, self.environment)
+
+
+def read_specs(lines):
+    """
+    Read environment specs, ignoring blank lines and comments.
+    :param lines: An iterable of lines, each containing app, environment, num_servers and server_size.
+    :return: A list of EnvironmentSpecs
+    """
+    specs = []
+    for line_number, line in enumerate(lines, 1):
+        fields = line.split('#', 1)[0].split()
+        if not fields:
+            continue
+        if len(fields) != 4 or not fields[2].isdigit():
+            raise ValueError('line %s: expected <app> <environment> <num_servers> <server_size>, got %r' % (
+                line_number, line.strip()))
+        specs.append(EnvironmentSpec(fields[0], fields[1], int(fields[2]), fields[3]))
+    return specs
+
+
+def run_environment(spec, conn, destroy, ssh_pool_size, recycle_floating_ips=False,
+                    checkpoint_directory=build.CHECKPOINT_DIRECTORY):
+    """
+    Build or destroy one environment.
+    :param spec: The EnvironmentSpec
+    :param conn: The shared connection (or ConnectionMiddleware)
+    :param destroy: Destroy the environment rather than build it.
+    :param ssh_pool_size: The maximum number of hosts of the environment to run remote commands on at once.
+    :param recycle_floating_ips: Return the floating IP addresses of deleted servers to the pool.
+    :param checkpoint_directory: The directory in which the checkpoint of the build is kept - see build.py --resume
+    :return: A dict containing the spec, outcome ('ok' or the error), seconds taken and, for a build, the servers and
+             HA address.
+    """
+    params = dict(
+        app=spec.app,
+        environment=spec.environment,
+        num_servers=spec.num_servers,
+        server_size=spec.server_size,
+        drain_timeout=build.DRAIN_TIMEOUT_SECONDS,
+        subnet_cidr=build.DEFAULT_SUBNET_CIDR,
+        ssh_pool_size=ssh_pool_size,
+        checkpoint_directory=checkpoint_directory,
+    )
+    os_facade = osf.OpenStackFacade(conn=conn, recycle_floating_ips=recycle_floating_ips)
+    manager = build.InfrastructureManager(params, os_facade)
+    result = dict(spec=spec, outcome='ok', servers=None, ha_address=None, floating_ip_pool_stats=None)
+    started = time.time()
+    try:
+        if destroy:
+            manager.destroy()
+        else:
+            result['servers'], result['ha_address'] = manager.build()
+    except (Exception, SystemExit) as e:  # build.py exits on fatal errors, which must not end the batch
+        logger.exception('%s failed', spec.label)
+        result['outcome'] = 'exit status %s' % e.code if isinstance(e, SystemExit) else repr(e)
+    result['seconds'] = time.time() - started
+    result['floating_ip_pool_stats'] = os_facade.floating_ip_pool_stats
+    return result
+
+
+def run_batch(specs, conn, destroy=False, parallel=DEFAULT_PARALLEL, ssh_pool_size=build.SSH_POOL_SIZE,
+              recycle_floating_ips=False, checkpoint_directory=build.CHECKPOINT_DIRECTORY):
+    """
+    Build or destroy environments concurrently, isolating the failure of each one from the others.
+    Concurrent builds in one project would race on the shared load balancer, security group and key pair names, so
+    only destroys can work on more than one environment at once.
+    :param specs: A list of EnvironmentSpecs
+    :param conn: The shared connection (or ConnectionMiddleware)
+    :param destroy: Destroy the environments rather than build them.
+    :param parallel: The maximum number of environments to work on at once. Must be 1 unless destroy is set.
+    :param ssh_pool_size: The maximum number of hosts of each environment to run remote commands on at once.
+    :param recycle_floating_ips: Return the floating IP addresses of deleted servers to the pool.
+    :param checkpoint_directory: The directory in which the checkpoints of the builds are kept.
+    :return: A list of result dicts (see run_environment), in the order of specs.
+    """
+    if parallel > 1 and not destroy:
+        raise ValueError('environments cannot be built in parallel, as their load balancers, security groups and '
+                         'salt-cloud key pair have the same names')
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(parallel, len(specs)))) as executor:
+        futures = [
+            executor.submit(
+                run_environment, spec, conn, destroy, ssh_pool_size, recycle_floating_ips, checkpoint_directory
+            )
+            for spec in specs
+        ]
+        return [future.result() for future in futures]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("spec_file", type=argparse.FileType('r'),
+                        help="a file with one '<app> <environment> <num_servers> <server_size>' line per environment")
+    parser.add_argument("-d", "--destroy", help="destroy the environments, don't create them", action="store_true")
+    parser.add_argument("--parallel", type=int, default=DEFAULT_PARALLEL,
+                        help="the maximum number of environments to destroy at once (builds run one at a time)")
+    parser.add_argument("--max-api-concurrency", type=int, default=DEFAULT_MAX_API_CONCURRENCY,
+                        help="the maximum number of OpenStack API calls in flight at once, across all environments")
+    parser.add_argument("--ssh-pool-size", type=int, default=build.SSH_POOL_SIZE,
+                        help="the maximum number of hosts of each environment to run remote commands on at once")
+    parser.add_argument("--recycle-floating-ips", action="store_true",
+                        help="return the floating IP addresses of deleted servers to a pool for reuse")
+    parser.add_argument("--checkpoint-directory", default=build.CHECKPOINT_DIRECTORY,
+                        help="the directory in which the checkpoints of the builds are kept")
+    args = parser.parse_args()
+    try:
+        specs = read_specs(args.spec_file)
+    except ValueError as e:
+        logger.fatal('%s: %s' % (args.spec_file.name, e))
+        sys.exit(1)
+    if args.parallel > 1 and not args.destroy:
+        logger.fatal('--parallel is only allowed with --destroy: builds in one project race on the shared load '
+                     'balancer, security group and key pair names')
+        sys.exit(1)
+
+    rate_limiter = middleware.RateLimiter(
+        middleware.ConcurrencyLimiter(osf.OpenStackFacade.create_connection_from_environ(), args.max_api_concurrency)
+    )
+    retrier = middleware.Retrier(rate_limiter)
+    catalog_cache = middleware.CatalogCache(retrier)
+    api_profiler = middleware.ApiProfiler(catalog_cache)
+    try:
+        results = run_batch(
+            specs, api_profiler, args.destroy, args.parallel, args.ssh_pool_size, args.recycle_floating_ips,
+            args.checkpoint_directory
+        )
+    finally:
+        print()
+        print('OpenStack API calls')
+        print(api_profiler.format_summary())
+        print('catalog cache: %s hits, %s misses' % (catalog_cache.hits, catalog_cache.misses))
+        print(middleware.format_counts('throttled calls', rate_limiter.throttles))
+        print(middleware.format_counts('retried calls', retrier.retried))
+
+    print(osf.format_floating_ip_pool_stats(sum((x['floating_ip_pool_stats'] for x in results), collections.Counter())))
+
+    print()
+    for result in results:
+        print('%-40s %-24s %8.1fs%s' % (
+            result['spec'].label, result['outcome'], result['seconds'],
+            '  http://%s' % result['ha_address'] if result['ha_address'] else ''))
+    if any(x['outcome'] != 'ok' for x in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+failover.py
+
+Description: Benchmark the time taken to move the HA floating IP address during keepalived failover.
+
+python -m benchmarks.failover [--trials <n>] [--latency <seconds>] [--mechanism cli|agent ...]
+
+The keepalived notify scripts generated by fab_utils are run against a local stand-in for keystone and neutron
+(see fake_neutron.py). Each trial simulates the loss of the current master: the notify script of the host taking
+over is run, and the time until the fake neutron sees the HA floating IP associated with the new master's port is
+recorded. The direction alternates between trials, as it would when the primary fails and later takes back over.
+
+Mechanisms:
+
+ - cli: the neutron CLI fallback in the notify scripts (requires the neutron CLI, see --neutron-cli)
+ - agent: the resident failover agent, see failover_agent.py
+
+The time keepalived takes to notice the loss of the master is not measured, as it is fixed by the configuration
+placed by fab_utils; it is reported alongside the results.
+
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import yaml
+
+from benchmarks import stats
+from benchmarks.fake_neutron import FakeNeutron
+from build_utils import failover_agent, fab_utils
+
+PRIMARY_PORT_ID = 'port-vrrp-primary'
+SECONDARY_PORT_ID = 'port-vrrp-secondary'
+CLOUD_NAME = '100percentit'  # as used by the generated notify scripts
+ADVERT_INT_SECONDS = 1  # keepalived default, not overridden by the generated keepalived.conf files
+SECONDARY_PRIORITY = 50  # as per the generated secondary-keepalived.conf
+
+
+def keepalived_detection_delay(priority, advert_int=ADVERT_INT_SECONDS):
+    """
+    Return the time for which a keepalived backup waits without adverts before it takes over as master.
+    This is the master down interval from RFC 3768: three advert intervals plus the skew time.
+    :param priority: The priority of the backup.
+    :param advert_int: The advert interval in seconds.
+    :return: The delay in seconds.
+    """
+    return 3 * advert_int + (256 - priority) / 256.0 * advert_int
+
+
+def write_clouds_yaml(directory, fake_neutron):
+    """
+    Write a clouds.yaml which points the cloud used by the notify scripts at the fake neutron.
+    :param directory: The directory to write clouds.yaml to.
+    :param fake_neutron: The FakeNeutron instance.
+    :return: The path of the clouds.yaml file.
+    """
+    path = os.path.join(directory, 'clouds.yaml')
+    with open(path, 'w') as clouds_yaml:
+        yaml.dump(
+            dict(
+                clouds={
+                    CLOUD_NAME: dict(
+                        auth=dict(
+                            auth_url=fake_neutron.auth_url,
+                            project_domain_name='default',
+                            user_domain_name='default',
+                            project_id='project',
+                            username='user',
+                            password='password',
+                        ),
+                        region_name='RegionOne',
+                        interface='internal',
+                    )
+                }
+            ),
+            clouds_yaml,
+            default_flow_style=False
+        )
+    return path
+
+
+def write_notify_scripts(directory, floating_ip_id, fifo):
+    """
+    Write the keepalived notify scripts, as generated by fab_utils.
+    :param directory: The directory to write the scripts to.
+    :param floating_ip_id: The id of the HA floating IP address.
+    :param fifo: The path of the failover agent FIFO.
+    :return: A dict of target port id to script path.
+    """
+    scripts = dict()
+    for (name, from_port_id, to_port_id) in [
+        ('failover-primary-to-secondary.sh', PRIMARY_PORT_ID, SECONDARY_PORT_ID),
+        ('failover-secondary-to-primary.sh', SECONDARY_PORT_ID, PRIMARY_PORT_ID),
+    ]:
+        path = os.path.join(directory, name)
+        with open(path, 'w') as script:
+            script.write(fab_utils._generate_failover_sh(name, floating_ip_id, from_port_id, to_port_id, fifo=fifo))
+        scripts[to_port_id] = path
+    return scripts
+
+
+def start_failover_agent(clouds_yaml_path, floating_ip_id, fifo):
+    """
+    Start the failover agent in a daemon thread, as it would run on the vrrp hosts.
+    :param clouds_yaml_path: The path of the clouds.yaml file.
+    :param floating_ip_id: The id of the HA floating IP address.
+    :param fifo: The path of the FIFO to serve.
+    :return: The FailoverAgent
+    """
+    cloud_config = failover_agent.load_cloud_config(CLOUD_NAME, [clouds_yaml_path])
+    agent = failover_agent.FailoverAgent(
+        failover_agent.create_session(cloud_config),
+        floating_ip_id,
+        region_name=cloud_config.get('region_name'),
+        interface=cloud_config.get('interface'),
+    )
+    agent.keep_warm()
+    agent.start_keeping_warm()
+    thread = threading.Thread(target=agent.serve, args=(fifo,), name='failover-agent')
+    thread.daemon = True
+    thread.start()
+    while not os.path.exists(fifo):
+        time.sleep(0.01)
+    return agent
+
+
+def run_trials(fake_neutron, floating_ip_id, scripts, script_env, trials, timeout):
+    """
+    Run the failover trials.
+    :param fake_neutron: The FakeNeutron instance.
+    :param floating_ip_id: The id of the HA floating IP address.
+    :param scripts: A dict of target port id to notify script path.
+    :param script_env: The environment in which to run the notify scripts.
+    :param trials: The number of trials to run.
+    :param timeout: The maximum number of seconds to wait for each reassociation.
+    :return: A list of times to reassociate in seconds, and the number of trials which timed out.
+    """
+    samples = []
+    timeouts = 0
+    target_port_id = SECONDARY_PORT_ID  # the HA floating IP address starts on the primary
+    for _ in range(trials):
+        started = time.time()
+        subprocess.call(['bash', scripts[target_port_id]], env=script_env,
+                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        reassociated_at = fake_neutron.wait_for_association(floating_ip_id, target_port_id, timeout)
+        if reassociated_at is None:
+            timeouts += 1
+            fake_neutron.associate(floating_ip_id, target_port_id)  # put things straight for the next trial
+        else:
+            samples.append(reassociated_at - started)
+        target_port_id = PRIMARY_PORT_ID if target_port_id == SECONDARY_PORT_ID else SECONDARY_PORT_ID
+    return samples, timeouts
+
+
+def benchmark_mechanism(mechanism, args):
+    """
+    Benchmark a failover mechanism against a fresh fake neutron.
+    :param mechanism: The mechanism, either 'cli' or 'agent'.
+    :param args: The parsed command line arguments.
+    :return: A dict of results, or None if the mechanism could not be benchmarked.
+    """
+    if mechanism == 'cli' and not shutil.which(args.neutron_cli):
+        print('skipping cli: %s not found (see --neutron-cli)' % args.neutron_cli, file=sys.stderr)
+        return None
+
+    fake_neutron = FakeNeutron(latency=args.latency).start()
+    directory = tempfile.mkdtemp(prefix='failover-benchmark-')
+    try:
+        floating_ip_id = fake_neutron.create_floating_ip(port_id=PRIMARY_PORT_ID)
+        clouds_yaml_path = write_clouds_yaml(directory, fake_neutron)
+        fifo = os.path.join(directory, 'failover.fifo')
+        if mechanism == 'agent':
+            start_failover_agent(clouds_yaml_path, floating_ip_id, fifo)
+        scripts = write_notify_scripts(directory, floating_ip_id, fifo)
+
+        script_env = dict(os.environ, OS_CLIENT_CONFIG_FILE=clouds_yaml_path)
+        neutron_cli_directory = os.path.dirname(shutil.which(args.neutron_cli) or '')
+        if neutron_cli_directory:
+            script_env['PATH'] = os.pathsep.join([neutron_cli_directory, script_env.get('PATH', '')])
+
+        requests_before = len(fake_neutron.requests)
+        samples, timeouts = run_trials(fake_neutron, floating_ip_id, scripts, script_env, args.trials, args.timeout)
+        results = stats.summarise(samples)
+        results.update(
+            mechanism=mechanism,
+            timeouts=timeouts,
+            requests_per_failover=(len(fake_neutron.requests) - requests_before) / float(args.trials),
+        )
+        return results
+    finally:
+        fake_neutron.stop()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trials", type=int, default=50, help="the number of failovers per mechanism")
+    parser.add_argument("--latency", type=float, default=0.05, help="the latency of each fake API request (s)")
+    parser.add_argument("--timeout", type=float, default=30, help="the maximum time to wait for a failover (s)")
+    parser.add_argument("--mechanism", nargs='+', choices=['cli', 'agent'], default=['cli', 'agent'],
+                        help="the failover mechanism(s) to benchmark")
+    parser.add_argument("--neutron-cli", default='neutron', help="the neutron CLI executable")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    results = [x for x in (benchmark_mechanism(mechanism, args) for mechanism in args.mechanism) if x]
+    detection_delay = keepalived_detection_delay(SECONDARY_PRIORITY)
+
+    if args.json:
+        print(json.dumps(dict(keepalived_detection_delay=detection_delay, results=results), indent=4))
+        return
+
+    print('keepalived detection delay (computed, not included below): %.3fs' % detection_delay)
+    print('%-8s %6s %9s %9s %9s %9s %9s %9s' % (
+        '', 'n', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms', 'requests', 'timeouts'))
+    for result in results:
+        if not result['count']:
+            print('%-8s %6s %s' % (result['mechanism'], 0, 'no successful failovers'))
+            continue
+        print('%-8s %6s %9.1f %9.1f %9.1f %9.1f %9.1f %9s' % (
+            result['mechanism'], result['count'],
+            result['p50'] * 1000, result['p95'] * 1000, result['p99'] * 1000, result['max'] * 1000,
+            result['requests_per_failover'], result['timeouts'],
+        ))
+
+
+if __name__ == '__main__':
+    main()
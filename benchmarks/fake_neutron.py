@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+fake_neutron.py
+
+Description: A local stand-in for the keystone and neutron endpoints used during keepalived failover.
+
+Only the calls made by the failover notify scripts (neutron CLI) and the failover agent are implemented:
+
+ - POST /v3/auth/tokens - issues a token, with a catalog pointing the network service back at this server
+ - GET / and GET /v2.0/ - version discovery
+ - GET /v2.0/floatingips[?id=...] and GET /v2.0/floatingips/<id> - show floating IP addresses
+ - PUT /v2.0/floatingips/<id> - associate / disassociate a floating IP address
+
+Every association change is recorded with its time, so that the time taken to reassociate the floating IP address
+can be measured. Each request can be delayed to simulate the latency of a real cloud.
+
+"""
+
+import datetime
+import json
+import re
+import threading
+import time
+import uuid
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FLOATING_IP_PATTERN = re.compile('^/v2.0/floatingips/([^/?]+?)(\\.json)?$')
+
+
+class FakeNeutron(object):
+
+    def __init__(self, latency=0.0, host='127.0.0.1', port=0):
+        """
+        Construct a FakeNeutron server. The server is not started until start() is called.
+        :param latency: The number of seconds by which to delay each request. Defaults to 0.
+        :param host: The address to listen on. Defaults to 127.0.0.1
+        :param port: The port to listen on. Defaults to 0, meaning any free port.
+        """
+        self.latency = latency
+        self.floating_ips = dict()
+        self.associations = []  # (time, floating ip id, port id)
+        self.requests = []  # (method, path)
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        return 'http://%s:%s' % self.server.server_address[:2]
+
+    @property
+    def auth_url(self):
+        return '%s/v3' % self.url
+
+    def start(self):
+        """
+        Start serving requests from a daemon thread.
+        :return: self
+        """
+        thread = threading.Thread(target=self.server.serve_forever, name='fake-neutron')
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def create_floating_ip(self, port_id=None):
+        """
+        Create a floating IP address, optionally associated with a port.
+        :param port_id: The id of the port to associate the floating IP address with. Optional.
+        :return: The id of the floating IP address.
+        """
+        floating_ip_id = str(uuid.uuid4())
+        with self.lock:
+            self.floating_ips[floating_ip_id] = dict(
+                id=floating_ip_id,
+                floating_ip_address='203.0.113.%s' % (len(self.floating_ips) + 1),
+                floating_network_id='public',
+                port_id=port_id,
+                fixed_ip_address=None,
+                status='ACTIVE' if port_id else 'DOWN',
+                tenant_id='project',
+                project_id='project',
+                router_id=None,
+                description='',
+            )
+        return floating_ip_id
+
+    def associate(self, floating_ip_id, port_id):
+        """
+        Associate (or with port_id None, disassociate) a floating IP address, recording the time of the change.
+        :param floating_ip_id: The id of the floating IP address.
+        :param port_id: The id of the port, or None.
+        :return: The floating IP address dict.
+        """
+        with self.condition:
+            floating_ip = self.floating_ips[floating_ip_id]
+            floating_ip['port_id'] = port_id
+            floating_ip['status'] = 'ACTIVE' if port_id else 'DOWN'
+            self.associations.append((time.time(), floating_ip_id, port_id))
+            self.condition.notify_all()
+            return dict(floating_ip)
+
+    def wait_for_association(self, floating_ip_id, port_id, timeout):
+        """
+        Wait for the floating IP address to be associated with the given port.
+        :param floating_ip_id: The id of the floating IP address.
+        :param port_id: The id of the port.
+        :param timeout: The maximum number of seconds to wait.
+        :return: The time at which the association was made, or None if the timeout was reached.
+        """
+        deadline = time.time() + timeout
+        with self.condition:
+            while True:
+                for (associated_at, associated_floating_ip_id, associated_port_id) in reversed(self.associations):
+                    if associated_floating_ip_id == floating_ip_id:
+                        if associated_port_id == port_id:
+                            return associated_at
+                        break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+
+    def token(self):
+        """
+        Construct a keystone v3 token body whose catalog points the network service at this server.
+        :return: The token dict.
+        """
+        now = datetime.datetime.utcnow()
+        return dict(
+            token=dict(
+                methods=['password'],
+                issued_at=now.strftime('%Y-%m-%dT%H:%M:%S.000000Z'),
+                expires_at=(now + datetime.timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M:%S.000000Z'),
+                user=dict(id='user', name='user', domain=dict(id='default', name='Default')),
+                project=dict(id='project', name='project', domain=dict(id='default', name='Default')),
+                roles=[dict(id='member', name='member')],
+                catalog=[
+                    dict(
+                        id='network',
+                        type='network',
+                        name='neutron',
+                        endpoints=[
+                            dict(id=interface, interface=interface, region='RegionOne', region_id='RegionOne',
+                                 url=self.url)
+                            for interface in ('public', 'internal', 'admin')
+                        ],
+                    )
+                ],
+            )
+        )
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            protocol_version = 'HTTP/1.1'  # keep connections alive, as a real endpoint would
+
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, status, body, headers=None):
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for (name, value) in (headers or dict()).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def read_json(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                return json.loads(self.rfile.read(length).decode('utf-8')) if length else dict()
+
+            def handle_request(self):
+                time.sleep(fake.latency)
+                with fake.lock:
+                    fake.requests.append((self.command, self.path))
+                path, _, query = self.path.partition('?')
+                match = FLOATING_IP_PATTERN.match(path)
+
+                if self.command == 'POST' and path.rstrip('/') == '/v3/auth/tokens':
+                    self.read_json()
+                    self.send_json(201, fake.token(), headers={'X-Subject-Token': uuid.uuid4().hex})
+                elif self.command == 'GET' and path in ('/', '/v2.0', '/v2.0/'):
+                    self.send_json(200, dict(versions=[
+                        dict(id='v2.0', status='CURRENT', links=[dict(rel='self', href='%s/v2.0/' % fake.url)])
+                    ]))
+                elif self.command == 'GET' and path.rstrip('/') in ('/v2.0/floatingips', '/v2.0/floatingips.json'):
+                    wanted_ids = re.findall('(?:^|&)id=([^&]+)', query)
+                    with fake.lock:
+                        floating_ips = [
+                            dict(x) for x in fake.floating_ips.values() if not wanted_ids or x['id'] in wanted_ids
+                        ]
+                    self.send_json(200, dict(floatingips=floating_ips))
+                elif match and match.group(1) in fake.floating_ips and self.command == 'GET':
+                    with fake.lock:
+                        floating_ip = dict(fake.floating_ips[match.group(1)])
+                    self.send_json(200, dict(floatingip=floating_ip))
+                elif match and match.group(1) in fake.floating_ips and self.command == 'PUT':
+                    port_id = self.read_json().get('floatingip', dict()).get('port_id')
+                    self.send_json(200, dict(floatingip=fake.associate(match.group(1), port_id)))
+                else:
+                    self.send_json(404, dict(NeutronError=dict(message='%s %s not found' % (self.command, path))))
+
+            do_GET = do_POST = do_PUT = handle_request
+
+        return Handler
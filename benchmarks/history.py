@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+history.py
+
+Description: Keep a history of orchestration benchmark results, and flag regressions against a baseline.
+
+python -m benchmarks.history [--file <path>] record [--repeats <n>] [--sizes ...] [--latency <seconds>]
+python -m benchmarks.history [--file <path>] compare <baseline commit> [<candidate commit>]
+
+record runs the orchestration benchmark (see orchestration.py) and appends one JSON line per repeat, size and phase
+to the results file, keyed by the current git commit. The file is only ever appended to.
+
+compare compares the results recorded for two commits (the candidate defaults to the current commit). A metric is
+flagged as a regression when the candidate is worse by more than the threshold, and a permutation test says the
+difference is unlikely to be noise. It exits with status 1 if there are regressions, so it can be used as a gate.
+Results recorded with uncommitted changes are keyed by '<commit>-dirty', and are only compared when asked for by that
+name.
+"""
+
+import argparse
+import collections
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+
+import build
+from benchmarks import orchestration
+
+DEFAULT_RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results.jsonl')
+METRICS = ['seconds', 'api_calls', 'items_listed', 'bytes_listed', 'remote_calls', 'remote_bytes', 'peak_memory']
+DEFAULT_REPEATS = 5
+DEFAULT_THRESHOLD = 0.05  # relative change
+DEFAULT_SIGNIFICANCE = 0.05  # p value
+PERMUTATIONS = 10000
+
+
+def current_commit():
+    """
+    Return the current git commit, with a '-dirty' suffix if there are uncommitted changes.
+    :return: String containing the commit
+    """
+    commit = subprocess.check_output(['git', 'rev-parse', 'HEAD']).decode('utf-8').strip()
+    if subprocess.call(['git', 'diff', '--quiet', 'HEAD']):
+        commit += '-dirty'
+    return commit
+
+
+def resolve_commit(commit):
+    """
+    Resolve a commit, or a prefix of one, to the full commit, keeping any '-dirty' suffix.
+    :param commit: The commit e.g. 'e4892a9' or 'e4892a9-dirty'.
+    :return: String containing the full commit, or the commit as given if git cannot resolve it.
+    """
+    sha, dirty, _ = commit.partition('-dirty')
+    try:
+        sha = subprocess.check_output(
+            ['git', 'rev-parse', '--verify', '--quiet', sha + '^{commit}'], stderr=subprocess.DEVNULL
+        ).decode('utf-8').strip()
+    except (subprocess.CalledProcessError, OSError):
+        pass
+    return sha + dirty
+
+
+def record(path, repeats, sizes, latency):
+    """
+    Run the orchestration benchmark, appending the results to the results file.
+    :param path: The path of the results file.
+    :param repeats: The number of times to run the benchmark.
+    :param sizes: The numbers of app servers.
+    :param latency: The latency of each API call in seconds.
+    :return: The commit the results were recorded against.
+    """
+    commit = current_commit()
+    for repeat in range(repeats):
+        for num_servers in sizes:
+            results = orchestration.benchmark_size(num_servers, latency)
+            with open(path, 'a') as results_file:
+                for result in results:
+                    result.update(
+                        benchmark='orchestration', commit=commit, repeat=repeat, latency=latency, recorded=time.time()
+                    )
+                    results_file.write(json.dumps(result, sort_keys=True) + '\n')
+    return commit
+
+
+def load(path, commit):
+    """
+    Load the results recorded for a commit.
+    Only results recorded against exactly that commit are loaded, so '<commit>-dirty' results are not mixed in with
+    those of <commit>. Metrics missing from older results are left out.
+    :param path: The path of the results file.
+    :param commit: The full commit, as returned by resolve_commit.
+    :return: A dict of (benchmark, num_servers, phase, latency) to a dict of metric to list of samples.
+    """
+    samples = collections.defaultdict(lambda: collections.defaultdict(list))
+    with open(path) as results_file:
+        for line in results_file:
+            result = json.loads(line)
+            if result['commit'] == commit:
+                key = (result['benchmark'], result['num_servers'], result['phase'], result['latency'])
+                for metric in METRICS:
+                    if metric in result:
+                        samples[key][metric].append(result[metric])
+    return samples
+
+
+def permutation_test(baseline, candidate, permutations=PERMUTATIONS, seed=0):
+    """
+    Return the (one sided) probability of the candidate mean exceeding the baseline mean by as much as it does, if
+    both sets of samples came from the same distribution.
+    :param baseline: A list of samples.
+    :param candidate: A list of samples.
+    :param permutations: The number of random permutations to try.
+    :param seed: The random seed, so that comparisons are repeatable.
+    :return: The p value.
+    """
+    def mean(samples):
+        return sum(samples) / float(len(samples))
+
+    observed = mean(candidate) - mean(baseline)
+    pooled = list(baseline) + list(candidate)
+    shuffler = random.Random(seed)
+    at_least_as_extreme = 0
+    for _ in range(permutations):
+        shuffler.shuffle(pooled)
+        if mean(pooled[len(baseline):]) - mean(pooled[:len(baseline)]) >= observed:
+            at_least_as_extreme += 1
+    return (at_least_as_extreme + 1) / float(permutations + 1)
+
+
+def compare(baseline_samples, candidate_samples, threshold=DEFAULT_THRESHOLD, significance=DEFAULT_SIGNIFICANCE):
+    """
+    Compare the samples of two commits.
+    Metrics which do not vary between repeats (e.g. API calls) are regressions whenever the candidate exceeds the
+    baseline by more than the threshold; the others must also pass the permutation test. The change from a zero
+    baseline is infinite (unless the candidate is zero too), rather than none.
+    :param baseline_samples: The baseline samples, as returned by load.
+    :param candidate_samples: The candidate samples, as returned by load.
+    :param threshold: The relative change below which differences are ignored.
+    :param significance: The p value below which differences are considered significant.
+    :return: A list of comparison dicts, each with a regression flag.
+    """
+    comparisons = []
+    for key in sorted(set(baseline_samples) & set(candidate_samples)):
+        for metric in METRICS:
+            baseline = baseline_samples[key].get(metric)
+            candidate = candidate_samples[key].get(metric)
+            if not baseline or not candidate:
+                continue
+            baseline_mean = sum(baseline) / float(len(baseline))
+            candidate_mean = sum(candidate) / float(len(candidate))
+            if baseline_mean:
+                change = (candidate_mean - baseline_mean) / baseline_mean
+            else:
+                change = float('inf') if candidate_mean else 0.0
+            if len(set(baseline)) == 1 and len(set(candidate)) == 1:
+                p_value = 0.0 if candidate_mean != baseline_mean else 1.0
+            else:
+                p_value = permutation_test(baseline, candidate)
+            comparisons.append(
+                dict(
+                    benchmark=key[0], num_servers=key[1], phase=key[2], latency=key[3], metric=metric,
+                    baseline=baseline_mean, candidate=candidate_mean, change=change, p_value=p_value,
+                    regression=change > threshold and p_value < significance,
+                )
+            )
+    return comparisons
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--file", default=DEFAULT_RESULTS_FILE, help="the results file")
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    record_parser = subparsers.add_parser('record', help="run the benchmark and record the results")
+    record_parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS, help="the number of repeats")
+    record_parser.add_argument("--sizes", type=int, nargs='+', default=orchestration.DEFAULT_SIZES,
+                               help="the numbers of app servers")
+    record_parser.add_argument("--latency", type=float, default=orchestration.DEFAULT_LATENCY_SECONDS,
+                               help="the latency of each API call (s)")
+
+    compare_parser = subparsers.add_parser('compare', help="flag regressions of a candidate against a baseline")
+    compare_parser.add_argument("baseline", help="the baseline commit")
+    compare_parser.add_argument("candidate", nargs='?', help="the candidate commit, defaults to the current commit")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                                help="the relative change below which differences are ignored e.g. 0.05")
+    compare_parser.add_argument("--significance", type=float, default=DEFAULT_SIGNIFICANCE,
+                                help="the p value below which differences are significant e.g. 0.05")
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        logging.getLogger(build.__name__).setLevel(logging.WARNING)
+        commit = record(args.file, args.repeats, args.sizes, args.latency)
+        print('results for %s appended to %s' % (commit, args.file))
+        return
+
+    baseline_samples = load(args.file, resolve_commit(args.baseline))
+    candidate_samples = load(args.file, resolve_commit(args.candidate) if args.candidate else current_commit())
+    if not baseline_samples or not candidate_samples:
+        print('no results recorded for %s' % (args.baseline if not baseline_samples else args.candidate))
+        sys.exit(2)
+
+    comparisons = compare(baseline_samples, candidate_samples, args.threshold, args.significance)
+    print('%8s %-8s %-13s %14s %14s %8s %8s' % ('servers', 'phase', 'metric', 'baseline', 'candidate', 'change', 'p'))
+    for comparison in comparisons:
+        print('%(num_servers)8d %(phase)-8s %(metric)-13s %(baseline)14.2f %(candidate)14.2f %(change)+7.1f%% '
+              '%(p_value)8.4f' % dict(comparison, change=comparison['change'] * 100) +
+              ('  REGRESSION' if comparison['regression'] else ''))
+    regressions = [x for x in comparisons if x['regression']]
+    print('%s regression(s)' % len(regressions))
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+orchestration.py
+
+Description: Benchmark how the cost of build.py orchestration scales with the number of app servers.
+
+python -m benchmarks.orchestration [--sizes 1 10 50 200 500] [--latency <seconds>] [--remote-latency <seconds>]
+                                   [--json]
+
+For each size, InfrastructureManager.build() and then destroy() are run against an in-memory fake cloud (see
+openstack_infrastructure/fake_cloud.py) in which every API call is delayed by the given latency. The wall time,
+number of API calls, number and (approximate) size of the items returned by listing calls and peak (Python) memory
+are recorded per phase.
+
+The items listed are the tell-tale of the O(N^2) paths e.g. get_public_addresses lists every floating IP address
+in the project once per server.
+
+The remote side of the build (fab_utils) runs against a remote.LocalBackend, which writes the files put into a
+sandbox directory per host and records (but does not run) the commands, delaying each round trip by the given remote
+latency. The remote round trips and bytes sent are recorded per phase.
+
+"""
+
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+import tracemalloc
+
+import build
+from build_utils import fab_utils, remote
+from openstack_infrastructure import facade as osf, fake_cloud, middleware
+
+DEFAULT_SIZES = [1, 10, 50, 200, 500]
+DEFAULT_LATENCY_SECONDS = 0.002
+DEFAULT_REMOTE_LATENCY_SECONDS = 0.0
+SUBNET_CIDR = '10.0.0.0/16'  # a /24 would limit the environment to ~250 servers
+PHASES = ['build', 'destroy']
+OPENSTACK_PARAMS = dict(  # normally taken from the environment, and only used in generated configuration
+    OS_AUTH_URL='http://fake-cloud/v3',
+    OS_REGION_NAME='RegionOne',
+    OS_USERNAME='bench',
+    OS_PASSWORD='bench',
+    OS_PROJECT_ID='bench',
+    OS_USER_DOMAIN_NAME='default',
+    OS_PROJECT_DOMAIN_NAME='default',
+)
+REMOTE_RESPONSES = [  # (command pattern, output, return code) - see remote.LocalBackend
+    (r'ss -tn state established', '\n'.join('%s: 0' % x for x in build.LOAD_BALANCER_SERVER_NAMES), 0),
+]
+
+
+def measure(func):
+    """
+    Measure the wall time and peak memory of a call.
+    :param func: The function to call.
+    :return: The wall time in seconds, and the peak memory allocated during the call in bytes.
+    """
+    tracemalloc.start()
+    started = time.time()
+    try:
+        func()
+        return time.time() - started, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_size(num_servers, latency, remote_latency=DEFAULT_REMOTE_LATENCY_SECONDS):
+    """
+    Build and then destroy an environment with the given number of app servers.
+    :param num_servers: The number of app servers.
+    :param latency: The latency of each API call in seconds.
+    :param remote_latency: The latency of each remote round trip in seconds.
+    :return: A list of result dicts, one per phase.
+    """
+    conn = fake_cloud.FakeConnection(latency=latency)
+    api_profiler = middleware.ApiProfiler(conn)
+    os_facade = osf.OpenStackFacade(conn=api_profiler)
+    for (key, value) in OPENSTACK_PARAMS.items():
+        os.environ.setdefault(key, value)  # fab_utils places clouds.yaml from the environment
+
+    results = []
+    previous_backend = fab_utils.get_backend()
+    with tempfile.TemporaryDirectory(prefix='benchmark-remote-') as sandbox_root:
+        params = dict(
+            app='bench', environment='bench', num_servers=num_servers, server_size='m1.small',
+            subnet_cidr=SUBNET_CIDR, checkpoint_directory=os.path.join(sandbox_root, 'checkpoints'), **OPENSTACK_PARAMS
+        )
+        manager = build.InfrastructureManager(params, os_facade)
+        backend = remote.LocalBackend(sandbox_root, latency=remote_latency, responses=REMOTE_RESPONSES)
+        fab_utils.set_backend(backend)
+        try:
+            for phase in PHASES:
+                calls_before = sum(conn.calls.values())
+                items_before = sum(x['items'] for x in api_profiler.summary())
+                bytes_before = sum(x['bytes'] for x in api_profiler.summary())
+                round_trips_before = sum(backend.round_trips.values())
+                bytes_sent_before = sum(backend.bytes_sent.values())
+                seconds, peak_memory = measure(getattr(manager, phase))
+                results.append(
+                    dict(
+                        num_servers=num_servers,
+                        phase=phase,
+                        seconds=seconds,
+                        api_calls=sum(conn.calls.values()) - calls_before,
+                        items_listed=sum(x['items'] for x in api_profiler.summary()) - items_before,
+                        bytes_listed=sum(x['bytes'] for x in api_profiler.summary()) - bytes_before,
+                        remote_calls=sum(backend.round_trips.values()) - round_trips_before,
+                        remote_bytes=sum(backend.bytes_sent.values()) - bytes_sent_before,
+                        peak_memory=peak_memory,
+                    )
+                )
+        finally:
+            fab_utils.set_backend(previous_backend)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs='+', default=DEFAULT_SIZES, help="the numbers of app servers")
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY_SECONDS,
+                        help="the latency of each API call (s)")
+    parser.add_argument("--remote-latency", type=float, default=DEFAULT_REMOTE_LATENCY_SECONDS,
+                        help="the latency of each remote round trip (s)")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    logging.getLogger(build.__name__).setLevel(logging.WARNING)
+    results = []
+    for num_servers in args.sizes:
+        results.extend(benchmark_size(num_servers, args.latency, args.remote_latency))
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+        return
+
+    print('%8s %-8s %9s %9s %12s %8s %12s %12s' % (
+        'servers', 'phase', 'seconds', 'api calls', 'items listed', 'remote', 'remote bytes', 'peak memory'))
+    for result in results:
+        print('%(num_servers)8d %(phase)-8s %(seconds)9.2f %(api_calls)9d %(items_listed)12d %(remote_calls)8d '
+              '%(remote_bytes)12d %(peak_memory)12d' % result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+stats.py
+
+Description: Summary statistics for benchmark samples.
+"""
+
+import math
+
+
+def percentile(samples, pct):
+    """
+    Return the given percentile of the samples, using the nearest-rank method.
+    :param samples: A list of numbers.
+    :param pct: The percentile e.g. 95
+    :return: The percentile value, or None if there are no samples.
+    """
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(int(math.ceil(pct / 100.0 * len(ordered))), 1)
+    return ordered[rank - 1]
+
+
+def summarise(samples):
+    """
+    Summarise the samples.
+    :param samples: A list of numbers.
+    :return: A dict containing the count, min, mean, p50, p95, p99 and max of the samples.
+    """
+    return dict(
+        count=len(samples),
+        min=min(samples) if samples else None,
+        mean=sum(samples) / len(samples) if samples else None,
+        p50=percentile(samples, 50),
+        p95=percentile(samples, 95),
+        p99=percentile(samples, 99),
+        max=max(samples) if samples else None,
+    )
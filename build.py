@@ -4,19 +4,22 @@ build.py
 
 Description: Build the simple blog application.
 
-build.py <app> <environment> <num_servers> <server_size>
+build.py <app> <environment> <num_servers> <server_size> [--destroy | --scale | --reload-backends] [--plan]
+         [--trace <file>]
 
 Written by:  maharg101 on 25th February 2018
 """
 
 import argparse
+import concurrent.futures
 import logging
 import os
+import re
 import sys
 
-from build_utils import fab_utils, salt_utils, utils
+from build_utils import checkpoint, executor, fab_utils, salt_utils, tracing, utils
 from collections import OrderedDict
-from openstack_infrastructure import facade as osf
+from openstack_infrastructure import facade as osf, inventory, middleware, planner
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
 logger = logging.getLogger(__name__)
@@ -24,6 +27,28 @@ logger = logging.getLogger(__name__)
 IMAGE_NAME = 'Ubuntu 16.04 LTS'
 SALT_SERVER_PREFIX = 'salt'
 APP_SERVER_PREFIX = 'app'
+LOAD_BALANCER_SERVER_NAMES = ['vrrp-primary', 'vrrp-secondary']
+DRAIN_TIMEOUT_SECONDS = 120
+DEFAULT_SUBNET_CIDR = '10.0.0.0/24'
+SERVER_FLAVOR_NAME = 'm1.small'  # see OpenStackFacade.find_or_create_server and the salt-cloud profile in fab_utils
+SECURITY_GROUP_NAMES = ['vrrp', 'http']
+STANDBY_SERVER_PREFIX = 'standby-%s' % re.sub('[^a-z0-9]+', '-', SERVER_FLAVOR_NAME.lower())  # e.g. standby-m1-small
+STANDBY_POOL_SIZE = 0
+CHECKPOINT_DIRECTORY = '.checkpoints'
+NETWORK_ROLE = 'network'  # the role tags of the resources created - see OpenStackFacade.tag_context
+SALT_ROLE = 'salt'
+APP_ROLE = 'app'
+STANDBY_ROLE = 'standby'
+LOAD_BALANCER_ROLE = 'load-balancer'
+PLAN_RESOURCE_TYPES = OrderedDict(
+    (x, y) for (x, y) in inventory.RESOURCE_TYPES.items()
+    if x in ('router', 'network', 'subnet', 'port', 'floating_ip', 'security_group', 'server', 'keypair')
+)
+SALT_CLOUD_KEY_PAIR_NAME = 'salt-cloud'
+SSH_POOL_SIZE = 10
+SSH_RETRIES = 2
+BOOTSTRAP_TIMEOUT_SECONDS = 900
+READINESS_TIMEOUT_SECONDS = 300
 
 
 class InfrastructureManager(object):
@@ -36,62 +61,324 @@ class InfrastructureManager(object):
         """
         self.params = params
         self.os_facade = os_facade
+        self.standby_refill = None
 
-    def prepare(self):
+    def prepare(self, preflight=False):
         """
         Prepare for the build / destroy steps.
+        The resources created from now on are tagged with the app and environment.
+        :param preflight: Check that the quotas allow the servers to be created - see check_quotas.
         :return:
         """
         utils.populate_params_from_constructor_args(self.params)
         utils.populate_openstack_params_from_environ(self.params, os.environ)
         self.params['image_name'] = IMAGE_NAME
+        self.os_facade.set_tag_context(app=self.params['app'], environment=self.params['environment'])
         self.validate_image_and_flavor()
         self.params['key_name'] = self.os_facade.get_name_of_first_key_pair()
+        if preflight:
+            self.check_quotas()
 
-    def build(self):
+    def check_quotas(self):
+        """
+        Check that the compute and network quotas allow the servers of the environment which do not yet exist to be
+        created, exiting with the precise shortfall before any resource is created if not.
+        :return: None
+        """
+        demand = self.estimate_demand()
+        usage = self.os_facade.get_quota_usage(self.params['OS_PROJECT_ID'])
+        shortfall = utils.calculate_quota_shortfall(demand, usage)
+        if shortfall:
+            for x in shortfall:
+                logger.fatal('Quota for %(resource)s would be exceeded by %(shortfall)s: %(demand)s required, '
+                             '%(available)s available (%(used)s of %(limit)s used)' % x)
+            sys.exit(1)
+        logger.info('Quotas allow the build: %s' % ', '.join('%s %s' % x for x in sorted(demand.items())))
+
+    def estimate_demand(self):
+        """
+        Estimate the resources which the build of the environment will consume, given what already exists.
+        Each new server takes one instance, the vCPUs and RAM of its flavor, a port and a floating IP address. The
+        load balancers share one more floating IP address, and a new network takes one more port for the router.
+        Floating IP addresses in the pool are already allocated, so they are claimed rather than counted. New app
+        servers claimed from the standby pool need nothing more, but the standby servers refilling the pool do.
+        :return: A dict of resource to the amount required.
+        """
+        server_names = [utils.construct_server_name(self.params, SALT_SERVER_PREFIX)]
+        server_names.extend(
+            utils.construct_server_name(self.params, '%s-%s' % (APP_SERVER_PREFIX, server_number))
+            for server_number in range(self.params['num_servers'])
+        )
+        server_names.extend(LOAD_BALANCER_SERVER_NAMES)
+        server_name_pattern = re.compile('^(%s)$' % '|'.join(map(re.escape, server_names)))
+        existing_server_names = {x.name for x in self.os_facade.find_servers(server_name_pattern, self.os_facade.tags)}
+        new_server_names = [x for x in server_names if x not in existing_server_names]
+        app_server_name_pattern = utils.construct_server_name_pattern(self.params, APP_SERVER_PREFIX)
+        new_app_server_names = [x for x in new_server_names if app_server_name_pattern.match(x)]
+        standby_servers = self.find_standby_servers()
+        claimed = min(len(standby_servers), len(new_app_server_names))
+        pool_size = self.params.get('standby_pool_size') or STANDBY_POOL_SIZE
+        new_instances = len(new_server_names) - claimed + max(pool_size - len(standby_servers) + claimed, 0)
+        flavor = self.os_facade.get_flavor(SERVER_FLAVOR_NAME)
+        new_load_balancers = [x for x in new_server_names if x in LOAD_BALANCER_SERVER_NAMES]
+        new_network = not self.os_facade.find_network(self.params['network_name'])
+        pooled_floating_ips = self.os_facade.get_pooled_floating_ips(self.os_facade.find_network('public'))
+        return dict(
+            instances=new_instances,
+            cores=new_instances * flavor.vcpus,
+            ram=new_instances * flavor.ram,
+            floating_ips=max(new_instances + (1 if new_load_balancers else 0) - len(pooled_floating_ips), 0),
+            ports=new_instances + (1 if new_network else 0),
+            security_groups=len([x for x in SECURITY_GROUP_NAMES if not self.os_facade.find_security_group(x)]),
+        )
+
+    def build(self, resume=False):
         """
         Perform the build steps in order.
+        Each phase is recorded in a checkpoint as it completes, so that an interrupted build can be resumed from the
+        first incomplete phase. The checkpoint is removed once the build completes.
 
+        :param resume: Skip the phases completed by an interrupted build, if set to True - see checkpoint.Checkpoint
         :return: OrderedDict containing 'server_name': [public_ip_addresses], String containing HA address
         """
-        self.prepare()
-        router = self.os_facade.find_or_create_router(self.params['router_name'])
-        network = self.os_facade.find_or_create_network(self.params['network_name'])
-        subnet = self.os_facade.find_or_create_subnet(self.params['subnet_name'], network=network)
-        port = self.os_facade.find_or_create_port(network, subnet)
-        self.os_facade.add_interface_to_router(router, subnet, port)
+        self.prepare(preflight=True)
+        self.check_load_balancers()
+        build_checkpoint = self.open_checkpoint(resume)
+        network, subnet, port = build_checkpoint.run(
+            'network_components',
+            self.find_or_create_network_components,
+            save=lambda components: [x.id for x in components],
+            restore=lambda ids: self.os_facade.get_network_components(*ids),
+        )
         servers = OrderedDict()
-        salt_master_address = self.create_salt_server(network, port, subnet, servers)
-        app_server_names = self.create_app_servers(network, port, subnet, servers, salt_master_address)
-        fab_utils.accept_salt_minion_connections(salt_master_address, app_server_names)
-        self.build_load_balancers(salt_master_address)
-        ha_address = self.configure_keepalived(network, port, subnet, salt_master_address)
-        fab_utils.place_haproxy_pillar_on_saltmaster(salt_master_address, servers, APP_SERVER_PREFIX)
-        fab_utils.apply_state(salt_master_address)
+        salt_master_address = build_checkpoint.run(
+            'salt_master',
+            lambda: self.create_salt_server(network, port, subnet, servers),
+            save=lambda address: dict(address=address, servers=servers),
+            restore=lambda output: output['address'] if self.restore_servers(output['servers'], servers) else None,
+        )
+        app_server_names = build_checkpoint.run(
+            'app_servers',
+            lambda: self.create_app_servers(network, port, subnet, servers, salt_master_address),
+            save=lambda server_names: dict(server_names=server_names, servers=servers),
+            restore=lambda output: (
+                output['server_names'] if self.restore_servers(output['servers'], servers) else None
+            ),
+        )
+        self.start_standby_refill(network, port, subnet, salt_master_address)
+        build_checkpoint.run(
+            'accept_minions', lambda: fab_utils.accept_salt_minion_connections(salt_master_address, app_server_names)
+        )
+        build_checkpoint.run('load_balancers', lambda: self.build_load_balancers(salt_master_address))
+        ha_address = build_checkpoint.run(
+            'keepalived', lambda: self.configure_keepalived(network, port, subnet, salt_master_address)
+        )
+        build_checkpoint.run(
+            'haproxy_pillar',
+            lambda: fab_utils.place_haproxy_pillar_on_saltmaster(salt_master_address, servers, APP_SERVER_PREFIX)
+        )
+        build_checkpoint.run('apply_state', lambda: fab_utils.apply_state(salt_master_address))
+        build_checkpoint.run(
+            'failover_agent',
+            lambda: fab_utils.install_failover_agent(salt_master_address, LOAD_BALANCER_SERVER_NAMES)
+        )
+        self.wait_for_standby_refill()
+        build_checkpoint.clear()
         return servers, ha_address
 
-    def create_app_servers(self, network, port, subnet, servers, salt_master_address):
+    def open_checkpoint(self, resume=False):
+        """
+        Open the checkpoint of the environment's build, in checkpoint_directory (CHECKPOINT_DIRECTORY by default)
+        unless checkpoint_file is set.
+        :param resume: Skip the phases completed by an interrupted build, if set to True.
+        :return: The checkpoint.Checkpoint
+        """
+        path = self.params.get('checkpoint_file') or os.path.join(
+            self.params.get('checkpoint_directory') or CHECKPOINT_DIRECTORY, '%s.json' % self.params['server_base_name']
+        )
+        key = {x: self.params[x] for x in ('app', 'environment', 'num_servers', 'server_size')}
+        return checkpoint.Checkpoint(path, key, resume=resume)
+
+    def restore_servers(self, recorded_servers, servers):
+        """
+        Check that the servers recorded by a checkpoint still exist, and if so add them to servers.
+        :param recorded_servers: A dict of server name to public IP addresses, as recorded by the checkpoint.
+        :param servers: A dict to add the server names and IP addresses to
+        :return: True if all of the servers still exist, otherwise False.
         """
-        Create the app servers
+        server_name_pattern = re.compile('^(%s)$' % '|'.join(map(re.escape, recorded_servers)))
+        existing_server_names = {x.name for x in self.os_facade.find_servers(server_name_pattern, self.os_facade.tags)}
+        if existing_server_names != set(recorded_servers):
+            return False
+        servers.update(recorded_servers)
+        return True
+
+    def find_or_create_network_components(self):
+        """
+        Find or create the router, network, subnet and port, and add the interface to the router.
+        :return: The network, subnet and port
+        """
+        with self.os_facade.tag_context(role=NETWORK_ROLE):
+            router = self.os_facade.find_or_create_router(self.params['router_name'])
+            network = self.os_facade.find_or_create_network(self.params['network_name'])
+            subnet = self.os_facade.find_or_create_subnet(
+                self.params['subnet_name'], network=network, cidr=self.params.get('subnet_cidr') or DEFAULT_SUBNET_CIDR
+            )
+            port = self.os_facade.find_or_create_port(network, subnet)
+        self.os_facade.add_interface_to_router(router, subnet, port)
+        return network, subnet, port
+
+    def create_app_servers(self, network, port, subnet, servers, salt_master_address, server_numbers=None):
+        """
+        Create the app servers, claiming idle standby servers (see refill_standby_pool) before creating any.
         :param network: The network to create the server on
         :param port: The port which the floating IP address will be attached to
         :param subnet: The subnet on which to create the floating IP address
         :param servers: A dict to add the server name and IP address(es) to
         :param salt_master_address: The address of the salt master
+        :param server_numbers: The numbers of the app servers to create. Defaults to range(num_servers).
         :return: A list of the server names
         """
+        if server_numbers is None:
+            server_numbers = range(self.params['num_servers'])
         server_names = []
-        for server_number in range(self.params['num_servers']):
-            server_name_prefix = '%s-%s' % (APP_SERVER_PREFIX, server_number)
-            public_ip_addresses = self.create_server(network, port, subnet, servers, server_name_prefix)
-            if public_ip_addresses:
-                fab_utils.bootstrap_salt_minion(public_ip_addresses[0].floating_ip_address, salt_master_address)
-            else:
-                logger.fatal('No public address found for salt minion for app server #%s' % server_number)
-                sys.exit(1)
-            server_names.append(utils.construct_server_name(self.params, server_name_prefix))
+        minions = OrderedDict()
+        with self.os_facade.tag_context(role=APP_ROLE):
+            claimed_standby_server_names = self.claim_standby_servers(server_numbers)
+            for server_number in server_numbers:
+                server_name_prefix = '%s-%s' % (APP_SERVER_PREFIX, server_number)
+                server_name = utils.construct_server_name(self.params, server_name_prefix)
+                public_ip_addresses = self.create_server(network, port, subnet, servers, server_name_prefix)
+                if public_ip_addresses:
+                    minions[public_ip_addresses[0].floating_ip_address] = server_name
+                else:
+                    logger.fatal('No public address found for salt minion for app server #%s' % server_number)
+                    sys.exit(1)
+                server_names.append(server_name)
+        failures = executor.failures(self.bootstrap_salt_minions(minions, salt_master_address))
+        if failures:
+            for failure in failures:
+                logger.fatal('Failed to bootstrap salt minion %s: %s' % (failure.host, failure.error))
+            sys.exit(1)
+        if claimed_standby_server_names:
+            fab_utils.delete_salt_minion_keys(salt_master_address, claimed_standby_server_names)
         return server_names
 
+    def bootstrap_salt_minions(self, minions, salt_master_address):
+        """
+        Bootstrap the salt minions concurrently, retrying each one independently.
+        Each minion is bootstrapped as soon as it is ready for SSH, regardless of the others.
+        :param minions: A dict of the public address of each salt minion to its minion id
+        :param salt_master_address: The address of the salt master
+        :return: An OrderedDict of minion address to executor.HostResult
+        """
+        def bootstrap_salt_minion(minion_address):
+            fab_utils.wait_until_ready(minion_address, READINESS_TIMEOUT_SECONDS)
+            return fab_utils.bootstrap_salt_minion(
+                minion_address, salt_master_address, minion_id=minions[minion_address]
+            )
+
+        results = executor.run_on_hosts(
+            bootstrap_salt_minion,
+            list(minions),
+            pool_size=self.params.get('ssh_pool_size') or SSH_POOL_SIZE,
+            retries=SSH_RETRIES,
+            timeout=BOOTSTRAP_TIMEOUT_SECONDS,
+        )
+        if results:
+            logger.info('Bootstrapped %s salt minion(s), the slowest in %.1fs' % (
+                len(results), max(x.seconds for x in results.values())))
+        return results
+
+    def find_standby_servers(self):
+        """
+        Find the idle standby servers of the environment.
+        :return: OrderedDict containing standby_number: server, ordered by standby number
+        """
+        return self.find_numbered_servers(STANDBY_SERVER_PREFIX, STANDBY_ROLE)
+
+    def claim_standby_servers(self, server_numbers):
+        """
+        Claim idle standby servers for those of the given app servers which do not exist yet, by renaming (and
+        retagging) them. A claimed server is then found (rather than created) by create_server, and bootstrapping it
+        only has to configure its minion id, as salt is already installed.
+        :param server_numbers: The numbers of the app servers to create.
+        :return: A list of the (former) names of the standby servers claimed.
+        """
+        existing_servers = self.find_app_servers()
+        missing_server_numbers = [x for x in server_numbers if x not in existing_servers]
+        claimed_standby_server_names = []
+        for server_number, standby_server in zip(missing_server_numbers, self.find_standby_servers().values()):
+            server_name = utils.construct_server_name(self.params, '%s-%s' % (APP_SERVER_PREFIX, server_number))
+            self.os_facade.rename_server(standby_server, server_name)
+            claimed_standby_server_names.append(standby_server.name)
+        if claimed_standby_server_names:
+            logger.info('claimed %s standby server(s): %s' % (
+                len(claimed_standby_server_names), ','.join(claimed_standby_server_names)))
+        return claimed_standby_server_names
+
+    def refill_standby_pool(self, network, port, subnet, salt_master_address):
+        """
+        Create and bootstrap standby servers until there are standby_pool_size of them.
+        Standby servers are booted and bootstrapped as salt minions, but their minion keys are not accepted and no
+        state is applied to them until they are claimed. A standby server which fails to bootstrap is left in the
+        pool, as it is bootstrapped again when claimed.
+        :param network: The network to create the servers on
+        :param port: The port which the floating IP addresses will be attached to
+        :param subnet: The subnet on which to create the floating IP addresses
+        :param salt_master_address: The address of the salt master
+        :return: A list of the names of the standby servers created
+        """
+        pool_size = self.params.get('standby_pool_size') or STANDBY_POOL_SIZE
+        standby_servers = self.find_standby_servers()
+        minions = OrderedDict()
+        with self.os_facade.tag_context(role=STANDBY_ROLE):
+            for standby_number in [x for x in range(pool_size) if x not in standby_servers]:
+                server_name_prefix = '%s-%s' % (STANDBY_SERVER_PREFIX, standby_number)
+                public_ip_addresses = self.create_server(network, port, subnet, OrderedDict(), server_name_prefix)
+                if public_ip_addresses:
+                    minions[public_ip_addresses[0].floating_ip_address] = utils.construct_server_name(
+                        self.params, server_name_prefix
+                    )
+        for failure in executor.failures(self.bootstrap_salt_minions(minions, salt_master_address)):
+            logger.warning('Failed to bootstrap standby server %s: %s' % (failure.host, failure.error))
+        return list(minions.values())
+
+    def start_standby_refill(self, network, port, subnet, salt_master_address):
+        """
+        Start refilling the standby pool in the background, if standby_pool_size is set - see refill_standby_pool.
+        :param network: The network to create the servers on
+        :param port: The port which the floating IP addresses will be attached to
+        :param subnet: The subnet on which to create the floating IP addresses
+        :param salt_master_address: The address of the salt master
+        :return: None
+        """
+        if not (self.params.get('standby_pool_size') or STANDBY_POOL_SIZE):
+            return
+        refill_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.standby_refill = refill_executor.submit(
+            self.refill_standby_pool, network, port, subnet, salt_master_address
+        )
+        refill_executor.shutdown(wait=False)
+
+    def wait_for_standby_refill(self):
+        """
+        Wait for the background refill of the standby pool, if any, to finish.
+        A failure to refill the pool is only a warning, as the environment itself is complete.
+        :return: None
+        """
+        if self.standby_refill is None:
+            return
+        try:
+            standby_server_names = self.standby_refill.result()
+        except (Exception, SystemExit) as e:
+            logger.warning('Failed to refill the standby pool: %r' % e)
+        else:
+            if standby_server_names:
+                logger.info('Refilled the standby pool with %s' % ','.join(standby_server_names))
+        finally:
+            self.standby_refill = None
+
     def create_salt_server(self, network, port, subnet, servers):
         """
         Create the salt master server
@@ -101,9 +388,11 @@ class InfrastructureManager(object):
         :param servers: A dict to add the server name and IP address(es) to
         :return: The public IP address of the salt server
         """
-        public_ip_addresses = self.create_server(network, port, subnet, servers, SALT_SERVER_PREFIX)
+        with self.os_facade.tag_context(role=SALT_ROLE):
+            public_ip_addresses = self.create_server(network, port, subnet, servers, SALT_SERVER_PREFIX)
         if public_ip_addresses:
             salt_master_address = public_ip_addresses[0].floating_ip_address
+            fab_utils.wait_until_ready(salt_master_address, READINESS_TIMEOUT_SECONDS)
             fab_utils.bootstrap_salt_master(salt_master_address)
             fab_utils.configure_salt_cloud(salt_master_address, salt_utils.generate_openstack_conf(self.params))
             self.configure_salt_cloud_key_pair(salt_master_address)
@@ -112,6 +401,22 @@ class InfrastructureManager(object):
             logger.fatal('No public address found for salt server')
             sys.exit(1)
 
+    def get_salt_master_address(self):
+        """
+        Get the public address of the existing salt master server, without creating or bootstrapping it.
+        :return: The public IP address of the salt server
+        """
+        server_name = utils.construct_server_name(self.params, SALT_SERVER_PREFIX)
+        server = self.os_facade.find_server(server_name)
+        public_ip_addresses = None
+        if server:
+            public_ip_addresses = self.os_facade.get_public_addresses(server, self.params['network_name'])
+        if public_ip_addresses:
+            return public_ip_addresses[0].floating_ip_address
+        else:
+            logger.fatal('No public address found for salt server %s - has the environment been built ?' % server_name)
+            sys.exit(1)
+
     def configure_salt_cloud_key_pair(self, salt_master_address):
         """
         Configure the salt cloud key pair.
@@ -122,7 +427,7 @@ class InfrastructureManager(object):
         :param salt_master_address: The address of the salt master server
         :return: None
         """
-        key_pair = self.os_facade.get_or_create_key_pair('salt-cloud')
+        key_pair = self.os_facade.get_or_create_key_pair(SALT_CLOUD_KEY_PAIR_NAME)
         private_key = getattr(key_pair, 'private_key', None)
         if private_key:
             logger.info('Writing private key for salt-cloud')
@@ -146,33 +451,64 @@ class InfrastructureManager(object):
         servers[server_name] = [x.floating_ip_address for x in public_ip_addresses]
         return public_ip_addresses
 
+    def find_foreign_load_balancers(self):
+        """
+        Find the load balancers which are tagged for another environment of the project.
+        The names of the load balancers (and of their security groups and the salt-cloud key pair) are the same in
+        every environment, so only one environment of a project can have them.
+        :return: A list of the names of the foreign load balancers.
+        """
+        server_name_pattern = re.compile('^(%s)$' % '|'.join(map(re.escape, LOAD_BALANCER_SERVER_NAMES)))
+        return [
+            x.name for x in self.os_facade.find_servers(server_name_pattern)
+            if osf.parse_tags(x) and not osf.is_tagged(x, self.os_facade.tags)
+        ]
+
+    def check_load_balancers(self):
+        """
+        Check that the load balancers do not belong to another environment, exiting before anything is created if so.
+        :return: None
+        """
+        foreign_load_balancers = self.find_foreign_load_balancers()
+        if foreign_load_balancers:
+            logger.fatal('Load balancer(s) %s belong to another environment of the project - only one environment per '
+                         'project can be built' % ', '.join(foreign_load_balancers))
+            sys.exit(1)
+
     def build_load_balancers(self, salt_master_address):
         """
         Build the load balancing instances using salt-cloud.
         :param salt_master_address: The address of the salt master server
         :return:
         """
-        self.os_facade.get_or_create_vrrp_security_group()
-        self.os_facade.get_or_create_http_security_group()
+        with self.os_facade.tag_context(role=LOAD_BALANCER_ROLE):
+            self.os_facade.get_or_create_vrrp_security_group()
+            self.os_facade.get_or_create_http_security_group()
         fab_utils.build_load_balancer_hosts(salt_master_address)
 
     def configure_keepalived(self, network, port, subnet, salt_master_address):
         """
         Configure highly available keepalived as described at https://github.com/100PercentIT/OpenStack-HA-Keepalived
         The two instances have been created with floating IP addresses assigned, we'll reuse the primary one.
+        salt-cloud does not tag the instances, so they are tagged here, which claims them for the environment.
         :param network: The network to which the server is connected
         :param port: The port to which all of the floating IP addresses are attached to
         :param subnet: The subnet on which the floating IP addresses are created
         :param salt_master_address: The address of the salt master server
         :return: String containing the highly available IP address
         """
-        primary_server = self.os_facade.find_or_create_server('vrrp-primary', network, subnet, port)
-        primary_server_port = next(self.os_facade.get_ports_for_server(primary_server), None)  # just one
+        with self.os_facade.tag_context(role=LOAD_BALANCER_ROLE):
+            primary_server = self.os_facade.find_or_create_server('vrrp-primary', network, subnet, port)
+            primary_server_port = next(self.os_facade.get_ports_for_server(primary_server), None)  # just one
+
+            secondary_server = self.os_facade.find_or_create_server('vrrp-secondary', network, subnet, port)
+            secondary_server_port = next(self.os_facade.get_ports_for_server(secondary_server), None)  # just one
 
-        secondary_server = self.os_facade.find_or_create_server('vrrp-secondary', network, subnet, port)
-        secondary_server_port = next(self.os_facade.get_ports_for_server(secondary_server), None)  # just one
+            for server in (primary_server, secondary_server):
+                if not osf.parse_tags(server):
+                    self.os_facade.tag_server(server)
 
-        ha_floating_ip = self.get_ha_floating_ip_address(network, port, subnet, primary_server, secondary_server)
+            ha_floating_ip = self.get_ha_floating_ip_address(network, port, subnet, primary_server, secondary_server)
 
         fab_utils.place_ha_config_on_saltmaster(salt_master_address, primary_server_port, ha_floating_ip,
                                                 secondary_server_port)
@@ -209,6 +545,122 @@ class InfrastructureManager(object):
             ha_floating_ip = self.os_facade.assign_floating_ip(network, port, primary_server, subnet)
         return ha_floating_ip
 
+    def scale(self):
+        """
+        Scale the app servers of an existing environment to num_servers.
+        Only the difference between the existing and the requested app servers is created or deleted, the haproxy
+        backends are updated on the load balancers, and state is applied only to any new minions.
+        Surplus app servers are removed from the haproxy pillar and drained before they are deleted.
+
+        :return: OrderedDict containing 'server_name': [public_ip_addresses] for the remaining app servers
+        """
+        self.prepare(preflight=True)
+        salt_master_address = self.get_salt_master_address()
+        existing_servers = self.find_app_servers()
+        wanted_server_numbers = range(self.params['num_servers'])
+        new_server_numbers = [x for x in wanted_server_numbers if x not in existing_servers]
+        surplus_servers = [
+            server for (server_number, server) in existing_servers.items() if server_number not in wanted_server_numbers
+        ]
+        surplus_server_names = [server.name for server in surplus_servers]
+        logger.info('scaling to %s app server(s): %s to create, %s to delete' % (
+            self.params['num_servers'], len(new_server_numbers), len(surplus_server_names)))
+
+        servers = OrderedDict()
+        for server_number in wanted_server_numbers:
+            if server_number in existing_servers:
+                server = existing_servers[server_number]
+                public_ip_addresses = self.os_facade.get_public_addresses(server, self.params['network_name']) or []
+                servers[server.name] = [x.floating_ip_address for x in public_ip_addresses]
+
+        new_server_names = []
+        if new_server_numbers:
+            network, subnet, port = self.find_or_create_network_components()
+            new_server_names = self.create_app_servers(
+                network, port, subnet, servers, salt_master_address, server_numbers=new_server_numbers
+            )
+            self.start_standby_refill(network, port, subnet, salt_master_address)
+            fab_utils.accept_salt_minion_connections(salt_master_address, new_server_names)
+
+        if new_server_names:
+            fab_utils.apply_state_to_minions(salt_master_address, new_server_names)
+
+        if new_server_names or surplus_server_names:
+            fab_utils.update_haproxy_backends(
+                salt_master_address, servers, APP_SERVER_PREFIX, LOAD_BALANCER_SERVER_NAMES
+            )
+
+        if surplus_server_names:
+            self.drain_app_servers(salt_master_address, surplus_servers)
+            for server_name in surplus_server_names:
+                self.os_facade.delete_server(server_name, self.params['network_name'])
+            fab_utils.delete_salt_minion_keys(salt_master_address, surplus_server_names)
+
+        self.wait_for_standby_refill()
+        return servers
+
+    def reload_backends(self):
+        """
+        Rewrite the haproxy backend servers from the existing app servers, and reload haproxy on the load balancers.
+        :return: OrderedDict containing 'server_name': [public_ip_addresses] for the app servers
+        """
+        self.prepare()
+        salt_master_address = self.get_salt_master_address()
+        servers = OrderedDict()
+        for server in self.find_app_servers().values():
+            public_ip_addresses = self.os_facade.get_public_addresses(server, self.params['network_name']) or []
+            servers[server.name] = [x.floating_ip_address for x in public_ip_addresses]
+        fab_utils.update_haproxy_backends(salt_master_address, servers, APP_SERVER_PREFIX, LOAD_BALANCER_SERVER_NAMES)
+        return servers
+
+    def drain_app_servers(self, salt_master_address, app_servers):
+        """
+        Wait (for at most drain_timeout seconds) for the load balancers to finish with the given app servers.
+        The app servers must already have been removed from the haproxy pillar, and the load balancers reloaded.
+        :param salt_master_address: The address of the salt master
+        :param app_servers: A list of app servers to drain
+        :return: None
+        """
+        backend_addresses = [
+            public_ip_address.floating_ip_address
+            for server in app_servers
+            for public_ip_address in self.os_facade.get_public_addresses(server, self.params['network_name']) or []
+        ]
+        if not backend_addresses:
+            return
+        drain_timeout = self.params.get('drain_timeout', DRAIN_TIMEOUT_SECONDS)
+        logger.info('draining connections to %s' % ','.join(backend_addresses))
+        drained = fab_utils.wait_for_backend_drain(
+            salt_master_address, LOAD_BALANCER_SERVER_NAMES, backend_addresses, timeout=drain_timeout
+        )
+        if drained:
+            logger.info('connections to %s have drained' % ','.join(backend_addresses))
+        else:
+            logger.warning('connections to %s did not drain within %s seconds' % (
+                ','.join(backend_addresses), drain_timeout))
+
+    def find_app_servers(self):
+        """
+        Find the existing app servers for the environment, whatever num_servers is currently set to.
+        :return: OrderedDict containing server_number: server, ordered by server number
+        """
+        return self.find_numbered_servers(APP_SERVER_PREFIX, APP_ROLE)
+
+    def find_numbered_servers(self, server_name_prefix, role):
+        """
+        Find the existing numbered servers of the environment with the given prefix e.g. app-0-hello-world-dev
+        Servers tagged for another app, environment or role are excluded, even if their names match.
+        :param server_name_prefix: The prefix which precedes the server number
+        :param role: The role tag of the servers e.g. app
+        :return: OrderedDict containing server_number: server, ordered by server number
+        """
+        server_name_pattern = utils.construct_server_name_pattern(self.params, server_name_prefix)
+        numbered_servers = {
+            int(server_name_pattern.match(server.name).group(1)): server
+            for server in self.os_facade.find_servers(server_name_pattern, dict(self.os_facade.tags, role=role))
+        }
+        return OrderedDict(sorted(numbered_servers.items()))
+
     def destroy(self):
         """
         Perform the destroy steps in order.
@@ -216,11 +668,11 @@ class InfrastructureManager(object):
         """
         self.prepare()
         self.delete_load_balancers()
-        self.delete_app_servers()
-        self.delete_salt_server()
+        self.delete_environment_servers()
         self.os_facade.delete_subnet(self.params['subnet_name'], self.params['router_name'])
         self.os_facade.delete_network(self.params['network_name'])
         self.os_facade.delete_router(self.params['router_name'])
+        self.open_checkpoint().clear()
 
     def delete_load_balancers(self):
         """
@@ -229,30 +681,241 @@ class InfrastructureManager(object):
         use the OpenStack SDK methods as exposed by facade.py. It is not obvious how the floating IP addresses are
         freed up when using salt-cloud.
         See destroy_load_balancer_hosts method in fab_utils for details of how it could work with salt-cloud.
+        If the load balancers belong to another environment of the project, they are left alone, along with the
+        security groups and key pair which they use.
         :return:
         """
+        foreign_load_balancers = self.find_foreign_load_balancers()
+        if foreign_load_balancers:
+            logger.warning('Not deleting load balancer(s) %s, security groups or key pair %s, which belong to another '
+                           'environment' % (', '.join(foreign_load_balancers), SALT_CLOUD_KEY_PAIR_NAME))
+            return
         self.os_facade.delete_server('vrrp-primary', self.params['network_name'])
         self.os_facade.delete_server('vrrp-secondary', self.params['network_name'])
-        self.os_facade.delete_key_pair('salt-cloud')
+        self.os_facade.delete_key_pair(SALT_CLOUD_KEY_PAIR_NAME)
         self.os_facade.delete_security_group('http')
         self.os_facade.delete_security_group('vrrp')
 
-    def delete_app_servers(self):
+    def delete_environment_servers(self):
         """
-        Delete the app servers
+        Delete the salt master, app and standby servers of the environment, found in a single listing of the servers.
+        All existing app servers are deleted, including any beyond num_servers left behind by an earlier build.
         :return: None
         """
-        for server_number in range(self.params['num_servers']):
+        for server in self.find_environment_servers():
+            self.os_facade.delete_server(server.name, self.params['network_name'])
+
+    def find_environment_servers(self):
+        """
+        Find the salt master, app and standby servers of the environment in one pass - see OpenStackFacade.find_servers
+        :return: A list of servers
+        """
+        return self.os_facade.find_servers(self.construct_environment_server_pattern(), self.os_facade.tags)
+
+    def construct_environment_server_pattern(self):
+        """
+        Construct a compiled regular expression which matches the names of the salt master, app and standby servers.
+        :return: Compiled regular expression
+        """
+        return re.compile('|'.join([
+            '^%s$' % re.escape(utils.construct_server_name(self.params, SALT_SERVER_PREFIX)),
+            utils.construct_server_name_pattern(self.params, APP_SERVER_PREFIX).pattern,
+            utils.construct_server_name_pattern(self.params, STANDBY_SERVER_PREFIX).pattern,
+        ]))
+
+    def plan(self, action='build'):
+        """
+        Plan what build, scale or destroy would create, reuse or delete, from one inventory snapshot of the project,
+        without making any change.
+        :param action: One of build, scale or destroy.
+        :return: The planner.Plan
+        """
+        self.prepare()
+        resources = inventory.snapshot(self.os_facade.conn, PLAN_RESOURCE_TYPES, page_size=self.os_facade.page_size)
+        if resources.get(inventory.ERROR):
+            for error in resources[inventory.ERROR]:
+                logger.fatal('Failed to list %(resource_type)s resources: %(error)s' % error)
+            sys.exit(1)
+        snapshot = planner.Snapshot(resources, self.os_facade.tags)
+        plan = planner.Plan(
+            pooled_floating_ips=len(snapshot.pooled_floating_ips()),
+            ssh_pool_size=self.params.get('ssh_pool_size') or SSH_POOL_SIZE,
+        )
+        getattr(self, 'plan_%s' % action)(snapshot, plan)
+        return plan
+
+    def plan_build(self, snapshot, plan):
+        """
+        Plan a build, in the order of its phases - see build.
+        :param snapshot: The planner.Snapshot of the project.
+        :param plan: The planner.Plan to add the actions to.
+        :return: None
+        """
+        self.plan_network_components(snapshot, plan)
+        salt_server_name = utils.construct_server_name(self.params, SALT_SERVER_PREFIX)
+        self.plan_server(snapshot, plan, salt_server_name)
+        plan.add('configure', 'salt_master', salt_server_name)
+        plan.find_or_create('keypair', SALT_CLOUD_KEY_PAIR_NAME, snapshot.find('keypair', SALT_CLOUD_KEY_PAIR_NAME))
+        app_server_pattern = utils.construct_server_name_pattern(self.params, APP_SERVER_PREFIX)
+        app_servers = snapshot.find_numbered_servers(app_server_pattern)
+        self.plan_app_servers(snapshot, plan, range(self.params['num_servers']), app_servers)
+        for server_number, server in app_servers.items():
+            if server_number >= self.params['num_servers']:
+                plan.add('keep', 'server', server.name, 'beyond num_servers')
+        load_balancers = [snapshot.find('server', x, shared=True) for x in LOAD_BALANCER_SERVER_NAMES]
+        foreign_load_balancers = [x.name for x in load_balancers if x and not snapshot.owned(x)]
+        if foreign_load_balancers:
+            logger.fatal('Load balancer(s) %s belong to another environment of the project - only one environment per '
+                         'project can be built' % ', '.join(foreign_load_balancers))
+            sys.exit(1)
+        for security_group_name in SECURITY_GROUP_NAMES:
+            plan.find_or_create(
+                'security_group', security_group_name, snapshot.find('security_group', security_group_name, shared=True)
+            )
+        for server_name, server in zip(LOAD_BALANCER_SERVER_NAMES, load_balancers):
+            if plan.find_or_create('server', server_name, server, 'by salt-cloud'):
+                plan.add('create', 'floating_ip', server_name, 'by salt-cloud')
+        plan.add('configure', 'load_balancers', ','.join(LOAD_BALANCER_SERVER_NAMES))
+        if any(x and len(snapshot.find_floating_ips(x, self.params['network_name'])) > 1 for x in load_balancers):
+            plan.add('reuse', 'floating_ip', 'high availability address')
+        else:
+            plan.add_floating_ip('high availability address')
+        plan.add('configure', 'state', 'highstate')
+
+    def plan_scale(self, snapshot, plan):
+        """
+        Plan a scale of the app servers - see scale.
+        :param snapshot: The planner.Snapshot of the project.
+        :param plan: The planner.Plan to add the actions to.
+        :return: None
+        """
+        salt_server_name = utils.construct_server_name(self.params, SALT_SERVER_PREFIX)
+        if not snapshot.find('server', salt_server_name):
+            logger.fatal('No salt server %s found - has the environment been built ?' % salt_server_name)
+            sys.exit(1)
+        app_server_pattern = utils.construct_server_name_pattern(self.params, APP_SERVER_PREFIX)
+        app_servers = snapshot.find_numbered_servers(app_server_pattern)
+        new_server_numbers = [x for x in range(self.params['num_servers']) if x not in app_servers]
+        if new_server_numbers:
+            self.plan_network_components(snapshot, plan)
+            self.plan_app_servers(snapshot, plan, new_server_numbers, app_servers)
+            plan.add('configure', 'state', 'highstate of the new app servers')
+        surplus_servers = [y for (x, y) in app_servers.items() if x >= self.params['num_servers']]
+        for server in surplus_servers:
+            self.plan_server_deletion(snapshot, plan, server)
+
+    def plan_destroy(self, snapshot, plan):
+        """
+        Plan a destroy, in the order of its steps - see destroy.
+        :param snapshot: The planner.Snapshot of the project.
+        :param plan: The planner.Plan to add the actions to.
+        :return: None
+        """
+        load_balancers = [snapshot.find('server', x, shared=True) for x in LOAD_BALANCER_SERVER_NAMES]
+        deleted_servers = []
+        if any(x and not snapshot.owned(x) for x in load_balancers):
+            plan.add('keep', 'server', ','.join(LOAD_BALANCER_SERVER_NAMES), 'belong to another environment')
+        else:
+            deleted_servers.extend(x for x in load_balancers if x)
+            for server in deleted_servers:
+                self.plan_server_deletion(snapshot, plan, server)
+            if snapshot.find('keypair', SALT_CLOUD_KEY_PAIR_NAME, shared=True):
+                plan.add('delete', 'keypair', SALT_CLOUD_KEY_PAIR_NAME)
+            for security_group_name in reversed(SECURITY_GROUP_NAMES):
+                if snapshot.find('security_group', security_group_name, shared=True):
+                    plan.add('delete', 'security_group', security_group_name)
+        for server in snapshot.find_servers(self.construct_environment_server_pattern()):
+            self.plan_server_deletion(snapshot, plan, server)
+            deleted_servers.append(server)
+        router = snapshot.find('router', self.params['router_name'])
+        network = snapshot.find('network', self.params['network_name'])
+        subnet = snapshot.find('subnet', self.params['subnet_name'])
+        if subnet and router and network:
+            deleted_server_ids = {x.id for x in deleted_servers}  # their ports go with them
+            for port in snapshot.find_ports(network, subnet):
+                if getattr(port, 'device_id', None) not in deleted_server_ids:
+                    plan.add('delete', 'port', port.id)
+            plan.add('delete', 'subnet', subnet.name)
+        if network:
+            plan.add('delete', 'network', network.name)
+        if router:
+            plan.add('delete', 'router', router.name)
+
+    def plan_network_components(self, snapshot, plan):
+        """
+        Plan the find-or-create of the router, network, subnet and port - see find_or_create_network_components.
+        :param snapshot: The planner.Snapshot of the project.
+        :param plan: The planner.Plan to add the actions to.
+        :return: None
+        """
+        router = snapshot.find('router', self.params['router_name'])
+        network = snapshot.find('network', self.params['network_name'])
+        subnet = snapshot.find('subnet', self.params['subnet_name'])
+        plan.find_or_create('router', self.params['router_name'], router)
+        plan.find_or_create('network', self.params['network_name'], network)
+        plan.find_or_create('subnet', self.params['subnet_name'], subnet)
+        ports = snapshot.find_ports(network, subnet) if network and subnet else []
+        plan.find_or_create('port', ports[0].id if ports else 'router interface', ports)
+
+    def plan_server(self, snapshot, plan, server_name, background=False):
+        """
+        Plan the find-or-create of a server, and of its floating IP address if it is created.
+        :param snapshot: The planner.Snapshot of the project.
+        :param plan: The planner.Plan to add the actions to.
+        :param server_name: The name of the server.
+        :param background: The server is created in the background, if set to True - see planner.Plan.add
+        :return: True if the server is to be created.
+        """
+        server = snapshot.find('server', server_name)
+        plan.add('reuse' if server else 'create', 'server', server_name, background=background)
+        if not server:
+            plan.add_floating_ip(server_name, background=background)
+        return not server
+
+    def plan_app_servers(self, snapshot, plan, server_numbers, app_servers):
+        """
+        Plan the creation of app servers, claiming standby servers first, and the refill of the standby pool - see
+        create_app_servers.
+        :param snapshot: The planner.Snapshot of the project.
+        :param plan: The planner.Plan to add the actions to.
+        :param server_numbers: The numbers of the app servers to create.
+        :param app_servers: OrderedDict containing server_number: server for the existing app servers.
+        :return: None
+        """
+        standby_servers = snapshot.find_numbered_servers(
+            utils.construct_server_name_pattern(self.params, STANDBY_SERVER_PREFIX)
+        )
+        minion_names = []
+        for server_number in server_numbers:
             server_name = utils.construct_server_name(self.params, '%s-%s' % (APP_SERVER_PREFIX, server_number))
-            self.os_facade.delete_server(server_name, self.params['network_name'])
+            if server_number in app_servers:
+                plan.add('reuse', 'server', server_name)
+            elif standby_servers:
+                standby_number, standby_server = standby_servers.popitem(last=False)
+                plan.add('claim', 'server', server_name, 'from %s' % standby_server.name)
+            else:
+                self.plan_server(snapshot, plan, server_name)
+            minion_names.append(server_name)
+        plan.add_salt_minions(minion_names)
+        pool_size = self.params.get('standby_pool_size') or STANDBY_POOL_SIZE
+        for standby_number in [x for x in range(pool_size) if x not in standby_servers]:
+            server_name = utils.construct_server_name(self.params, '%s-%s' % (STANDBY_SERVER_PREFIX, standby_number))
+            self.plan_server(snapshot, plan, server_name, background=True)
 
-    def delete_salt_server(self):
+    def plan_server_deletion(self, snapshot, plan, server):
         """
-        Delete the salt master server
+        Plan the deletion of a server, and the release (or return to the pool) of its floating IP addresses.
+        :param snapshot: The planner.Snapshot of the project.
+        :param plan: The planner.Plan to add the actions to.
+        :param server: The server.
         :return: None
         """
-        server_name = utils.construct_server_name(self.params, SALT_SERVER_PREFIX)
-        self.os_facade.delete_server(server_name, self.params['network_name'])
+        for floating_ip in snapshot.find_floating_ips(server, self.params['network_name']):
+            plan.add(
+                'return' if self.os_facade.recycle_floating_ips else 'delete', 'floating_ip',
+                floating_ip.floating_ip_address
+            )
+        plan.add('delete', 'server', server.name)
 
     def validate_image_and_flavor(self):
         """
@@ -281,15 +944,108 @@ def main():
     parser.add_argument("environment", help="the environment to build e.g. dev")
     parser.add_argument("num_servers", type=int, help="the number of application servers to build e.g. 1")
     parser.add_argument("server_size", help="the server size e.g. t1.micro")
-    parser.add_argument("-d", "--destroy", help="destroy the environment, don't create it", action="store_true")
+    action_group = parser.add_mutually_exclusive_group()
+    action_group.add_argument("-d", "--destroy", help="destroy the environment, don't create it", action="store_true")
+    action_group.add_argument(
+        "-s", "--scale", help="scale the app servers of an existing environment to num_servers", action="store_true"
+    )
+    action_group.add_argument(
+        "-r", "--reload-backends", help="update the haproxy backends from the existing app servers", action="store_true"
+    )
+    parser.add_argument(
+        "--drain-timeout", type=int, default=DRAIN_TIMEOUT_SECONDS,
+        help="the maximum number of seconds to wait for connections to drain from app servers being scaled in"
+    )
+    parser.add_argument(
+        "--subnet-cidr", default=DEFAULT_SUBNET_CIDR,
+        help="the CIDR of the subnet to create, which limits the number of servers e.g. 10.0.0.0/16"
+    )
+    parser.add_argument(
+        "--ssh-pool-size", type=int, default=SSH_POOL_SIZE,
+        help="the maximum number of hosts to run remote commands on at once e.g. when bootstrapping salt minions"
+    )
+    parser.add_argument(
+        "--resume", action="store_true",
+        help="resume an interrupted build from its first incomplete phase, skipping the phases it completed"
+    )
+    parser.add_argument(
+        "--checkpoint-directory", default=CHECKPOINT_DIRECTORY,
+        help="the directory in which the checkpoints of interrupted builds are kept (see --resume)"
+    )
+    parser.add_argument(
+        "--standby-pool-size", type=int, default=STANDBY_POOL_SIZE,
+        help="the number of idle, pre-bootstrapped app servers to keep for fast scale-out (refilled in the background)"
+    )
+    parser.add_argument(
+        "--recycle-floating-ips", action="store_true",
+        help="return the floating IP addresses of deleted servers to a pool for reuse, rather than releasing them"
+    )
+    parser.add_argument(
+        "--page-size", type=int, default=osf.DEFAULT_PAGE_SIZE,
+        help="the number of resources requested per page by OpenStack listing calls"
+    )
+    parser.add_argument(
+        "--plan", action="store_true",
+        help="print what the build (or --scale / --destroy) would create, reuse or delete, without changing anything"
+    )
+    parser.add_argument("--trace", metavar="FILE", help="write a Chrome trace of the run's phases and calls to FILE")
     args = parser.parse_args()
-    manager = InfrastructureManager(vars(args), osf.OpenStackFacade(silent=False))
-    if args.destroy:
+    if args.plan and args.reload_backends:
+        parser.error('--plan cannot be used with --reload-backends')
+    os_facade = osf.OpenStackFacade(
+        silent=False, recycle_floating_ips=args.recycle_floating_ips, page_size=args.page_size
+    )
+    rate_limiter = middleware.RateLimiter(os_facade.conn)
+    retrier = middleware.Retrier(rate_limiter)
+    api_profiler = middleware.ApiProfiler(retrier)
+    os_facade.conn = api_profiler
+    manager = InfrastructureManager(vars(args), os_facade)
+    tracer = tracing.Tracer() if args.trace else None
+    if tracer:
+        tracer.instrument_object(manager, 'phase')
+        tracer.instrument_object(os_facade, 'facade', exclude=('display', 'silent_mode', 'find_tagged'))
+        tracer.instrument_module(fab_utils, 'fab')
+    try:
+        run(args, manager)
+    finally:
+        print()
+        print('OpenStack API calls')
+        print(api_profiler.format_summary())
+        print(middleware.format_counts('throttled calls', rate_limiter.throttles))
+        print(middleware.format_counts('retried calls', retrier.retried))
+        print(osf.format_floating_ip_pool_stats(os_facade.floating_ip_pool_stats))
+        if tracer:
+            tracer.export_chrome_trace(args.trace)
+            print('trace written to %s' % args.trace)
+
+
+def run(args, manager):
+    """
+    Run the requested action.
+    :param args: The parsed command line arguments.
+    :param manager: The InfrastructureManager
+    :return: None
+    """
+    if args.plan:
+        action = 'destroy' if args.destroy else 'scale' if args.scale else 'build'
+        print('planning %s...' % action)
+        print(manager.plan(action).format())
+    elif args.destroy:
         print('destroying...')
         manager.destroy()
+    elif args.scale:
+        print('scaling...')
+        servers = manager.scale()
+        for server_name, public_ip_addresses in servers.items():
+            print('server %s public IP address : %s' % (server_name, ','.join(public_ip_addresses)))
+    elif args.reload_backends:
+        print('reloading backends...')
+        servers = manager.reload_backends()
+        for server_name, public_ip_addresses in servers.items():
+            print('backend %s public IP address : %s' % (server_name, ','.join(public_ip_addresses)))
     else:
         print('building...')
-        servers, ha_address = manager.build()
+        servers, ha_address = manager.build(resume=args.resume)
         for server_name, public_ip_addresses in servers.items():
             print('server %s public IP address : %s' % (server_name, ','.join(public_ip_addresses)))
         print('blog is now available at %s' % ha_address)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+checkpoint.py
+
+Description: Record the phases of a build as they complete, so that an interrupted build can be resumed from the
+first phase which did not complete.
+
+The outputs of each phase (e.g. the salt master address) are recorded in a JSON file, written atomically after each
+phase. When resuming, a completed phase is skipped if its recorded output passes a cheap check that it is still valid
+(e.g. that the servers still exist). Once a phase has to be run, every later phase is run too.
+
+"""
+
+import collections
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Checkpoint(object):
+
+    def __init__(self, path, key, resume=False):
+        """
+        Construct a Checkpoint.
+        :param path: The path of the JSON file to record the completed phases in.
+        :param key: A dict identifying the build e.g. app, environment and num_servers. A checkpoint recorded for a
+                    different key is not resumed from.
+        :param resume: Skip the phases completed by an earlier run, if set to True. Otherwise all phases are run, and
+                       recorded afresh.
+        """
+        self.path = path
+        self.key = key
+        self.phases = collections.OrderedDict()
+        self.resuming = False
+        if resume:
+            self.load()
+
+    def load(self):
+        """
+        Load the phases completed by an earlier run, if they were recorded for the same key.
+        :return: None
+        """
+        try:
+            with open(self.path) as f:
+                data = json.load(f, object_pairs_hook=collections.OrderedDict)
+        except FileNotFoundError:
+            logger.info('no checkpoint found at %s - nothing to resume' % self.path)
+            return
+        if data.get('key') != self.key:
+            logger.warning('checkpoint %s was recorded for %s, not %s - not resuming' % (
+                self.path, data.get('key'), self.key))
+            return
+        self.phases = data['phases']
+        self.resuming = True
+        logger.info('resuming after phase(s) %s' % ', '.join(self.phases) if self.phases else 'resuming')
+
+    def run(self, phase, run, save=None, restore=None):
+        """
+        Run a phase and record its output, or skip it if it was completed by the run being resumed.
+        :param phase: The name of the phase.
+        :param run: A function (taking no arguments) which runs the phase, and returns its value.
+        :param save: A function which converts the value into JSON serialisable output. Defaults to the value itself.
+        :param restore: A function which converts the recorded output back into the value, returning None if a cheap
+                        check finds that it is no longer valid. Defaults to the output itself.
+        :return: The value of the phase.
+        """
+        if self.resuming and phase in self.phases:
+            output = self.phases[phase]['output']
+            value = restore(output) if restore else output
+            if restore is None or value is not None:
+                logger.info('skipping phase %s, completed at %s' % (
+                    phase, time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.phases[phase]['completed_at']))))
+                return value
+            logger.warning('the output of phase %s is no longer valid - running it again' % phase)
+        if self.resuming:
+            logger.info('resuming from phase %s' % phase)
+            self.resuming = False
+        value = run()
+        self.record(phase, save(value) if save else value)
+        return value
+
+    def record(self, phase, output):
+        """
+        Record a phase as completed, discarding any later phases recorded by an earlier run.
+        :param phase: The name of the phase.
+        :param output: The JSON serialisable output of the phase.
+        :return: None
+        """
+        if phase in self.phases:
+            phases = list(self.phases)
+            for stale_phase in phases[phases.index(phase):]:
+                del self.phases[stale_phase]
+        self.phases[phase] = dict(output=output, completed_at=time.time())
+        self.save()
+
+    def save(self):
+        """
+        Write the checkpoint file atomically, so that it is never left half written.
+        :return: None
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_path = '%s.tmp' % self.path
+        with open(temporary_path, 'w') as f:
+            json.dump(dict(key=self.key, phases=self.phases), f, indent=2)
+        os.replace(temporary_path, self.path)
+
+    def clear(self):
+        """
+        Remove the checkpoint file e.g. once the build has completed.
+        :return: None
+        """
+        self.phases = collections.OrderedDict()
+        self.resuming = False
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+executor.py
+
+Description: Run the same remote task across a list of hosts concurrently, from a bounded pool of threads.
+
+Each host is retried independently, and the result (or error), number of attempts and duration of each host are
+reported, so that e.g. minion bootstrap for 50 app servers takes roughly the time of the slowest host rather than
+the sum of them all.
+
+"""
+
+import collections
+import concurrent.futures
+import logging
+import threading
+import time
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_RETRIES = 0
+DEFAULT_RETRY_INTERVAL_SECONDS = 5
+
+logger = logging.getLogger(__name__)
+
+
+class HostTimeoutError(Exception):
+    pass
+
+
+class HostResult(object):
+
+    def __init__(self, host):
+        """
+        Construct a HostResult.
+        :param host: The host the task ran on.
+        """
+        self.host = host
+        self.value = None
+        self.error = None
+        self.attempts = 0
+        self.seconds = 0.0
+
+    @property
+    def succeeded(self):
+        return self.error is None
+
+    def __repr__(self):
+        return '<HostResult %s %s after %s attempt(s) in %.1fs%s>' % (
+            self.host, 'succeeded' if self.succeeded else 'failed', self.attempts, self.seconds,
+            '' if self.succeeded else ': %s' % self.error
+        )
+
+
+def call_with_timeout(func, timeout):
+    """
+    Call a function, giving up on it after timeout seconds.
+    The call runs in a daemon thread, which is abandoned (not stopped) if it times out.
+    :param func: The function to call.
+    :param timeout: The number of seconds to wait, or None to wait indefinitely.
+    :return: The value returned by the function.
+    """
+    if timeout is None:
+        return func()
+    outcome = dict()
+
+    def target():
+        try:
+            outcome['value'] = func()
+        except BaseException as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise HostTimeoutError('timed out after %ss' % timeout)
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['value']
+
+
+def run_on_host(task, host, retries=DEFAULT_RETRIES, timeout=None, retry_interval=DEFAULT_RETRY_INTERVAL_SECONDS):
+    """
+    Run a task on a host, retrying if it fails.
+    An attempt which times out is not retried, as it is abandoned rather than stopped, and may still be running on
+    the host (e.g. a salt bootstrap) - a second attempt would run alongside it.
+    :param task: A function taking the host as its only argument.
+    :param host: The host.
+    :param retries: The number of times to retry the task if it fails (but not if it times out).
+    :param timeout: The number of seconds to allow each attempt, or None to wait indefinitely.
+    :param retry_interval: The number of seconds to sleep between attempts.
+    :return: The HostResult
+    """
+    result = HostResult(host)
+    started = time.time()
+    for attempt in range(1, retries + 2):
+        result.attempts = attempt
+        try:
+            result.value = call_with_timeout(lambda: task(host), timeout)
+            result.error = None
+            break
+        except HostTimeoutError as e:
+            result.error = e
+            logger.warning('[%s] attempt %s of %s timed out, and is not retried: %s', host, attempt, retries + 1, e)
+            break
+        except Exception as e:
+            result.error = e
+            if attempt <= retries:
+                logger.warning('[%s] attempt %s of %s failed: %s', host, attempt, retries + 1, e)
+                time.sleep(retry_interval)
+    result.seconds = time.time() - started
+    return result
+
+
+def run_on_hosts(task, hosts, pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES, timeout=None,
+                 retry_interval=DEFAULT_RETRY_INTERVAL_SECONDS):
+    """
+    Run a task on each of a list of hosts concurrently, using at most pool_size threads.
+    A failure on one host does not stop the task running on the others.
+    :param task: A function taking the host as its only argument e.g. a functools.partial of a fab_utils function.
+    :param hosts: A list of hosts.
+    :param pool_size: The maximum number of hosts to run the task on at once.
+    :param retries: The number of times to retry the task on a host if it fails (but not if it times out).
+    :param timeout: The number of seconds to allow each attempt on a host, or None to wait indefinitely.
+    :param retry_interval: The number of seconds to sleep between attempts.
+    :return: An OrderedDict of host to HostResult, in the order of hosts.
+    """
+    results = collections.OrderedDict((host, None) for host in hosts)
+    if not hosts:
+        return results
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(pool_size, len(hosts))) as executor:
+        futures = {
+            executor.submit(run_on_host, task, host, retries, timeout, retry_interval): host for host in hosts
+        }
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            logger.info('%s', result)
+            results[result.host] = result
+    return results
+
+
+def failures(results):
+    """
+    Return the results of the hosts on which the task failed.
+    :param results: The results, as returned by run_on_hosts.
+    :return: A list of the failed HostResults.
+    """
+    return [x for x in results.values() if not x.succeeded]
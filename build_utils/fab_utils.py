@@ -3,68 +3,131 @@
 fab_utils.py
 
 Description: Fab utils for build.py et al.
+
+Each public function takes the address of the host it operates on and runs on its own session on that host, so the
+functions can be run concurrently (for different hosts) from a worker pool.
 Written by:  maharg101 on 25th February 2018
 """
 
-import functools
 import io
+import logging
 import os
 import random
 import string
+import time
 import yaml
 
-from fabric.api import *
-from fabric.operations import put
+from build_utils import readiness, remote, salt_utils, utils
+
+logger = logging.getLogger(__name__)
 
-env.connection_attempts = 5
-env.disable_known_hosts = True  # http://docs.fabfile.org/en/1.14/usage/ssh.html
-env.timeout = 30
-env.user = 'ubuntu'
+_backend = remote.SSHBackend()  # see set_backend
 
 vrrp_auth_pass = "".join(random.choice(string.ascii_letters) for x in range(24))
 
+FAILOVER_AGENT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'failover_agent.py')
+FAILOVER_AGENT_FIFO = '/run/keepalived-failover.fifo'
+FAILOVER_AGENT_ACK_TIMEOUT_SECONDS = 10
+SCRIPT_DELIMITER = 'END_OF_STEP_SCRIPT'
 
-def _bootstrap_salt_master():
+
+def set_backend(backend):
     """
-    Bootstrap the salt master
+    Set the remote execution backend used by the functions in this module - see remote.py.
+    This is configuration, to be set before any remote operations are run.
+    :param backend: The backend e.g. a remote.LocalBackend
     :return: None
     """
+    global _backend
+    _backend = backend
+
+
+def get_backend():
+    """
+    Get the remote execution backend used by the functions in this module, which defaults to a remote.SSHBackend.
+    :return: The backend
+    """
+    return _backend
+
+
+def _session(host):
+    return get_backend().session(host)
+
+
+def wait_until_ready(host, timeout=readiness.DEFAULT_TIMEOUT_SECONDS):
+    """
+    Wait until a host is ready for remote work e.g. a newly created server whose sshd may still be starting.
+    :param host: The public address of the host
+    :param timeout: The maximum number of seconds to wait.
+    :return: The number of seconds waited.
+    """
+    return get_backend().wait_until_ready(host, timeout)
+
+
+def _run_step_script(session, name, steps):
+    """
+    Run a list of steps as root with a single remote invocation, rather than a round trip per step.
+    The steps are rendered as one script (see utils.render_step_script), which is passed to bash on stdin.
+    :param session: The remote session
+    :param name: The name of the script
+    :param steps: A list of (step name, command) tuples. The steps should be idempotent, so that the script can be
+                  run again after a failure.
+    :return: A list of the results of each step - see utils.parse_step_script_output
+    """
+    script = utils.render_step_script(name, steps)
+    output = session.sudo("bash -s <<'%s'\n%s%s" % (SCRIPT_DELIMITER, script, SCRIPT_DELIMITER), warn_only=True)
+    step_results = utils.parse_step_script_output(output)
+    for step_result in step_results:
+        logger.info('[%s] %s %s: exit code %s in %.1fs', session.host, name, step_result['name'],
+                    step_result['return_code'], step_result['seconds'])
+    if output.failed:
+        raise remote.RemoteCommandError(session.host, name, output)
+    return step_results
+
+
+def _bootstrap_salt_master(session):
+    """
+    Bootstrap the salt master
+    :param session: The remote session on the salt master
+    :return: A list of the results of each step - see utils.parse_step_script_output
+    """
     salt_dir = '/srv'
-    with settings(warn_only=True):
-        with cd(salt_dir):
-            if run('git rev-parse --git-dir > /dev/null 2>&1').failed:
-                sudo('git clone '
-                     'https://github.com/maharg101/gdl-100-salt %s' % salt_dir)
-    with settings(warn_only=False):
-        with cd(salt_dir):
-            sudo('git pull')
-        with cd('/tmp'):
-            run('curl -L https://bootstrap.saltstack.com -o install_salt.sh')
-            sudo('sh install_salt.sh -M -L')
-            sudo('apt-get  --yes --force-yes install python-pip')
-            sudo('pip install shade')  # Salt Cloud 2018.3.0 requires shade but does not install it
+    return _run_step_script(
+        session,
+        'bootstrap-salt-master',
+        [
+            ('clone', 'cd %s && { git rev-parse --git-dir > /dev/null 2>&1 || '
+                      'git clone https://github.com/maharg101/gdl-100-salt %s; }' % (salt_dir, salt_dir)),
+            ('pull', 'cd %s && git pull' % salt_dir),
+            ('install_salt', 'command -v salt-master > /dev/null || { cd /tmp && '
+                             'curl -L https://bootstrap.saltstack.com -o install_salt.sh && '
+                             'sh install_salt.sh -M -L; }'),
+            ('install_pip', 'apt-get  --yes --force-yes install python-pip'),
+            ('install_shade', 'pip install shade'),  # Salt Cloud 2018.3.0 requires shade but does not install it
+        ]
+    )
 
 
 def bootstrap_salt_master(salt_master_address):
     """
     Bootstrap the salt master.
     :param salt_master_address: The public address of the salt master
-    :return: None
+    :return: A list of the results of each step - see utils.parse_step_script_output
     """
-    env.host_string = salt_master_address
-    execute(_bootstrap_salt_master)
+    return _bootstrap_salt_master(_session(salt_master_address))
 
 
-def _configure_salt_cloud(openstack_cloud_config):
+def _configure_salt_cloud(session, openstack_cloud_config):
     """
     Configure Salt Cloud on the salt master.
+    :param session: The remote session on the salt master
     :param openstack_cloud_config: The openstack cloud configuration (StringIO).
     :return: None
     """
-    with cd('/etc/salt/cloud.providers.d/'):
-        put(openstack_cloud_config, 'openstack.conf', use_sudo=True)
-    with cd('/etc/salt/cloud.profiles.d/'):
-        put(
+    with session.cd('/etc/salt/cloud.providers.d/'):
+        session.put(openstack_cloud_config, 'openstack.conf', use_sudo=True)
+    with session.cd('/etc/salt/cloud.profiles.d/'):
+        session.put(
             io.StringIO(
                 yaml.dump(
                     dict(
@@ -74,7 +137,7 @@ def _configure_salt_cloud(openstack_cloud_config):
                             size='m1.small',
                             ssh_key_name='salt-cloud',
                             ssh_key_file='/root/.ssh/id_rsa',
-                            ssh_username=env.user
+                            ssh_username=session.user
                         )
                     ),
                     default_flow_style=False
@@ -83,8 +146,8 @@ def _configure_salt_cloud(openstack_cloud_config):
             'openstack.conf',
             use_sudo=True
         )
-    with cd('/root/'):
-        put(
+    with session.cd('/root/'):
+        session.put(
             io.StringIO(
                 yaml.dump(
                     {
@@ -99,13 +162,13 @@ def _configure_salt_cloud(openstack_cloud_config):
             'vrrp-host-map',
             use_sudo=True
         )
-    with cd('/etc/salt'):
-        put(
+    with session.cd('/etc/salt'):
+        session.put(
             io.StringIO(
                 yaml.dump(
                     {
                         'minion': {
-                            'master': env.host_string  # this ensures that minions can find the master
+                            'master': session.host  # this ensures that minions can find the master
                         }
                     },
                     default_flow_style=False
@@ -123,30 +186,30 @@ def configure_salt_cloud(salt_master_address, openstack_cloud_config):
     :param openstack_cloud_config: The openstack cloud configuration (StringIO).
     :return: None
     """
-    env.host_string = salt_master_address
-    func = functools.partial(_configure_salt_cloud, openstack_cloud_config=openstack_cloud_config)
-    execute(func)
+    _configure_salt_cloud(_session(salt_master_address), openstack_cloud_config=openstack_cloud_config)
 
 
-def _place_ha_config_on_saltmaster(primary_server_port, ha_floating_ip, secondary_server_port):
+def _place_ha_config_on_saltmaster(session, primary_server_port, ha_floating_ip, secondary_server_port):
     """
     Place the high availability configuration files on the salt master.
     See https://github.com/100PercentIT/OpenStack-HA-Keepalived
+    :param session: The remote session on the salt master
     :param primary_server_port: The primary HA server port
     :param primary_ip: The IP address of the primary server
     :param secondary_server_port: The secondary HA server port
     :return: None
     """
-    with cd('/srv/salt/keepalived'):
-        _place_failover_primary_to_secondary_sh(ha_floating_ip, primary_server_port, secondary_server_port)
-        _place_failover_secondary_to_primary_sh(ha_floating_ip, primary_server_port, secondary_server_port)
-        _place_primary_keepalived_conf()
-        _place_secondary_keepalived_conf()
-        _place_clouds_yaml()
+    with session.cd('/srv/salt/keepalived'):
+        _place_failover_primary_to_secondary_sh(session, ha_floating_ip, primary_server_port, secondary_server_port)
+        _place_failover_secondary_to_primary_sh(session, ha_floating_ip, primary_server_port, secondary_server_port)
+        _place_primary_keepalived_conf(session)
+        _place_secondary_keepalived_conf(session)
+        _place_clouds_yaml(session)
+        _place_failover_agent(session, ha_floating_ip)
 
 
-def _place_clouds_yaml():
-    put(io.StringIO("""\
+def _place_clouds_yaml(session):
+    session.put(io.StringIO("""\
 clouds:
   100percentit:
     auth:
@@ -162,9 +225,9 @@ clouds:
         'clouds.yaml', use_sudo=True)
 
 
-def _place_secondary_keepalived_conf():
+def _place_secondary_keepalived_conf(session):
     # TODO - don't assume ens3
-    put(io.StringIO("""\
+    session.put(io.StringIO("""\
 vrrp_instance vrrp_group_1 {
 state BACKUP
 interface ens3
@@ -181,9 +244,9 @@ notify_master /etc/keepalived/failover-primary-to-secondary.sh
         'secondary-keepalived.conf', use_sudo=True)
 
 
-def _place_primary_keepalived_conf():
+def _place_primary_keepalived_conf(session):
     # TODO - don't assume ens3
-    put(io.StringIO("""\
+    session.put(io.StringIO("""\
 vrrp_instance vrrp_group_1 {
 state MASTER
 interface ens3
@@ -200,24 +263,80 @@ notify_master /etc/keepalived/failover-secondary-to-primary.sh
         'primary-keepalived.conf', use_sudo=True)
 
 
-def _place_failover_secondary_to_primary_sh(ha_floating_ip, primary_server_port, secondary_server_port):
-    put(io.StringIO("""\
+def _generate_failover_sh(name, ha_floating_ip_id, from_port_id, to_port_id, fifo=FAILOVER_AGENT_FIFO):
+    """
+    Generate a keepalived notify script which moves the HA floating IP address from one port to another.
+    The request is handed to the resident failover agent if it is running (see failover_agent.py). The neutron CLI is
+    used unless the agent acknowledges that it moved the address within FAILOVER_AGENT_ACK_TIMEOUT_SECONDS, so a
+    failed update (or an agent which has stopped reading) does not leave the address on the failed host.
+    :param name: The name of the script
+    :param ha_floating_ip_id: The id of the high availability floating IP
+    :param from_port_id: The id of the port which currently has the HA floating IP
+    :param to_port_id: The id of the port which is to receive the HA floating IP
+    :param fifo: The path of the FIFO on which the failover agent listens
+    :return: String containing the script
+    """
+    return """\
 #!/bin/bash
-# failover-secondary-to-primary.sh
-neutron --os-cloud 100percentit floatingip-disassociate %s %s
-neutron --os-cloud 100percentit floatingip-associate %s %s
-""" % (ha_floating_ip.id, secondary_server_port.id, ha_floating_ip.id, primary_server_port.id)),
-        'failover-secondary-to-primary.sh', use_sudo=True)
+# %(name)s
+if [ -p %(fifo)s ]; then
+    ack=$(mktemp -u %(fifo)s.ack.XXXXXX)
+    if mkfifo -m 600 "$ack" && exec 3<>"$ack"; then
+        result=
+        if timeout 1 sh -c "echo '%(to_port_id)s $(date +%%s.%%N) $ack' > %(fifo)s"; then
+            read -r -t %(ack_timeout)s result <&3
+        fi
+        exec 3<&-
+        rm -f "$ack"
+        if [ "$result" = ok ]; then
+            exit 0
+        fi
+    fi
+fi
+neutron --os-cloud 100percentit floatingip-disassociate %(ha_floating_ip_id)s %(from_port_id)s
+neutron --os-cloud 100percentit floatingip-associate %(ha_floating_ip_id)s %(to_port_id)s
+""" % dict(
+        name=name,
+        fifo=fifo,
+        ack_timeout=FAILOVER_AGENT_ACK_TIMEOUT_SECONDS,
+        ha_floating_ip_id=ha_floating_ip_id,
+        from_port_id=from_port_id,
+        to_port_id=to_port_id,
+    )
 
 
-def _place_failover_primary_to_secondary_sh(ha_floating_ip, primary_server_port, secondary_server_port):
-    put(io.StringIO("""\
-#!/bin/bash
-# failover-primary-to-secondary.sh
-neutron --os-cloud 100percentit floatingip-disassociate %s %s
-neutron --os-cloud 100percentit floatingip-associate %s %s
-""" % (ha_floating_ip.id, primary_server_port.id, ha_floating_ip.id, secondary_server_port.id)),
-        'failover-primary-to-secondary.sh', use_sudo=True)
+def _place_failover_secondary_to_primary_sh(session, ha_floating_ip, primary_server_port, secondary_server_port):
+    name = 'failover-secondary-to-primary.sh'
+    session.put(
+        io.StringIO(_generate_failover_sh(name, ha_floating_ip.id, secondary_server_port.id, primary_server_port.id)),
+        name, use_sudo=True
+    )
+
+
+def _place_failover_primary_to_secondary_sh(session, ha_floating_ip, primary_server_port, secondary_server_port):
+    name = 'failover-primary-to-secondary.sh'
+    session.put(
+        io.StringIO(_generate_failover_sh(name, ha_floating_ip.id, primary_server_port.id, secondary_server_port.id)),
+        name, use_sudo=True
+    )
+
+
+def _place_failover_agent(session, ha_floating_ip):
+    session.put(FAILOVER_AGENT_PATH, 'failover-agent.py', use_sudo=True)
+    session.put(io.StringIO("""\
+[Unit]
+Description=keepalived failover agent
+After=network-online.target
+
+[Service]
+ExecStart=/usr/bin/env python /usr/local/bin/failover-agent.py --floating-ip-id %s --fifo %s
+Restart=always
+RestartSec=1
+
+[Install]
+WantedBy=multi-user.target
+""" % (ha_floating_ip.id, FAILOVER_AGENT_FIFO)),
+        'failover-agent.service', use_sudo=True)
 
 
 def place_ha_config_on_saltmaster(salt_master_address, primary_server_port, ha_floating_ip, secondary_server_port):
@@ -231,25 +350,57 @@ def place_ha_config_on_saltmaster(salt_master_address, primary_server_port, ha_f
     :param secondary_server_port: The secondary HA server port
     :return: None
     """
-    env.host_string = salt_master_address
-    func = functools.partial(
-        _place_ha_config_on_saltmaster,
+    _place_ha_config_on_saltmaster(
+        _session(salt_master_address),
         primary_server_port=primary_server_port,
         ha_floating_ip=ha_floating_ip,
         secondary_server_port=secondary_server_port,
     )
-    execute(func)
 
 
-def _place_haproxy_pillar_on_saltmaster(servers, app_server_prefix):
+def _install_failover_agent(session, load_balancer_ids):
+    """
+    Install and (re)start the failover agent on the load balancers, from the files placed by
+    place_ha_config_on_saltmaster.
+    :param session: The remote session on the salt master
+    :param load_balancer_ids: A list of load balancer minion ids
+    :return: None
+    """
+    targets = ','.join(load_balancer_ids)
+    session.sudo(
+        "salt -L '%s' cp.get_file salt://keepalived/failover-agent.py /usr/local/bin/failover-agent.py" % targets
+    )
+    session.sudo(
+        "salt -L '%s' cp.get_file salt://keepalived/failover-agent.service "
+        "/etc/systemd/system/failover-agent.service" % targets
+    )
+    session.sudo(
+        "salt -L '%s' cmd.run 'systemctl daemon-reload && systemctl enable failover-agent && "
+        "systemctl restart failover-agent'" % targets
+    )
+
+
+def install_failover_agent(salt_master_address, load_balancer_ids):
+    """
+    Install and (re)start the failover agent on the load balancers.
+    The keepalived notify scripts fall back to the neutron CLI if the agent is not running.
+    :param salt_master_address: The public address of the salt master
+    :param load_balancer_ids: A list of load balancer minion ids
+    :return: None
+    """
+    _install_failover_agent(_session(salt_master_address), load_balancer_ids=load_balancer_ids)
+
+
+def _place_haproxy_pillar_on_saltmaster(session, servers, app_server_prefix):
     """
     Place the haproxy pillar data on the salt master.
+    :param session: The remote session on the salt master
     :param servers: A dict of server name to floating IP address
     :param app_server_prefix: The prefix used for application servers
     :return: None
     """
-    with cd('/srv/pillar'):
-        put(
+    with session.cd('/srv/pillar'):
+        session.put(
             io.StringIO(
                 yaml.dump(
                     dict(
@@ -275,51 +426,95 @@ def place_haproxy_pillar_on_saltmaster(salt_master_address, servers, app_server_
     :param app_server_prefix: The prefix used for application servers
     :return: None
     """
-    env.host_string = salt_master_address
-    func = functools.partial(
-        _place_haproxy_pillar_on_saltmaster,
+    _place_haproxy_pillar_on_saltmaster(
+        _session(salt_master_address),
         servers=servers,
         app_server_prefix=app_server_prefix,
     )
-    execute(func)
 
 
-def _bootstrap_salt_minion(salt_master_address):
+def _update_haproxy_backends(session, servers, app_server_prefix, load_balancer_ids):
     """
-    Bootstrap a salt minion, ensuring to configure the salt master location.
+    Place the haproxy pillar data on the salt master, then apply only the haproxy state to the load balancers.
+    :param session: The remote session on the salt master
+    :param servers: A dict of server name to floating IP address
+    :param app_server_prefix: The prefix used for application servers
+    :param load_balancer_ids: A list of load balancer minion ids
+    :return: None
+    """
+    _place_haproxy_pillar_on_saltmaster(session, servers, app_server_prefix)
+    targets = ','.join(load_balancer_ids)
+    # one round trip: render the haproxy config from the fresh pillar, then reload (not restart) so that
+    # haproxy hands over its listeners and lets in-flight sessions finish on the old process
+    session.sudo(
+        "salt -L '%s' state.apply haproxy --state-output=terse && "
+        "salt -L '%s' service.reload haproxy" % (targets, targets)
+    )
+
+
+def update_haproxy_backends(salt_master_address, servers, app_server_prefix, load_balancer_ids):
+    """
+    Update the haproxy backend servers on the load balancers.
+    This is a fast alternative to place_haproxy_pillar_on_saltmaster followed by apply_state, which runs a full
+    highstate across every minion just to rewrite the haproxy backend section.
     :param salt_master_address: The public address of the salt master
+    :param servers: A dict of server name to floating IP address
+    :param app_server_prefix: The prefix used for application servers
+    :param load_balancer_ids: A list of load balancer minion ids
     :return: None
     """
-    with settings(warn_only=False):
-        with cd('/tmp'):
-            run('curl -L https://bootstrap.saltstack.com -o install_salt.sh')
-            sudo('sh install_salt.sh -A %s' % salt_master_address)
-    with cd('/etc/salt'):
-        put(io.StringIO('master: %s' % salt_master_address), 'minion', use_sudo=True)
-    sudo('systemctl restart salt-minion')
+    _update_haproxy_backends(
+        _session(salt_master_address),
+        servers=servers,
+        app_server_prefix=app_server_prefix,
+        load_balancer_ids=load_balancer_ids,
+    )
 
 
-def bootstrap_salt_minion(salt_minion_address, salt_master_address):
+def _bootstrap_salt_minion(session, salt_master_address, minion_id=None):
     """
-    Bootstrap the salt master.
+    Bootstrap a salt minion, ensuring to configure the salt master location.
+    Salt is only installed if it is missing, so bootstrapping an already bootstrapped minion (e.g. a standby server
+    being claimed) just reconfigures and restarts it.
+    :param session: The remote session on the salt minion
+    :param salt_master_address: The public address of the salt master
+    :param minion_id: The minion id to configure. Defaults to the hostname of the minion.
+    :return: A list of the results of each step - see utils.parse_step_script_output
+    """
+    steps = [
+        ('install_salt', 'command -v salt-minion > /dev/null || { cd /tmp && '
+                         'curl -L https://bootstrap.saltstack.com -o install_salt.sh && '
+                         'sh install_salt.sh -A %s; }' % salt_master_address),
+        ('configure_master', 'mkdir -p /etc/salt && printf "master: %s" > /etc/salt/minion' % salt_master_address),
+    ]
+    if minion_id:
+        steps.append(('configure_minion_id', 'printf "%s" > /etc/salt/minion_id' % minion_id))
+    steps.append(('restart_minion', 'systemctl restart salt-minion'))
+    return _run_step_script(session, 'bootstrap-salt-minion', steps)
+
+
+def bootstrap_salt_minion(salt_minion_address, salt_master_address, minion_id=None):
+    """
+    Bootstrap the salt minion.
     :param salt_minion_address: The public address of the salt minion
     :param salt_master_address: The public address of the salt master
-    :return: None
+    :param minion_id: The minion id to configure. Defaults to the hostname of the minion.
+    :return: A list of the results of each step - see utils.parse_step_script_output
     """
-    env.host_string = salt_minion_address
-    func = functools.partial(_bootstrap_salt_minion, salt_master_address=salt_master_address)
-    execute(func)
+    return _bootstrap_salt_minion(
+        _session(salt_minion_address), salt_master_address=salt_master_address, minion_id=minion_id
+    )
 
 
-def _accept_salt_minion_connections(minion_connection_keys):
+def _accept_salt_minion_connections(session, minion_connection_keys):
     """
     Accept salt minion connections.
+    :param session: The remote session on the salt master
     :param minion_connection_keys: A list of minion connection keys
     :return: None
     """
-    with settings(warn_only=False):
-        for minion_connection_key in minion_connection_keys:
-            sudo('salt-key --accept=%s --yes' % minion_connection_key)
+    for minion_connection_key in minion_connection_keys:
+        session.sudo('salt-key --accept=%s --yes' % minion_connection_key)
 
 
 def accept_salt_minion_connections(salt_master_address, minion_connection_keys):
@@ -329,20 +524,19 @@ def accept_salt_minion_connections(salt_master_address, minion_connection_keys):
     :param minion_connection_keys: A list of minion connection names
     :return: None
     """
-    env.host_string = salt_master_address
-    func = functools.partial(_accept_salt_minion_connections, minion_connection_keys=minion_connection_keys)
-    execute(func)
+    _accept_salt_minion_connections(_session(salt_master_address), minion_connection_keys=minion_connection_keys)
 
 
-def _write_salt_master_private_key(private_key):
+def _write_salt_master_private_key(session, private_key):
     """
     Write the private key for the root user on the the salt master.
+    :param session: The remote session on the salt master
     :param private_key: The private key to write.
     :return: None
     """
-    with cd('/root/.ssh'):
-        put(io.StringIO(private_key), 'id_rsa', mode=0o0600, use_sudo=True)
-        sudo('chown root. id_rsa')
+    with session.cd('/root/.ssh'):
+        session.put(io.StringIO(private_key), 'id_rsa', mode=0o0600, use_sudo=True)
+        session.sudo('chown root. id_rsa')
 
 
 def write_salt_master_private_key(salt_master_address, private_key):
@@ -352,18 +546,16 @@ def write_salt_master_private_key(salt_master_address, private_key):
     :param private_key: The private key to write.
     :return: None
     """
-    env.host_string = salt_master_address
-    func = functools.partial(_write_salt_master_private_key, private_key=private_key)
-    execute(func)
+    _write_salt_master_private_key(_session(salt_master_address), private_key=private_key)
 
 
-def _apply_state():
+def _apply_state(session):
     """
     Apply the salt state.
+    :param session: The remote session on the salt master
     :return: None
     """
-    with settings(warn_only=False):
-        sudo('sh /srv/apply_state.sh')
+    session.sudo('sh /srv/apply_state.sh')
 
 
 def apply_state(salt_master_address):
@@ -372,18 +564,115 @@ def apply_state(salt_master_address):
     :param salt_master_address: The public address of the salt master
     :return: None
     """
-    env.host_string = salt_master_address
-    execute(_apply_state)
+    _apply_state(_session(salt_master_address))
+
+
+def _apply_state_to_minions(session, minion_ids):
+    """
+    Apply the salt state to the listed minions only.
+    :param session: The remote session on the salt master
+    :param minion_ids: A list of minion ids
+    :return: None
+    """
+    session.sudo("salt -L '%s' state.apply --state-output=terse" % ','.join(minion_ids))
+
+
+def apply_state_to_minions(salt_master_address, minion_ids):
+    """
+    Apply the salt state to the listed minions only, rather than the full highstate run by apply_state.
+    :param salt_master_address: The public address of the salt master
+    :param minion_ids: A list of minion ids
+    :return: None
+    """
+    _apply_state_to_minions(_session(salt_master_address), minion_ids=minion_ids)
+
+
+def _delete_salt_minion_keys(session, minion_connection_keys):
+    """
+    Delete salt minion keys.
+    :param session: The remote session on the salt master
+    :param minion_connection_keys: A list of minion connection keys
+    :return: None
+    """
+    for minion_connection_key in minion_connection_keys:
+        session.sudo('salt-key --delete=%s --yes' % minion_connection_key, warn_only=True)
+
+
+def delete_salt_minion_keys(salt_master_address, minion_connection_keys):
+    """
+    Delete salt minion keys, so that removed minions are no longer targeted by the salt master.
+    :param salt_master_address: The public address of the salt master
+    :param minion_connection_keys: A list of minion connection names
+    :return: None
+    """
+    _delete_salt_minion_keys(_session(salt_master_address), minion_connection_keys=minion_connection_keys)
+
+
+def _count_backend_connections(session, load_balancer_ids, backend_addresses):
+    """
+    Count the established TCP connections from the load balancers to the given backend addresses.
+    :param session: The remote session on the salt master
+    :param load_balancer_ids: A list of load balancer minion ids
+    :param backend_addresses: A list of backend server addresses
+    :return: The total number of established connections, or None if no load balancer returned a count.
+    """
+    address_filter = ' or '.join('dst %s' % backend_address for backend_address in backend_addresses)
+    output = session.sudo(
+        "salt -L '%s' cmd.run \"ss -tn state established '( %s )' | tail -n +2 | wc -l\" --out=txt" % (
+            ','.join(load_balancer_ids), address_filter
+        ),
+        warn_only=True
+    )
+    counts = [int(v) for v in salt_utils.parse_txt_output(output).values() if v.isdigit()]
+    return sum(counts) if counts else None
+
+
+def count_backend_connections(salt_master_address, load_balancer_ids, backend_addresses):
+    """
+    Count the established TCP connections from the load balancers to the given backend addresses.
+    :param salt_master_address: The public address of the salt master
+    :param load_balancer_ids: A list of load balancer minion ids
+    :param backend_addresses: A list of backend server addresses
+    :return: The total number of established connections, or None if no load balancer returned a count.
+    """
+    return _count_backend_connections(
+        _session(salt_master_address),
+        load_balancer_ids=load_balancer_ids,
+        backend_addresses=backend_addresses,
+    )
+
+
+def wait_for_backend_drain(salt_master_address, load_balancer_ids, backend_addresses, timeout=120, interval=5):
+    """
+    Wait for the load balancers to stop sending traffic to the given backend addresses.
+    The backends must already have been removed from the haproxy configuration; haproxy then lets the sessions
+    which are still in flight finish, and this waits (for at most timeout seconds) until none remain.
+    :param salt_master_address: The public address of the salt master
+    :param load_balancer_ids: A list of load balancer minion ids
+    :param backend_addresses: A list of backend server addresses
+    :param timeout: The maximum number of seconds to wait.
+    :param interval: The number of seconds to sleep between checks.
+    :return: True if the backends have drained, False if the timeout was reached first.
+    """
+    deadline = time.time() + timeout
+    while True:
+        connections = count_backend_connections(salt_master_address, load_balancer_ids, backend_addresses)
+        if connections == 0:
+            return True
+        if time.time() + interval > deadline:
+            return False
+        time.sleep(interval)
 
 
-def _build_load_balancer_hosts():
+def _build_load_balancer_hosts(session):
     """
     Invoke salt-cloud to build the load balancer hosts.
+    :param session: The remote session on the salt master
     :return: None
     """
     # -P can be used to run in parallel - but can cause timeouts - see https://github.com/saltstack/salt/issues/46663
     # -y assumes yes
-    sudo('salt-cloud -m /root/vrrp-host-map -y --out=highstate --state-output=terse')
+    session.sudo('salt-cloud -m /root/vrrp-host-map -y --out=highstate --state-output=terse')
 
 
 def build_load_balancer_hosts(salt_master_address):
@@ -392,19 +681,19 @@ def build_load_balancer_hosts(salt_master_address):
     :param salt_master_address:
     :return: None
     """
-    env.host_string = salt_master_address
-    execute(_build_load_balancer_hosts)
+    _build_load_balancer_hosts(_session(salt_master_address))
 
 
-def _destroy_load_balancer_hosts():
+def _destroy_load_balancer_hosts(session):
     """
     Invoke salt-cloud to destroy the load balancer hosts.
     N.B.
      - In practice this project uses the OpenStack SDK via facade.py in preference to this method.
      - See delete_load_balancers method in build.py
+    :param session: The remote session on the salt master
     :return: None
     """
-    sudo('salt-cloud -m /root/vrrp-host-map -d -y')
+    session.sudo('salt-cloud -m /root/vrrp-host-map -d -y')
 
 
 def destroy_load_balancer_hosts(salt_master_address):
@@ -416,5 +705,4 @@ def destroy_load_balancer_hosts(salt_master_address):
     :param salt_master_address:
     :return: None
     """
-    env.host_string = salt_master_address
-    execute(_destroy_load_balancer_hosts)
+    _destroy_load_balancer_hosts(_session(salt_master_address))
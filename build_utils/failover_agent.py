@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+failover_agent.py
+
+Description: Resident keepalived failover agent for the vrrp hosts.
+
+failover_agent.py --floating-ip-id <floating_ip_id> [--cloud <cloud>] [--fifo <path>]
+
+The keepalived notify scripts used to shell out to the neutron CLI twice (disassociate, then associate), paying for
+the CLI start up and two keystone authentications in the middle of an outage. Instead, this agent runs as a service
+on each vrrp host and keeps an authenticated keystone session warm. The notify scripts write the id of the port which
+should receive the HA floating IP address (and the time of the notification) to a FIFO, and the agent moves the
+floating IP address with a single neutron update, logging how long the failover took. The agent acknowledges each
+request on a FIFO named by the notify script, which falls back to the neutron CLI unless the update succeeded.
+
+The agent is installed on the vrrp hosts via the salt master - see install_failover_agent in fab_utils.py.
+It needs keystoneauth1 and PyYAML, which the neutron CLI already on the vrrp hosts depends on. As the vrrp hosts may
+only have Python 2 available, this module sticks to syntax which both Python 2 and 3 understand.
+"""
+
+from __future__ import print_function
+
+import argparse
+import logging
+import os
+import threading
+import time
+import yaml
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CLOUD = '100percentit'
+DEFAULT_FIFO = '/run/keepalived-failover.fifo'
+CLOUDS_YAML_PATHS = [
+    'clouds.yaml',
+    os.path.expanduser('~/.config/openstack/clouds.yaml'),
+    '/etc/openstack/clouds.yaml',
+]
+KEEP_WARM_INTERVAL_SECONDS = 60
+ACK_OK = 'ok'
+ACK_FAILED = 'failed'
+
+
+def load_cloud_config(cloud_name, paths=None):
+    """
+    Load the configuration of the named cloud from the first clouds.yaml found.
+    This is the same file which the neutron CLI uses for --os-cloud.
+    :param cloud_name: The name of the cloud within clouds.yaml
+    :param paths: The paths to search for clouds.yaml. Defaults to the standard locations.
+    :return: The cloud configuration dict.
+    """
+    for path in paths or CLOUDS_YAML_PATHS:
+        if os.path.exists(path):
+            with open(path) as clouds_yaml:
+                return yaml.safe_load(clouds_yaml)['clouds'][cloud_name]
+    raise IOError('could not find clouds.yaml in %s' % ', '.join(paths or CLOUDS_YAML_PATHS))
+
+
+def create_session(cloud_config):
+    """
+    Create a keystone session for the given cloud configuration.
+    :param cloud_config: The cloud configuration dict, as returned by load_cloud_config.
+    :return: A keystoneauth1 Session
+    """
+    from keystoneauth1 import session
+    from keystoneauth1.identity import v3
+
+    auth = v3.Password(**cloud_config['auth'])
+    return session.Session(auth=auth)
+
+
+class FailoverAgent(object):
+
+    def __init__(self, session, floating_ip_id, region_name=None, interface='public'):
+        """
+        Construct a FailoverAgent.
+        :param session: An authenticated keystoneauth1 Session
+        :param floating_ip_id: The id of the HA floating IP address
+        :param region_name: The region in which to find the network endpoint. Optional.
+        :param interface: The network endpoint interface e.g. public or internal. Defaults to public.
+        """
+        self.session = session
+        self.floating_ip_id = floating_ip_id
+        self.endpoint_filter = dict(service_type='network', interface=interface)
+        if region_name:
+            self.endpoint_filter['region_name'] = region_name
+        self.lock = threading.Lock()
+
+    @property
+    def floating_ip_path(self):
+        return '/v2.0/floatingips/%s' % self.floating_ip_id
+
+    def keep_warm(self):
+        """
+        Keep the session warm by fetching the floating IP address.
+        This refreshes the keystone token if it is close to expiry, and keeps the HTTP connection to neutron open,
+        so that a failover doesn't have to pay for authentication, endpoint discovery or connection set up.
+        :return: The id of the port to which the floating IP address is currently assigned.
+        """
+        with self.lock:
+            response = self.session.get(self.floating_ip_path, endpoint_filter=self.endpoint_filter)
+        return response.json()['floatingip']['port_id']
+
+    def reassign(self, port_id, notified_at=None):
+        """
+        Reassign the floating IP address to the given port.
+        Neutron moves an associated floating IP address in a single update, so there is no need to disassociate it.
+        :param port_id: The id of the port to which the floating IP address should be assigned.
+        :param notified_at: The time (seconds since the epoch) at which keepalived notified the failover. Optional.
+        :return: The number of seconds taken to reassign the floating IP address.
+        """
+        started = time.time()
+        with self.lock:
+            self.session.put(
+                self.floating_ip_path,
+                endpoint_filter=self.endpoint_filter,
+                json={'floatingip': {'port_id': port_id}},
+            )
+        finished = time.time()
+        if notified_at:
+            logger.info('floating IP %s reassigned to port %s in %.3fs (%.3fs since notification)' % (
+                self.floating_ip_id, port_id, finished - started, finished - notified_at))
+        else:
+            logger.info('floating IP %s reassigned to port %s in %.3fs' % (
+                self.floating_ip_id, port_id, finished - started))
+        return finished - started
+
+    def handle(self, message):
+        """
+        Handle a message written to the FIFO by a notify script, acknowledging it if it names an acknowledgement FIFO.
+        :param message: A line of the form '<port_id> [<notified_at> [<ack_path>]]'
+        :return: True if the floating IP address was reassigned, otherwise False.
+        """
+        fields = message.split()
+        if not fields:
+            return False
+        notified_at = float(fields[1]) if len(fields) > 1 else None
+        ack_path = fields[2] if len(fields) > 2 else None
+        try:
+            self.reassign(fields[0], notified_at)
+        except Exception:
+            logger.exception('failed to reassign floating IP %s to port %s' % (self.floating_ip_id, fields[0]))
+            self.acknowledge(ack_path, ACK_FAILED)
+            return False
+        self.acknowledge(ack_path, ACK_OK)
+        return True
+
+    @staticmethod
+    def acknowledge(ack_path, result):
+        """
+        Tell the notify script the result of its request, so that it falls back to the neutron CLI on failure.
+        The write never blocks: if the notify script has already given up waiting, the acknowledgement is dropped.
+        :param ack_path: The path of the FIFO on which the notify script waits, or None.
+        :param result: ACK_OK or ACK_FAILED
+        :return: None
+        """
+        if not ack_path:
+            return
+        try:
+            fd = os.open(ack_path, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError as e:
+            logger.warning('could not acknowledge %s on %s: %s' % (result, ack_path, e))
+            return
+        try:
+            os.write(fd, ('%s\n' % result).encode('utf-8'))
+        finally:
+            os.close(fd)
+
+    def start_keeping_warm(self, interval=KEEP_WARM_INTERVAL_SECONDS):
+        """
+        Keep the session warm from a daemon thread.
+        :param interval: The number of seconds between keep warm requests.
+        :return: The thread.
+        """
+        def keep_warm_forever():
+            while True:
+                try:
+                    self.keep_warm()
+                except Exception:
+                    logger.exception('failed to keep session warm')
+                time.sleep(interval)
+
+        thread = threading.Thread(target=keep_warm_forever, name='keep-warm')
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def serve(self, fifo_path=DEFAULT_FIFO):
+        """
+        Serve failover requests written to the FIFO, forever.
+        :param fifo_path: The path of the FIFO. It is created if not present.
+        :return: None
+        """
+        if not os.path.exists(fifo_path):
+            os.mkfifo(fifo_path, 0o600)
+        logger.info('waiting for failover requests on %s' % fifo_path)
+        while True:
+            # opening the FIFO blocks until a notify script opens it for writing
+            with open(fifo_path) as fifo:
+                for message in fifo:
+                    self.handle(message)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--floating-ip-id", required=True, help="the id of the HA floating IP address")
+    parser.add_argument("--cloud", default=DEFAULT_CLOUD, help="the name of the cloud in clouds.yaml")
+    parser.add_argument("--fifo", default=DEFAULT_FIFO, help="the path of the FIFO to read failover requests from")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    cloud_config = load_cloud_config(args.cloud)
+    agent = FailoverAgent(
+        create_session(cloud_config),
+        args.floating_ip_id,
+        region_name=cloud_config.get('region_name'),
+        interface=cloud_config.get('interface', 'public'),
+    )
+    agent.keep_warm()  # authenticate up front, and fail fast if the configuration is wrong
+    agent.start_keeping_warm()
+    agent.serve(args.fifo)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+readiness.py
+
+Description: Probe hosts for SSH readiness, so that remote work starts on each host as soon as it is reachable.
+
+A server being ACTIVE does not mean that sshd is up. Rather than relying on full SSH connection attempts (each with
+a long timeout), a host is probed with a plain TCP connection, and is ready once it sends an SSH banner. The probe
+interval adapts to what is seen: while the host is unreachable the interval backs off, but once the host is up (the
+connection is refused, or accepted without a banner, while sshd starts) it is probed again quickly.
+
+"""
+
+import logging
+import socket
+import time
+
+READY = 'ready'
+REFUSED = 'refused'
+NO_BANNER = 'no_banner'
+UNREACHABLE = 'unreachable'
+
+DEFAULT_PORT = 22
+DEFAULT_PROBE_TIMEOUT_SECONDS = 2.0
+DEFAULT_TIMEOUT_SECONDS = 300
+DEFAULT_INITIAL_INTERVAL_SECONDS = 0.25
+DEFAULT_MAX_INTERVAL_SECONDS = 5.0
+
+logger = logging.getLogger(__name__)
+
+
+class NotReadyError(Exception):
+    pass
+
+
+def probe(host, port=DEFAULT_PORT, timeout=DEFAULT_PROBE_TIMEOUT_SECONDS):
+    """
+    Probe a host once for SSH readiness.
+    :param host: The host.
+    :param port: The SSH port. Defaults to 22.
+    :param timeout: The number of seconds to allow for the connection and the banner.
+    :return: READY if the host sent an SSH banner, REFUSED if the connection was refused, NO_BANNER if the
+             connection was accepted without a banner, and UNREACHABLE otherwise.
+    """
+    try:
+        sock = socket.create_connection((host, port), timeout=timeout)
+    except ConnectionRefusedError:
+        return REFUSED
+    except (socket.timeout, OSError):
+        return UNREACHABLE
+    try:
+        banner = sock.recv(255)
+    except (socket.timeout, OSError):
+        banner = b''
+    finally:
+        sock.close()
+    return READY if banner.startswith(b'SSH-') else NO_BANNER
+
+
+def wait_for_ssh(host, port=DEFAULT_PORT, timeout=DEFAULT_TIMEOUT_SECONDS,
+                 initial_interval=DEFAULT_INITIAL_INTERVAL_SECONDS, max_interval=DEFAULT_MAX_INTERVAL_SECONDS,
+                 probe_timeout=DEFAULT_PROBE_TIMEOUT_SECONDS):
+    """
+    Wait until a host is ready for SSH connections.
+    :param host: The host.
+    :param port: The SSH port. Defaults to 22.
+    :param timeout: The maximum number of seconds to wait.
+    :param initial_interval: The number of seconds between probes while the host is up but sshd is not yet ready.
+    :param max_interval: The maximum number of seconds between probes while the host is unreachable.
+    :param probe_timeout: The number of seconds to allow each probe.
+    :return: The number of seconds waited.
+    """
+    started = time.time()
+    deadline = started + timeout
+    interval = initial_interval
+    attempts = 0
+    while True:
+        attempts += 1
+        state = probe(host, port, timeout=min(probe_timeout, max(deadline - time.time(), 0.01)))
+        if state == READY:
+            waited = time.time() - started
+            logger.info('[%s] ready for SSH after %.1fs (%s probes)', host, waited, attempts)
+            return waited
+        # the host is up once it refuses or accepts connections, so sshd should be ready soon
+        interval = initial_interval if state in (REFUSED, NO_BANNER) else min(interval * 2, max_interval)
+        if time.time() + interval > deadline:
+            raise NotReadyError(
+                '%s not ready for SSH after %ss (%s probes, last %s)' % (host, timeout, attempts, state)
+            )
+        time.sleep(interval)
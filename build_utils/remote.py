@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+"""
+remote.py
+
+Description: Remote execution backends for fab_utils.py
+
+A backend hands out a session per host, and fab_utils performs its remote operations (run, sudo, put, cd) on the
+session. A session is scoped to one host and is not shared, so sessions on different hosts can be used from parallel
+threads. Two backends are provided:
+
+ - SSHBackend: runs commands over SSH using paramiko, wrapped as Fabric 1 wraps them (in a login shell, and with
+   sudo -S for root, on a pty), so that the remote commands of fab_utils behave as they did under Fabric. This is the
+   default.
+ - LocalBackend: executes into a per-host sandbox directory, recording the commands, round trips and bytes sent, with
+   optional injected latency, so that the remote side of a build can be tested and benchmarked offline.
+
+"""
+
+import collections
+import contextlib
+import io
+import logging
+import os
+import posixpath
+import re
+import shlex
+import socket
+import threading
+import time
+import uuid
+
+import paramiko
+
+from build_utils import readiness
+
+logger = logging.getLogger(__name__)
+
+SHELL = '/bin/bash -l -c'  # as Fabric's env.shell
+SUDO_PREFIX = "sudo -S -p 'sudo password:'"  # as Fabric's env.sudo_prefix
+
+
+class RemoteCommandError(Exception):
+
+    def __init__(self, host, command, result):
+        """
+        Construct a RemoteCommandError.
+        :param host: The host on which the command failed.
+        :param command: The command which failed.
+        :param result: The RemoteResult of the command.
+        """
+        super().__init__('%s failed on %s with return code %s: %s' % (command, host, result.return_code, result))
+        self.host = host
+        self.command = command
+        self.result = result
+
+
+class RemoteResult(str):
+    """
+    The output of a remote command, with its return code - like the result of Fabric's run / sudo.
+    """
+
+    def __new__(cls, output, return_code=0):
+        result = super().__new__(cls, output)
+        result.return_code = return_code
+        return result
+
+    @property
+    def failed(self):
+        return self.return_code != 0
+
+    @property
+    def succeeded(self):
+        return not self.failed
+
+
+class RemoteSession(object):
+
+    def __init__(self, host, user):
+        """
+        Construct a RemoteSession.
+        :param host: The host the session operates on.
+        :param user: The user the session logs in as.
+        """
+        self.host = host
+        self.user = user
+        self.cwd = None
+
+    @contextlib.contextmanager
+    def cd(self, path):
+        """
+        Run the commands and puts within the body of the with statement in the given directory.
+        :param path: The remote directory.
+        :return: None
+        """
+        previous_cwd = self.cwd
+        self.cwd = self.resolve(path)
+        try:
+            yield
+        finally:
+            self.cwd = previous_cwd
+
+    def resolve(self, path):
+        """
+        Resolve a remote path against the current directory.
+        :param path: The remote path.
+        :return: The resolved path, or the path unchanged if there is no current directory.
+        """
+        return posixpath.join(self.cwd, path) if self.cwd else path
+
+    def run(self, command, warn_only=False):
+        """
+        Run a command.
+        :param command: The command to run.
+        :param warn_only: If False (the default), a RemoteCommandError is raised if the command fails.
+        :return: The RemoteResult
+        """
+        return self.check(command, self.execute(command, use_sudo=False), warn_only)
+
+    def sudo(self, command, warn_only=False):
+        """
+        Run a command as root.
+        :param command: The command to run.
+        :param warn_only: If False (the default), a RemoteCommandError is raised if the command fails.
+        :return: The RemoteResult
+        """
+        return self.check(command, self.execute(command, use_sudo=True), warn_only)
+
+    def put(self, local, remote_path, use_sudo=False, mode=None):
+        """
+        Upload a file.
+        :param local: A local file path, or a file-like object.
+        :param remote_path: The remote path, which may be relative to the current directory.
+        :param use_sudo: Upload as root. Defaults to False.
+        :param mode: The file mode to set e.g. 0o600. Optional.
+        :return: None
+        """
+        raise NotImplementedError
+
+    def execute(self, command, use_sudo):
+        """
+        Execute a command. Implemented by each backend.
+        :param command: The command to execute.
+        :param use_sudo: Execute as root.
+        :return: The RemoteResult
+        """
+        raise NotImplementedError
+
+    def check(self, command, result, warn_only):
+        if result.failed and not warn_only:
+            raise RemoteCommandError(self.host, command, result)
+        return result
+
+
+class WarningHostKeyPolicy(paramiko.MissingHostKeyPolicy):
+    """
+    Accept the key of an unknown host, as Fabric does unless env.reject_unknown_hosts is set, but log a warning with
+    its fingerprint rather than accepting it silently.
+    """
+
+    def missing_host_key(self, client, hostname, key):
+        fingerprint = ':'.join('%02x' % x for x in bytearray(key.get_fingerprint()))
+        logger.warning('[%s] accepting unknown %s host key %s', hostname, key.get_name(), fingerprint)
+        client.get_host_keys().add(hostname, key.get_name(), key)
+
+
+class SSHSession(RemoteSession):
+
+    def __init__(self, host, user, backend):
+        super().__init__(host, user)
+        self.backend = backend
+
+    def wrap(self, command, use_sudo):
+        """
+        Wrap a command so that it runs in the current directory, in a login shell, and as root if required - as
+        Fabric's run and sudo do.
+        :param command: The command.
+        :param use_sudo: Run as root.
+        :return: The wrapped command.
+        """
+        if self.cwd:
+            command = 'cd %s && %s' % (shlex.quote(self.cwd), command)
+        for char in ('\\', '"', '$', '`'):
+            command = command.replace(char, '\\' + char)
+        command = '%s "%s"' % (SHELL, command)
+        if use_sudo:
+            command = '%s %s' % (SUDO_PREFIX, command)
+        return command
+
+    def execute(self, command, use_sudo):
+        logger.info('[%s] %s: %s', self.host, 'sudo' if use_sudo else 'run', command)
+        channel = self.backend.client(self.host).get_transport().open_session(timeout=self.backend.timeout)
+        try:
+            channel.get_pty()  # as Fabric, so stderr is combined with stdout
+            channel.exec_command(self.wrap(command, use_sudo))
+            channel.shutdown_write()  # there is nobody to answer a sudo password prompt
+            output = channel.makefile('rb').read().decode('utf-8', 'replace').replace('\r\n', '\n')
+            return_code = channel.recv_exit_status()
+        finally:
+            channel.close()
+        for line in output.splitlines():
+            logger.debug('[%s] out: %s', self.host, line)
+        return RemoteResult(output.strip(), return_code)
+
+    def put(self, local, remote_path, use_sudo=False, mode=None):
+        remote_path = self.resolve(remote_path)
+        logger.info('[%s] put: %s', self.host, remote_path)
+        # as root, upload to a temporary file and then move it into place
+        target = '/tmp/put-%s' % uuid.uuid4().hex if use_sudo else remote_path
+        sftp = self.backend.client(self.host).open_sftp()
+        try:
+            if hasattr(local, 'read'):
+                content = local.read()
+                sftp.putfo(io.BytesIO(content.encode('utf-8') if isinstance(content, str) else content), target)
+            else:
+                sftp.put(local, target)
+            if mode is not None and not use_sudo:
+                sftp.chmod(target, mode)
+        finally:
+            sftp.close()
+        if use_sudo:
+            self.sudo('mv %s %s' % (shlex.quote(target), shlex.quote(remote_path)))
+            if mode is not None:
+                self.sudo('chmod %o %s' % (mode, shlex.quote(remote_path)))
+
+
+class SSHBackend(object):
+
+    def __init__(self, user='ubuntu', connection_attempts=5, timeout=30, key_filename=None,
+                 reject_unknown_hosts=False):
+        """
+        Construct an SSHBackend, which runs commands over SSH using paramiko.
+        Nothing is shared between hosts other than the cache of connections, which is locked per host, so that
+        sessions on different hosts can be used from different threads.
+        :param user: The user to log in as. Defaults to ubuntu.
+        :param connection_attempts: The number of attempts to make to connect to each host. Defaults to 5.
+        :param timeout: The connection timeout in seconds. Defaults to 30.
+        :param key_filename: The private key file to log in with. Optional - the SSH agent and ~/.ssh keys are used.
+        :param reject_unknown_hosts: Only connect to hosts whose keys are in ~/.ssh/known_hosts. Defaults to False, in
+                                     which case the known hosts are not loaded (as with Fabric's disable_known_hosts,
+                                     since floating IP addresses are reused by new servers) and unknown host keys are
+                                     accepted with a warning.
+        """
+        self.user = user
+        self.connection_attempts = connection_attempts
+        self.timeout = timeout
+        self.key_filename = key_filename
+        self.reject_unknown_hosts = reject_unknown_hosts
+        self.lock = threading.Lock()
+        self.host_locks = collections.defaultdict(threading.Lock)
+        self.clients = dict()  # host: paramiko.SSHClient
+
+    def session(self, host):
+        return SSHSession(host, self.user, self)
+
+    def wait_until_ready(self, host, timeout):
+        """
+        Wait until a host is ready for SSH connections - see readiness.wait_for_ssh.
+        :param host: The host.
+        :param timeout: The maximum number of seconds to wait.
+        :return: The number of seconds waited.
+        """
+        return readiness.wait_for_ssh(host, timeout=timeout)
+
+    def client(self, host):
+        """
+        Get the (cached) connection to a host, connecting if there is not one.
+        :param host: The host.
+        :return: A paramiko.SSHClient
+        """
+        with self.lock:
+            host_lock = self.host_locks[host]
+        with host_lock:
+            client = self.clients.get(host)
+            if client is None or not client.get_transport() or not client.get_transport().is_active():
+                client = self.connect(host)
+                self.clients[host] = client
+            return client
+
+    def connect(self, host):
+        """
+        Connect to a host, making up to connection_attempts attempts.
+        :param host: The host.
+        :return: A paramiko.SSHClient
+        """
+        for attempt in range(1, self.connection_attempts + 1):
+            client = paramiko.SSHClient()
+            if self.reject_unknown_hosts:
+                client.load_system_host_keys()
+                client.set_missing_host_key_policy(paramiko.RejectPolicy())
+            else:
+                client.set_missing_host_key_policy(WarningHostKeyPolicy())
+            try:
+                client.connect(host, username=self.user, timeout=self.timeout, key_filename=self.key_filename)
+                return client
+            except (socket.error, paramiko.SSHException) as e:
+                client.close()
+                if attempt == self.connection_attempts:
+                    raise
+                logger.warning(
+                    '[%s] connection attempt %s of %s failed: %s', host, attempt, self.connection_attempts, e
+                )
+
+    def close(self):
+        """
+        Close the cached connections.
+        :return: None
+        """
+        with self.lock:
+            clients, self.clients = self.clients, dict()
+        for client in clients.values():
+            client.close()
+
+
+class LocalSession(RemoteSession):
+
+    def __init__(self, host, user, backend):
+        super().__init__(host, user)
+        self.backend = backend
+        self.sandbox = os.path.join(backend.root, host)
+
+    def execute(self, command, use_sudo):
+        self.backend.round_trip(self.host, command=dict(command=command, sudo=use_sudo, cwd=self.cwd))
+        for (pattern, output, return_code) in self.backend.responses:
+            if re.search(pattern, command):
+                return RemoteResult(output, return_code)
+        return RemoteResult('', 0)
+
+    def put(self, local, remote_path, use_sudo=False, mode=None):
+        if hasattr(local, 'read'):
+            content = local.read()
+        else:
+            with open(local, 'rb') as local_file:
+                content = local_file.read()
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        remote_path = self.resolve(remote_path)
+        self.backend.round_trip(self.host, put=dict(path=remote_path, sudo=use_sudo, mode=mode), size=len(content))
+        sandbox_path = os.path.join(self.sandbox, remote_path.lstrip('/'))
+        os.makedirs(os.path.dirname(sandbox_path), exist_ok=True)
+        with open(sandbox_path, 'wb') as sandbox_file:
+            sandbox_file.write(content)
+        if mode is not None:
+            os.chmod(sandbox_path, mode)
+
+
+class LocalBackend(object):
+
+    def __init__(self, root, user='ubuntu', latency=0.0, responses=None):
+        """
+        Construct a LocalBackend, which executes into a sandbox directory per host, under root.
+        Files put are written to the sandbox e.g. /srv/pillar/haproxy.sls on 10.0.0.1 is written to
+        <root>/10.0.0.1/srv/pillar/haproxy.sls. Commands are recorded, but not run.
+        :param root: The root directory of the sandboxes.
+        :param user: The user the sessions log in as. Defaults to ubuntu.
+        :param latency: The number of seconds by which to delay each round trip. Defaults to 0.
+        :param responses: A list of (regular expression, output, return code) tuples. Commands matching the regular
+                          expression return the output and return code. Other commands succeed with no output.
+        """
+        self.root = root
+        self.user = user
+        self.latency = latency
+        self.responses = list(responses or [])
+        self.lock = threading.Lock()
+        self.commands = collections.defaultdict(list)  # host: [dict(command, sudo, cwd)]
+        self.puts = collections.defaultdict(list)  # host: [dict(path, sudo, mode)]
+        self.round_trips = collections.Counter()  # host: count
+        self.bytes_sent = collections.Counter()  # host: bytes
+
+    def session(self, host):
+        return LocalSession(host, self.user, self)
+
+    def wait_until_ready(self, host, timeout):
+        """
+        Sandboxes are always ready.
+        :param host: The host.
+        :param timeout: The maximum number of seconds to wait.
+        :return: The number of seconds waited.
+        """
+        return 0.0
+
+    def round_trip(self, host, command=None, put=None, size=0):
+        """
+        Record (and delay) a round trip to a host.
+        :param host: The host.
+        :param command: The command dict, if a command was run.
+        :param put: The put dict, if a file was put.
+        :param size: The number of bytes sent, in addition to the command.
+        :return: None
+        """
+        with self.lock:
+            self.round_trips[host] += 1
+            if command:
+                self.commands[host].append(command)
+                size += len(command['command'].encode('utf-8'))
+            if put:
+                self.puts[host].append(put)
+            self.bytes_sent[host] += size
+        if self.latency:
+            time.sleep(self.latency)
+
+    def read(self, host, remote_path):
+        """
+        Read a file which has been put to a host.
+        :param host: The host.
+        :param remote_path: The absolute remote path.
+        :return: String containing the file content.
+        """
+        with io.open(os.path.join(self.root, host, remote_path.lstrip('/')), encoding='utf-8') as sandbox_file:
+            return sandbox_file.read()
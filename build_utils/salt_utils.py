@@ -36,3 +36,18 @@ def generate_openstack_conf(params):
     )
     openstack_conf = io.StringIO(yaml.dump(openstack_conf_data, default_flow_style=False))
     return openstack_conf
+
+
+def parse_txt_output(output):
+    """
+    Parse the output of a salt command run with --out=txt into a dict of minion id to returned value.
+    Each line of txt output has the form '<minion id>: <value>'. Lines which do not have this form are ignored.
+    :param output: The output of the salt command (string).
+    :return: A dict of minion id to returned value (string).
+    """
+    returned = dict()
+    for line in output.splitlines():
+        minion_id, separator, value = line.partition(':')
+        if separator and minion_id.strip():
+            returned[minion_id.strip()] = value.strip()
+    return returned
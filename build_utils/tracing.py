@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+tracing.py
+
+Description: Record timed spans for build.py et al, and export them as a Chrome trace.
+
+The exported JSON file can be loaded into chrome://tracing or https://ui.perfetto.dev to see where a build or destroy
+run spends its time.
+
+"""
+
+import contextlib
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+
+
+class Span(object):
+
+    def __init__(self, name, category, host=None, resource=None):
+        """
+        Construct a Span.
+        :param name: The name of the span e.g. the function name.
+        :param category: The category of the span e.g. phase, facade, fab
+        :param host: The host the span relates to. Optional.
+        :param resource: The resource the span relates to. Optional.
+        """
+        self.name = name
+        self.category = category
+        self.host = host
+        self.resource = resource
+        self.thread_id = threading.get_ident()
+        self.thread_name = threading.current_thread().name
+        self.start = None
+        self.end = None
+        self.outcome = None
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+
+class Tracer(object):
+
+    def __init__(self):
+        """
+        Construct a Tracer.
+        """
+        self.spans = []
+        self.lock = threading.Lock()
+        self.origin = time.time()
+
+    @contextlib.contextmanager
+    def span(self, name, category, host=None, resource=None):
+        """
+        Record a span around the body of the with statement.
+        The outcome is 'ok', or the name of the exception raised from the body (which is re-raised).
+        :param name: The name of the span.
+        :param category: The category of the span.
+        :param host: The host the span relates to. Optional.
+        :param resource: The resource the span relates to. Optional.
+        :return: The span
+        """
+        span = Span(name, category, host=host, resource=resource)
+        span.start = time.time()
+        try:
+            yield span
+            span.outcome = 'ok'
+        except BaseException as e:
+            span.outcome = type(e).__name__
+            raise
+        finally:
+            span.end = time.time()
+            with self.lock:
+                self.spans.append(span)
+
+    def instrument_function(self, func, category, name=None):
+        """
+        Wrap a function so that each call to it is recorded as a span.
+        The host and resource of the span are taken from the arguments - see describe_call.
+        :param func: The function to wrap.
+        :param category: The category of the spans.
+        :param name: The name of the spans. Defaults to the function name.
+        :return: The wrapped function.
+        """
+        span_name = name or func.__name__
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            host, resource = describe_call(signature, args, kwargs)
+            with self.span(span_name, category, host=host, resource=resource):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    def instrument_module(self, module, category):
+        """
+        Record every call to the public functions defined in a module e.g. fab_utils.
+        :param module: The module.
+        :param category: The category of the spans.
+        :return: None
+        """
+        for name, func in inspect.getmembers(module, inspect.isfunction):
+            if not name.startswith('_') and func.__module__ == module.__name__:
+                setattr(module, name, self.instrument_function(func, category, name='%s.%s' % (category, name)))
+
+    def instrument_object(self, obj, category, exclude=()):
+        """
+        Record every call to the public methods of an object e.g. an OpenStackFacade.
+        The wrapped methods are set on the object itself, so that calls between methods are also recorded.
+        Generator methods (e.g. OpenStackFacade.paginate) are not recorded, as a call only creates the generator,
+        which does its work as it is consumed - by a recorded method.
+        :param obj: The object.
+        :param category: The category of the spans.
+        :param exclude: The names of methods not to record.
+        :return: None
+        """
+        for name, method in inspect.getmembers(obj, inspect.ismethod):
+            if not name.startswith('_') and name not in exclude and not inspect.isgeneratorfunction(method):
+                setattr(obj, name, self.instrument_function(method, category, name='%s.%s' % (category, name)))
+
+    def to_chrome_trace(self):
+        """
+        Return the recorded spans in Chrome trace event format.
+        :return: The trace dict.
+        """
+        pid = os.getpid()
+        with self.lock:
+            spans = sorted(self.spans, key=lambda x: x.start)
+        events = []
+        for thread_id, thread_name in sorted({(x.thread_id, x.thread_name) for x in spans}):
+            events.append(dict(name='thread_name', ph='M', pid=pid, tid=thread_id, args=dict(name=thread_name)))
+        for span in spans:
+            events.append(
+                dict(
+                    name=span.name,
+                    cat=span.category,
+                    ph='X',
+                    ts=int((span.start - self.origin) * 1000000),
+                    dur=int(span.duration * 1000000),
+                    pid=pid,
+                    tid=span.thread_id,
+                    args=dict(host=span.host, resource=span.resource, outcome=span.outcome),
+                )
+            )
+        return dict(traceEvents=events, displayTimeUnit='ms')
+
+    def export_chrome_trace(self, path):
+        """
+        Write the recorded spans to a file in Chrome trace event format.
+        :param path: The path of the file to write.
+        :return: None
+        """
+        with open(path, 'w') as trace_file:
+            json.dump(self.to_chrome_trace(), trace_file)
+
+
+def describe_call(signature, args, kwargs):
+    """
+    Describe the host and resource a call relates to, from its arguments.
+     - The host is the first argument named host, or ending in _address e.g. salt_master_address.
+     - The resource is the first argument named name, or ending in _name e.g. server_name. Failing that, it is the
+       name of the first argument which has one e.g. a server or network.
+    :param signature: The inspect.Signature of the function called.
+    :param args: The positional arguments.
+    :param kwargs: The keyword arguments.
+    :return: The host and resource, either of which may be None.
+    """
+    try:
+        arguments = signature.bind_partial(*args, **kwargs).arguments
+    except TypeError:
+        return None, None
+    host = next(
+        (v for (k, v) in arguments.items() if (k == 'host' or k.endswith('_address')) and isinstance(v, str)), None
+    )
+    resource = next(
+        (v for (k, v) in arguments.items() if (k == 'name' or k.endswith('_name')) and isinstance(v, str)), None
+    )
+    if resource is None:
+        resource = next(
+            (getattr(v, 'name') for v in arguments.values() if isinstance(getattr(v, 'name', None), str)), None
+        )
+    return host, resource
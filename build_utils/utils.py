@@ -8,9 +8,11 @@ Written by:  maharg101 on 25th February 2018
 
 import os
 import re
+import shlex
 
 ID_ALLOWED_PATTERN = re.compile('[^\w -]')  # we'll allow alphanumeric, underscore, dash, space
 TO_DASH_PATTERN = re.compile('[ _]')  # spaces and underscores are replaced with dashes
+STEP_MARKER = '@@step'  # prefixes the result lines written by scripts rendered by render_step_script
 
 
 def populate_params_from_constructor_args(params):
@@ -71,4 +73,78 @@ def construct_server_name(params, server_name_prefix):
     :param server_name_prefix: A string prefix to apply to the server base name
     :return: Server name string
     """
-    return '%s-%s' % (str(server_name_prefix), params['server_base_name'])
\ No newline at end of file
+    return '%s-%s' % (str(server_name_prefix), params['server_base_name'])
+
+
+def construct_server_name_pattern(params, server_name_prefix):
+    """
+    Construct a compiled regular expression which matches numbered server names for the given prefix
+    e.g. app-0-hello-world-dev, app-1-hello-world-dev. The server number is captured by the first group.
+    :param params: The params dict containing the server base name
+    :param server_name_prefix: The string prefix which precedes the server number
+    :return: Compiled regular expression
+    """
+    return re.compile(r'^%s-(\d+)-%s$' % (re.escape(str(server_name_prefix)), re.escape(params['server_base_name'])))
+
+
+def calculate_quota_shortfall(demand, usage):
+    """
+    Calculate which quotas the demand of an environment would exceed.
+    :param demand: A dict of resource to the amount required e.g. dict(instances=5, ram=10240)
+    :param usage: A dict of resource to a dict containing its limit (-1 if unlimited) and the amount used.
+    :return: A list of dicts, each containing the resource, demand, limit, used, available and shortfall, for each
+             resource whose demand exceeds what is available.
+    """
+    shortfall = []
+    for resource in sorted(demand):
+        limit, used = usage[resource]['limit'], usage[resource]['used']
+        if limit < 0:
+            continue  # unlimited
+        available = max(limit - used, 0)
+        if demand[resource] > available:
+            shortfall.append(
+                dict(resource=resource, demand=demand[resource], limit=limit, used=used, available=available,
+                     shortfall=demand[resource] - available)
+            )
+    return shortfall
+
+
+def render_step_script(name, steps):
+    """
+    Render a list of steps as a single bash script, so that they can be run with one remote invocation.
+    Each step runs in its own subshell. A marker line with the exit code and start / end times is written after each
+    step (see parse_step_script_output), and the script stops at the first step which fails, with its exit code.
+    :param name: The name of the script, written as a comment.
+    :param steps: A list of (step name, command) tuples. Step names must not contain whitespace.
+    :return: String containing the script
+    """
+    lines = [
+        '#!/bin/bash',
+        '# %s' % name,
+        'run_step() {',
+        '    local started=$(date +%s.%N)',
+        '    (eval "$2") < /dev/null',  # the script itself may be being read from stdin
+        '    local return_code=$?',
+        '    echo "%s $1 $return_code $started $(date +%%s.%%N)"' % STEP_MARKER,
+        '    return $return_code',
+        '}',
+    ]
+    for (step_name, command) in steps:
+        lines.append('run_step %s %s || exit $?' % (step_name, shlex.quote(command)))
+    return '\n'.join(lines) + '\n'
+
+
+def parse_step_script_output(output):
+    """
+    Parse the output of a script rendered by render_step_script into the results of the steps which ran.
+    :param output: The output of the script (string).
+    :return: A list of dicts, each with the step name, return_code and seconds taken, in the order the steps ran.
+    """
+    results = []
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) == 5 and fields[0] == STEP_MARKER:
+            results.append(
+                dict(name=fields[1], return_code=int(fields[2]), seconds=float(fields[4]) - float(fields[3]))
+            )
+    return results
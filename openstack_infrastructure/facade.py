@@ -9,32 +9,118 @@ Related links:
  - https://docs.openstack.org/python-openstacksdk/latest/user/
 """
 
+import collections
+import contextlib
 import os
 import ipaddress
 import pprint
+import threading
 import time
 
 from openstack import connection, exceptions
+from openstack_infrastructure import middleware
 
 pp = pprint.PrettyPrinter(indent=4)
 
+FLOATING_IP_POOL_DESCRIPTION = 'build.py floating IP pool'
+DEFAULT_PAGE_SIZE = 100
+TAG_PREFIX = 'gdl100'  # e.g. the neutron or nova tag gdl100:environment=dev
+MANAGED_TAG = TAG_PREFIX  # carried by every resource tagged by this tool, so that untagged ones can be filtered for
+SERVER_TAGS_MICROVERSION = '2.26'  # the first compute API microversion with server tags
+
+
+def format_floating_ip_pool_stats(stats):
+    """
+    Format floating IP pool statistics for display.
+    :param stats: A Counter of hits, misses and returned e.g. OpenStackFacade.floating_ip_pool_stats
+    :return: A string.
+    """
+    claims = stats['hits'] + stats['misses']
+    return 'floating IP pool: %s hits, %s misses (%.0f%% hit rate), %s returned' % (
+        stats['hits'], stats['misses'], 100.0 * stats['hits'] / claims if claims else 0.0, stats['returned']
+    )
+
+
+def format_tags(tags):
+    """
+    Format tags as the neutron or nova tags of a resource, preceded by MANAGED_TAG.
+    :param tags: A dict of tag name to value e.g. dict(app='blog', environment='dev', role='network')
+    :return: A list of tags e.g. ['gdl100', 'gdl100:app=blog', 'gdl100:environment=dev', 'gdl100:role=network'], or
+             an empty list if there are no tags.
+    """
+    if not tags:
+        return []
+    return [MANAGED_TAG] + sorted('%s:%s=%s' % (TAG_PREFIX, name, value) for (name, value) in tags.items())
+
+
+def parse_tags(resource):
+    """
+    Return the tags which this tool has set on a resource (a network resource or a server).
+    :param resource: The resource e.g. a port or a server.
+    :return: A dict of tag name to value, which is empty if the resource has not been tagged.
+    """
+    prefix = '%s:' % TAG_PREFIX
+    return dict(
+        x[len(prefix):].split('=', 1)
+        for x in getattr(resource, 'tags', None) or [] if x.startswith(prefix) and '=' in x
+    )
+
+
+def is_pooled_floating_ip(floating_ip):
+    """
+    Return True if a floating IP address is in the pool i.e. it was returned to the pool (which sets its description),
+    it is not associated, and it is tagged for no environment. The HA address of an environment is tagged for it, so is
+    never taken for a pooled address, even while it is disassociated during a failover.
+    :param floating_ip: The floating IP object.
+    :return: Boolean
+    """
+    return floating_ip.description == FLOATING_IP_POOL_DESCRIPTION and not floating_ip.port_id and not parse_tags(
+        floating_ip
+    )
+
+
+def is_tagged(resource, tags):
+    """
+    Return True if the resource carries all of the given tags.
+    :param resource: The resource e.g. a port or a server.
+    :param tags: A dict of tag name to value.
+    :return: True or False
+    """
+    resource_tags = parse_tags(resource)
+    return all(resource_tags.get(name) == str(value) for (name, value) in tags.items())
+
 
 class OpenStackFacade(object):
 
-    def __init__(self, conn=None, silent=True):
+    # claims from the floating IP pool are serialised across the facades of a process e.g. in batch.py
+    _floating_ip_pool_lock = threading.Lock()
+
+    def __init__(self, conn=None, silent=True, recycle_floating_ips=False, page_size=DEFAULT_PAGE_SIZE):
         """
         Construct an OpenStackFacade.
 
         :param conn: An optional OpenStack SDK connection.Connection object. Connection details are taken from the
                      environment if conn is not supplied.
         :param silent: Output will be displayed if set to False. Defaults to True.
+        :param recycle_floating_ips: Floating IP addresses are returned to a pool when servers are deleted, rather than
+                                     released, if set to True. The pool is always claimed from before an address is
+                                     allocated. Defaults to False.
+        :param page_size: The number of resources requested per page by listing calls - see paginate.
+
+        The resources created are tagged with the tags of the tag context (none by default) - see set_tag_context.
         """
         if not conn:
             self.conn = self.create_connection_from_environ()
         else:
             self.conn = conn
+        self.silent = False
         if silent:
             self.silent_mode()
+        self.recycle_floating_ips = recycle_floating_ips
+        self.floating_ip_pool_stats = collections.Counter(hits=0, misses=0, returned=0)
+        self.page_size = page_size
+        self.tags = dict()
+        self._tag_context = threading.local()
 
     # --------------------- Connection methods ---------------------
 
@@ -57,32 +143,163 @@ class OpenStackFacade(object):
             compute_api_version='2',
             identity_interface='internal',
         )
+        conn.compute.default_microversion = SERVER_TAGS_MICROVERSION  # so that servers are listed with their tags
         return conn
 
+    # --------------------- Listing methods ---------------------
+
+    @middleware.pass_through
+    def paginate(self, listing, predicate=None, limit=None, **query):
+        """
+        Iterate over the resources returned by a listing call, a page of page_size resources at a time.
+        Pages are only requested as the resources are consumed, and no more are requested once limit resources have
+        matched (or the caller stops consuming), so memory use and the size of the responses stay bounded however
+        many resources there are. Filter on the server side with query wherever the API allows it.
+        :param listing: The SDK listing method e.g. self.conn.network.ports
+        :param predicate: An optional function which returns True for the resources to include.
+        :param limit: The maximum number of resources to return e.g. 1 to stop at the first match.
+        :param query: Query parameters to pass to the listing call e.g. network_id=network.id
+        :return: A generator of the matching resources.
+        """
+        if limit is not None and limit <= 0:
+            return
+        matched = 0
+        for resource in listing(limit=self.page_size, **query):
+            if predicate is None or predicate(resource):
+                yield resource
+                matched += 1
+                if matched == limit:
+                    return
+
+    @middleware.pass_through
+    def paginate_tagged(self, listing, tags, predicate=None, limit=None, **query):
+        """
+        Iterate over the resources tagged with all of the given tags, and then over the untagged resources (e.g. those
+        built by earlier versions of this tool), filtering on the tags on the server side. Both neutron and nova
+        (from microversion 2.26) accept the tags filters. A resource tagged for another environment is never listed.
+        :param listing: The SDK listing method e.g. self.conn.network.routers
+        :param tags: A dict of tag name to value e.g. dict(app='blog', environment='dev'). If empty, the resources are
+                     listed whatever their tags.
+        :param predicate: An optional function which returns True for the resources to include.
+        :param limit: The maximum number of resources to return e.g. 1 to stop at the first match.
+        :param query: Other query parameters to pass to the listing call e.g. name='router-blog-dev'
+        :return: A generator of the matching resources - see paginate.
+        """
+        if not tags:
+            yield from self.paginate(listing, predicate, limit, **query)
+            return
+        matched = 0
+        for tag_query in (dict(tags=','.join(format_tags(tags))), dict(not_any_tags=MANAGED_TAG)):
+            for resource in self.paginate(listing, predicate, None if limit is None else limit - matched,
+                                          **dict(query, **tag_query)):
+                yield resource
+                matched += 1
+
+    @middleware.pass_through
+    def find_tagged(self, listing, name, tags=None, **query):
+        """
+        Find a resource by name, among those tagged with the given tags or untagged - see paginate_tagged.
+        :param listing: The SDK listing method e.g. self.conn.network.routers
+        :param name: The name of the resource. It is matched exactly, as nova treats a name filter as a pattern.
+        :param tags: A dict of tag name to value. Defaults to the tags set by set_tag_context (i.e. the app and
+                     environment, whatever the role).
+        :param query: Other query parameters to pass to the listing call.
+        :return: The resource, or None if not found.
+        """
+        tags = self.tags if tags is None else tags
+        return next(self.paginate_tagged(
+            listing, tags, predicate=lambda resource: resource.name == name, limit=1, name=name, **query
+        ), None)
+
+    # --------------------- Tagging methods ---------------------
+
+    def set_tag_context(self, **tags):
+        """
+        Set the tags of every resource this facade creates from now on e.g. app='blog', environment='dev'
+        :param tags: The tag names and values.
+        :return: None
+        """
+        self.tags = tags
+
+    @contextlib.contextmanager
+    def tag_context(self, **tags):
+        """
+        Add tags to those of the resources created within the context, by the current thread only e.g.
+
+            with os_facade.tag_context(role='app'):
+                os_facade.find_or_create_server(...)
+
+        :param tags: The tag names and values to add.
+        :return: A context manager.
+        """
+        outer_tags = getattr(self._tag_context, 'tags', dict())
+        self._tag_context.tags = dict(outer_tags, **tags)
+        try:
+            yield
+        finally:
+            self._tag_context.tags = outer_tags
+
+    def current_tags(self):
+        """
+        Return the tags of the resources created by the current thread, right now.
+        :return: A dict of tag name to value.
+        """
+        return dict(self.tags, **getattr(self._tag_context, 'tags', dict()))
+
+    def tag_resource(self, resource, tags=None):
+        """
+        Set the neutron tags of a network resource (e.g. a port), replacing any it already has.
+        :param resource: The network resource to tag.
+        :param tags: A dict of tag name to value, which may be empty to remove the tags. Defaults to the current tags,
+                     in which case nothing is set if there are none.
+        :return: None
+        """
+        if tags is None:
+            tags = self.current_tags()
+            if not tags:
+                return
+        self.conn.network.set_tags(resource, format_tags(tags))
+
+    def tag_server(self, server, tags=None):
+        """
+        Set the (nova) tags of a server, replacing any it already has - see tag_resource.
+        :param server: The server to tag.
+        :param tags: A dict of tag name to value, which may be empty to remove the tags. Defaults to the current tags,
+                     in which case nothing is set if there are none.
+        :return: None
+        """
+        if tags is None:
+            tags = self.current_tags()
+            if not tags:
+                return
+        response = self.conn.compute.put(
+            '/servers/%s/tags' % server.id, json=dict(tags=format_tags(tags)), microversion=SERVER_TAGS_MICROVERSION
+        )
+        exceptions.raise_from_response(response)
+
     # --------------------- Display methods ---------------------
 
-    @staticmethod
-    def silent_mode():
+    def silent_mode(self):
         """
-        Run in silent mode.
+        Run in silent mode. This only affects this facade, so that facades used from other threads are unaffected.
         :return:
         """
-        __class__.display = lambda *args, **kwargs: None
+        self.silent = True
 
-    @staticmethod
-    def display(label, data=None):
+    def display(self, label, data=None):
         """
         Display a label and, optionally, some data
+        The output is written with a single print, so that output from facades in different threads is not interleaved.
         :param label: A short textual label for the data
         :param data: The data to be displayed. Typically a single, or list of objects. Optional.
         :return:
         """
-        print()
-        print(label)
+        if self.silent:
+            return
+        lines = ['', label]
         if data:
-            print('-' * len(label))
-            pp.pprint(data)
-        print()
+            lines.extend(['-' * len(label), pp.pformat(data)])
+        print('\n'.join(lines) + '\n')
 
     # --------------------- Build methods ---------------------
 
@@ -102,7 +319,7 @@ class OpenStackFacade(object):
         :param router_name: The name of the router to find or create.
         :return: The found or created router
         """
-        existing_router = self.conn.network.find_router(router_name)
+        existing_router = self.find_tagged(self.conn.network.routers, router_name)
     
         if existing_router:
             self.display('router %s found' % router_name, existing_router)
@@ -112,6 +329,7 @@ class OpenStackFacade(object):
         router = self.conn.network.create_router(
             name=router_name, external_gateway_info=dict(network_id=public_network.id)
         )
+        self.tag_resource(router)
         self.display('router %s created' % router_name, router)
         return router
     
@@ -126,17 +344,18 @@ class OpenStackFacade(object):
         :param network_name: The name of the network to find or create.
         :return: The found or created network.
         """
-        existing_network = self.conn.network.find_network(network_name)
+        existing_network = self.find_tagged(self.conn.network.networks, network_name)
     
         if existing_network:
             self.display('network %s found' % network_name, existing_network)
             return existing_network
     
         network = self.conn.network.create_network(name=network_name)
+        self.tag_resource(network)
         self.display('network %s created' % network_name, network)
         return network
 
-    def find_or_create_subnet(self, subnet_name, network):
+    def find_or_create_subnet(self, subnet_name, network, cidr='10.0.0.0/24'):
         """
         Find or create the named subnet.
     
@@ -146,9 +365,10 @@ class OpenStackFacade(object):
     
         :param subnet_name: The name of the subnet to find or create.
         :param network: The related network.
+        :param cidr: The CIDR of the subnet to create. Defaults to 10.0.0.0/24
         :return:
         """
-        existing_subnet = self.conn.network.find_subnet(subnet_name)
+        existing_subnet = self.find_tagged(self.conn.network.subnets, subnet_name)
     
         if existing_subnet:
             self.display('subnet %s found' % subnet_name, existing_subnet)
@@ -156,12 +376,13 @@ class OpenStackFacade(object):
     
         subnet = self.conn.network.create_subnet(
             name=subnet_name,
-            cidr='10.0.0.0/24',
+            cidr=cidr,
             ip_version=4,
             network_id=network.id,
             is_dhcp_enabled=True,
             dns_nameservers=['8.8.8.8'],
         )
+        self.tag_resource(subnet)
         self.display('subnet %s created' % subnet_name, subnet)
         return subnet
 
@@ -178,36 +399,32 @@ class OpenStackFacade(object):
         :param subnet: The subnet which has the fixed IP address.
         :return: The Port
         """
-        all_ports = self.conn.network.ports()
-    
-        # find ports on the correct network AND subnet
-        ports_on_network_and_subnet = [
-            port for port in all_ports if
-            port.network_id == network.id and
-            [
-                fixed_ip for fixed_ip in port.fixed_ips if
-                fixed_ip['subnet_id'] == subnet.id
-            ]
-        ]
+        # find the first port on the correct network AND subnet
+        existing_port = next(self.paginate_tagged(
+            self.conn.network.ports,
+            self.tags,
+            predicate=lambda port: any(fixed_ip['subnet_id'] == subnet.id for fixed_ip in port.fixed_ips),
+            limit=1,  # TODO - can there be more than one ?
+            network_id=network.id,
+        ), None)
     
-        if ports_on_network_and_subnet:
-            existing_port = ports_on_network_and_subnet[0]  # TODO - can there be more than one ?
+        if existing_port:
             self.display('port found', existing_port)
             return existing_port
     
         default_security_group = self.conn.network.find_security_group('default')
         port = self.conn.network.create_port(network_id=network.id, security_groups=[str(default_security_group.id)])
+        self.tag_resource(port)
         self.display('port created', port)
         return port
 
     def get_ports_for_server(self, server):
         """
-        Returns a list of ports for a given server.
+        Returns the ports for a given server.
         :param server: The server for which to return ports
-        :return: A list of ports.
+        :return: A generator of ports.
         """
-        ports = self.conn.network.ports(device_id=server.id)
-        return ports
+        yield from self.paginate(self.conn.network.ports, device_id=server.id)
 
     def add_interface_to_router(self, router, subnet, port):
         """
@@ -235,6 +452,8 @@ class OpenStackFacade(object):
           is a minimal viable approach to facilitate the learning process.
     
         - When the server is created, a floating IP address is reserved and attached to it.
+
+        - The server is tagged with the current tags as soon as it is created - see tag_context.
     
         :param server_name: The name of the server
         :param network: The network to create the server on
@@ -244,12 +463,11 @@ class OpenStackFacade(object):
         :param flavor_name: The name of the flavor to use. Defaults to m1.small.
         :return: The server, and its public IP address
         """
-        pre_existing_server = self.conn.compute.find_server(server_name)
+        pre_existing_server = self.find_tagged(self.conn.compute.servers, server_name)
     
         if pre_existing_server:
-            server = self.conn.compute.get_server(pre_existing_server.id)
-            self.display('server %s found' % server_name, server)
-            return server
+            self.display('server %s found' % server_name, pre_existing_server)
+            return pre_existing_server
 
         image = self.get_image(image_name)
         flavor = self.get_flavor(flavor_name)
@@ -262,6 +480,7 @@ class OpenStackFacade(object):
         )
         self.set_key_pair_name(server_params)
         server = self.conn.compute.create_server(**server_params)
+        self.tag_server(server)
         self.conn.compute.wait_for_server(server, status='ACTIVE', wait=300)
         self.assign_floating_ip(network, port, server, subnet)
         created_server = self.conn.compute.get_server(server.id)
@@ -280,23 +499,77 @@ class OpenStackFacade(object):
         """
         fixed_ip_address = server.addresses[network.name][0]['addr']
         public_network = self.conn.network.find_network('public')
-        floating_ip = self.conn.network.create_ip(
-            floating_network_id=public_network.id,
-            port_id=port.id,
-            subnet_id=subnet.id,
-            fixed_ip_address=fixed_ip_address,
-        )
+        floating_ip = self.claim_pooled_floating_ip(public_network, port, fixed_ip_address)
+        if floating_ip is None:
+            floating_ip = self.conn.network.create_ip(
+                floating_network_id=public_network.id,
+                port_id=port.id,
+                subnet_id=subnet.id,
+                fixed_ip_address=fixed_ip_address,
+            )
+        self.tag_resource(floating_ip)
         self.conn.compute.add_floating_ip_to_server(server, floating_ip.floating_ip_address)
         return floating_ip
 
+    def get_pooled_floating_ips(self, public_network):
+        """
+        Return the floating IP addresses in the pool i.e. those allocated by this tool which are not associated.
+        :param public_network: The public network which the addresses are allocated from.
+        :return: A list of floating IP objects.
+        """
+        return list(self.iterate_pooled_floating_ips(public_network))
+
+    @middleware.pass_through
+    def iterate_pooled_floating_ips(self, public_network):
+        """
+        Iterate over the floating IP addresses in the pool, a page at a time - see get_pooled_floating_ips.
+        Only addresses returned to the pool carry its description, so the listing is bounded by the size of the pool.
+        :param public_network: The public network which the addresses are allocated from.
+        :return: A generator of floating IP objects.
+        """
+        return self.paginate(
+            self.conn.network.ips,
+            predicate=is_pooled_floating_ip,
+            floating_network_id=public_network.id,
+            description=FLOATING_IP_POOL_DESCRIPTION,
+        )
+
+    def claim_pooled_floating_ip(self, public_network, port, fixed_ip_address):
+        """
+        Claim a floating IP address from the pool, by associating it with the port and clearing the pool description
+        in the same update. It is tagged afresh by the caller.
+        Neutron would simply move an address claimed by another process in the meantime, so the update is a
+        compare-and-swap on the revision number listed: it fails with 412 Precondition Failed if the address has
+        changed since, and the next address is tried.
+        :param public_network: The public network which the addresses are allocated from.
+        :param port: The port which the floating IP address will be attached to
+        :param fixed_ip_address: The fixed IP address which the floating IP address will be attached to
+        :return: The floating IP object, or None if the pool is empty.
+        """
+        with self._floating_ip_pool_lock:
+            for floating_ip in self.iterate_pooled_floating_ips(public_network):
+                response = self.conn.network.put(
+                    '/floatingips/%s' % floating_ip.id,
+                    json=dict(floatingip=dict(port_id=port.id, fixed_ip_address=fixed_ip_address, description='')),
+                    headers={'If-Match': 'revision_number=%s' % floating_ip.revision_number},
+                )
+                if response.status_code == 412:
+                    continue  # claimed (or otherwise changed) by another process since it was listed
+                exceptions.raise_from_response(response)
+                floating_ip = self.conn.network.get_ip(floating_ip.id)
+                self.display('claimed floating IP address %s from the pool' % floating_ip.floating_ip_address)
+                self.floating_ip_pool_stats['hits'] += 1
+                return floating_ip
+            self.floating_ip_pool_stats['misses'] += 1
+
     def get_name_of_first_key_pair(self):
         """
         Return the name of the first key pair found, or None.
         :return: The name of the first key pair found, or None.
         """
-        key_pairs = list(self.conn.compute.keypairs())
-        if key_pairs:
-            return key_pairs[0].name
+        key_pair = next(self.paginate(self.conn.compute.keypairs, limit=1), None)
+        if key_pair:
+            return key_pair.name
 
     def set_key_pair_name(self, server_params):
         """
@@ -330,6 +603,7 @@ class OpenStackFacade(object):
         vrrp_group = self.conn.network.find_security_group('vrrp')
         if not vrrp_group:
             vrrp_group = self.conn.network.create_security_group(name='vrrp', description='vrrp')
+            self.tag_resource(vrrp_group)
             self.display('created new security group', vrrp_group)
             vrrp_rule = self.conn.network.create_security_group_rule(
                 security_group_id=vrrp_group.id,
@@ -349,6 +623,7 @@ class OpenStackFacade(object):
         http_group = self.conn.network.find_security_group('http')
         if not http_group:
             http_group = self.conn.network.create_security_group(name='http', description='http')
+            self.tag_resource(http_group)
             self.display('created new security group', http_group)
             http_rule = self.conn.network.create_security_group_rule(
                 security_group_id=http_group.id,
@@ -371,9 +646,8 @@ class OpenStackFacade(object):
         :param network_name: The name of the network to which the server is attached.
         :return:
         """
-        try:
-            server = self.conn.compute.get_server(self.conn.compute.find_server(server_name))
-        except exceptions.InvalidRequest:
+        server = self.find_server(server_name)
+        if not server:
             self.display('could not find server %s' % server_name)
             return
 
@@ -403,22 +677,18 @@ class OpenStackFacade(object):
         """
         for attempt in range(1, attempts+1):
             self.display('waiting for server %s to vanish, attempt %s of %s' % (server_name, attempt, attempts))
-            try:
-                server = self.conn.compute.find_server(server_name)
-                if server:
-                    self.display('found server %s' % server_name, server)
-                    time.sleep(sleep_seconds)
-                else:
-                    self.display('could not find server %s' % server_name)
-                    return
-            except exceptions.InvalidRequest:
+            server = self.find_server(server_name)
+            if server:
+                self.display('found server %s' % server_name, server)
+                time.sleep(sleep_seconds)
+            else:
                 self.display('could not find server %s' % server_name)
                 return
         self.display('giving up - server %s may still be present...' % server_name)
 
     def delete_floating_ip(self, server, network_name):
         """
-        Release floating IP addresses to the pool for the given server.
+        Release floating IP addresses for the given server, or return them to the pool if recycle_floating_ips is set.
         :param server:  The server instance for which floating IP addresses are to be released.
         :param network_name: The name of the network to which the server is attached.
         :return:
@@ -430,8 +700,14 @@ class OpenStackFacade(object):
 
         if floating_ips_for_this_server:
             for floating_ip in floating_ips_for_this_server:
-                self.display('deleting floating IP address %s' % floating_ip.floating_ip_address)
-                self.conn.network.delete_ip(floating_ip)
+                if self.recycle_floating_ips:
+                    self.display('returning floating IP address %s to the pool' % floating_ip.floating_ip_address)
+                    self.conn.network.update_ip(floating_ip, port_id=None, description=FLOATING_IP_POOL_DESCRIPTION)
+                    self.tag_resource(floating_ip, tags=dict())  # pooled addresses belong to no environment
+                    self.floating_ip_pool_stats['returned'] += 1
+                else:
+                    self.display('deleting floating IP address %s' % floating_ip.floating_ip_address)
+                    self.conn.network.delete_ip(floating_ip)
 
     def delete_subnet(self, subnet_name, router_name):
         """
@@ -441,7 +717,7 @@ class OpenStackFacade(object):
         :param router_name: The name of the related router.
         :return:
         """
-        subnet = self.conn.network.find_subnet(subnet_name)
+        subnet = self.find_tagged(self.conn.network.subnets, subnet_name)
 
         if not subnet:
             self.display('could not find subnet %s' % subnet_name)
@@ -449,7 +725,7 @@ class OpenStackFacade(object):
 
         self.display('subnet %s' % subnet_name, subnet)
 
-        router = self.conn.network.find_router(router_name)
+        router = self.find_tagged(self.conn.network.routers, router_name)
 
         if not router:
             self.display('could not find router %s' % router_name)
@@ -468,16 +744,12 @@ class OpenStackFacade(object):
         :param router: The router to which the port(s) and subnet are attached.
         :return:
         """
-        all_ports = self.conn.network.ports()
-
         # each port can have multiple fixed_ips, so need to look inside each one to examine the subnet
-        ports_on_required_subnet = [
-            port for port in all_ports if
-            [
-                fixed_ip for fixed_ip in port.fixed_ips if
-                fixed_ip['subnet_id'] == subnet.id
-            ]
-        ]
+        ports_on_required_subnet = list(self.paginate(
+            self.conn.network.ports,
+            predicate=lambda port: any(fixed_ip['subnet_id'] == subnet.id for fixed_ip in port.fixed_ips),
+            network_id=subnet.network_id,
+        ))
 
         if not ports_on_required_subnet:
             self.display('could not find any ports in the subnet %s' % subnet.name)
@@ -496,7 +768,7 @@ class OpenStackFacade(object):
         :param network_name: The name of the network to delete.
         :return:
         """
-        network = self.conn.network.find_network(network_name)
+        network = self.find_tagged(self.conn.network.networks, network_name)
 
         if not network:
             self.display('could not find network %s' % network_name)
@@ -513,7 +785,7 @@ class OpenStackFacade(object):
         :param router_name: The name of the router to delete.
         :return:
         """
-        router = self.conn.network.find_router(router_name)
+        router = self.find_tagged(self.conn.network.routers, router_name)
 
         if not router:
             self.display('could not find router %s' % router_name)
@@ -555,9 +827,103 @@ class OpenStackFacade(object):
 
     # --------------------- Utility methods ---------------------
 
+    def find_server(self, server_name, tags=None):
+        """
+        Find the named server without creating it - see find_tagged.
+        :param server_name: The name of the server to find.
+        :param tags: A dict of tag name to value. Defaults to the tags set by set_tag_context, so that a server tagged
+                     for another environment is not found. If empty, the server is found whatever its tags.
+        :return: The server, or None if not found.
+        """
+        return self.find_tagged(self.conn.compute.servers, server_name, tags)
+
+    def rename_server(self, server, server_name):
+        """
+        Rename a server, and retag it with the current tags (if any) e.g. when a standby server is claimed.
+        :param server: The server to rename.
+        :param server_name: The new name of the server.
+        :return: The renamed server.
+        """
+        renamed_server = self.conn.compute.update_server(server, name=server_name)
+        self.tag_server(renamed_server)
+        self.display('server %s renamed to %s' % (server.name, server_name))
+        return renamed_server
+
+    def find_network(self, network_name):
+        """
+        Find the named network without creating it.
+        :param network_name: The name of the network to find.
+        :return: The network, or None if not found.
+        """
+        return self.conn.network.find_network(network_name)
+
+    def get_network_components(self, network_id, subnet_id, port_id):
+        """
+        Get the network, subnet and port with the given ids e.g. to check that those found by an earlier run still
+        exist.
+        :param network_id: The id of the network.
+        :param subnet_id: The id of the subnet.
+        :param port_id: The id of the port.
+        :return: The network, subnet and port, or None if any of them no longer exists.
+        """
+        try:
+            return (
+                self.conn.network.get_network(network_id),
+                self.conn.network.get_subnet(subnet_id),
+                self.conn.network.get_port(port_id),
+            )
+        except exceptions.ResourceNotFound:
+            return None
+
+    def find_security_group(self, name):
+        """
+        Find the named security group without creating it.
+        :param name: The name of the security group to find.
+        :return: The security group, or None if not found.
+        """
+        return self.conn.network.find_security_group(name)
+
+    def get_quota_usage(self, project_id):
+        """
+        Return the compute and network quotas of the project, and their current usage, in one pass.
+        Network reservations count as used.
+        :param project_id: The id of the project.
+        :return: A dict of resource (instances, cores, ram, floating_ips, ports, security_groups) to a dict containing
+                 its limit (-1 if unlimited) and the amount used.
+        """
+        limits = self.conn.compute.get_limits().absolute
+        network_quota = self.conn.network.get_quota(project_id, details=True)
+        usage = dict(
+            instances=dict(limit=limits.instances, used=limits.instances_used),
+            cores=dict(limit=limits.total_cores, used=limits.total_cores_used),
+            ram=dict(limit=limits.total_ram, used=limits.total_ram_used),
+        )
+        for resource in ('floating_ips', 'ports', 'security_groups'):
+            details = getattr(network_quota, resource)
+            usage[resource] = dict(limit=details['limit'], used=details['used'] + details.get('reserved', 0))
+        return usage
+
+    def find_servers(self, name_pattern, tags=None):
+        """
+        Return a list of servers whose names match the given compiled regular expression.
+        The tags are filtered for by nova - see paginate_tagged.
+        :param name_pattern: A compiled regular expression to match against the server names.
+        :param tags: An optional dict of tag name to value. A server which has been tagged by this tool is only
+                     included if it carries all of them, so that a server of another environment which happens to
+                     have a matching name is not. Untagged servers (e.g. built before servers were tagged) are
+                     matched by name alone.
+        :return: A list of matching servers.
+        """
+        return list(self.paginate_tagged(
+            self.conn.compute.servers, tags or dict(), predicate=lambda server: name_pattern.match(server.name)
+        ))
+
     def get_public_addresses(self, server, network_name):
         """
         Return a list of public (floating IP) addresses for the given server on the named network.
+        The server's ports and their floating IP addresses are found with server side filters, so the cost does not
+        grow with the number of floating IP addresses in the project. Fixed addresses are not used to find them, as
+        the subnets of different environments may use the same CIDR.
         :param server: The server for which to return the addresses.
         :param network_name: The name of the network which the addresses are associated with.
         :return: A list of floating IP objects, or None if none are present.
@@ -570,10 +936,12 @@ class OpenStackFacade(object):
             floating_ips_for_this_server = None
         else:
             assert ipaddress.IPv4Address(fixed_address).is_private  # TODO - handle this properly
-            floating_ips = list(
-                self.conn.network.ips()  # querying with fixed_ip_address=fixed_address seems to be broken ? .....
-            )
-            floating_ips_for_this_server = [x for x in floating_ips if x.fixed_ip_address == fixed_address]
+            floating_ips_for_this_server = [
+                floating_ip
+                for port in self.paginate(self.conn.network.ports, device_id=server.id)
+                if any(fixed_ip['ip_address'] == fixed_address for fixed_ip in port.fixed_ips)
+                for floating_ip in self.paginate(self.conn.network.ips, port_id=port.id)
+            ]
         return floating_ips_for_this_server
 
     def get_flavor(self, flavor_name):
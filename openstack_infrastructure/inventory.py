@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+inventory.py
+
+Description: Take an inventory of the resources in a project, listing every resource type concurrently and streaming
+the resources as they arrive, rather than listing one type after another and materialising each list.
+
+    for resource_type, resource in inventory.stream(conn, selector=inventory.EnvironmentSelector(conn, 'blog-dev')):
+        ...
+
+Each resource type is listed in its own thread, and the resources are handed to the consumer through a bounded
+queue, so memory use stays flat however big the project is: a listing which gets ahead of the consumer waits.
+
+"""
+
+import collections
+import concurrent.futures
+import json
+import queue
+import threading
+
+from openstack_infrastructure import facade as osf
+
+RESOURCE_TYPES = collections.OrderedDict([  # resource type: (service, listing operation)
+    ('router', ('network', 'routers')),
+    ('network', ('network', 'networks')),
+    ('subnet', ('network', 'subnets')),
+    ('port', ('network', 'ports')),
+    ('floating_ip', ('network', 'ips')),
+    ('security_group', ('network', 'security_groups')),
+    ('security_group_rule', ('network', 'security_group_rules')),
+    ('server', ('compute', 'servers')),
+    ('keypair', ('compute', 'keypairs')),
+    ('flavor', ('compute', 'flavors')),
+    ('image', ('compute', 'images')),
+])
+DEFAULT_QUEUE_SIZE = 1000
+ERROR = 'error'
+_DONE = object()
+
+
+class EnvironmentSelector(object):
+
+    def __init__(self, conn, environment):
+        """
+        Construct an EnvironmentSelector, which selects the resources belonging to an environment built by build.py.
+        Resources tagged with an app and environment (see OpenStackFacade.tag_context) are selected by their tags.
+        Untagged resources (e.g. built before resources were tagged) are selected if they are named for the
+        environment (e.g. app-0-blog-dev, network-blog-dev), or are unnamed resources on its network (ports, floating
+        IP addresses and servers such as the load balancers). The network of the environment, and the ids of the ports
+        on it, are looked up once, up front. Floating IP addresses are selected by the port they are associated with,
+        as environments may well use the same subnet CIDR.
+        :param conn: The OpenStack SDK connection.Connection (or ConnectionMiddleware).
+        :param environment: The environment, as <app>-<environment> e.g. blog-dev
+        """
+        self.environment = environment
+        self.suffix = '-%s' % environment
+        network = conn.network.find_network('network%s' % self.suffix)
+        self.network_id = network.id if network else None
+        self.network_name = network.name if network else None
+        self.port_ids = {x.id for x in conn.network.ports(network_id=network.id)} if network else set()  # one page
+
+    def __call__(self, resource_type, resource):
+        """
+        Return True if the resource belongs to the environment.
+        :param resource_type: The resource type e.g. server
+        :param resource: The resource.
+        :return: True or False
+        """
+        tags = osf.parse_tags(resource)
+        if 'app' in tags and 'environment' in tags:
+            return '%s-%s' % (tags['app'], tags['environment']) == self.environment
+        name = getattr(resource, 'name', None) or ''
+        if name == self.environment or name.endswith(self.suffix):
+            return True
+        if resource_type == 'port':
+            return self.network_id is not None and resource.network_id == self.network_id
+        if resource_type == 'floating_ip':
+            return resource.port_id in self.port_ids
+        if resource_type == 'server':
+            return self.network_name in (resource.addresses or {})
+        return False
+
+
+def stream(conn, resource_types=RESOURCE_TYPES, selector=None, queue_size=DEFAULT_QUEUE_SIZE,
+           page_size=osf.DEFAULT_PAGE_SIZE):
+    """
+    List the resources of each type concurrently, yielding each one as it arrives.
+    A listing which fails does not stop the others; an (ERROR, {'resource_type': ..., 'error': ...}) pair is
+    yielded for it instead.
+    :param conn: The OpenStack SDK connection.Connection (or ConnectionMiddleware).
+    :param resource_types: A dict of resource type to (service, listing operation). Defaults to RESOURCE_TYPES.
+    :param selector: An optional function taking the resource type and resource, which returns True if the resource
+                     should be included e.g. an EnvironmentSelector.
+    :param queue_size: The maximum number of resources listed but not yet consumed.
+    :param page_size: The number of resources requested per page by each listing.
+    :return: A generator of (resource type, resource) pairs, in the order that they arrive.
+    """
+    resources = queue.Queue(maxsize=queue_size)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                resources.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def list_resources(resource_type, service_name, operation):
+        try:
+            for resource in getattr(getattr(conn, service_name), operation)(limit=page_size):
+                if (selector is None or selector(resource_type, resource)) and not put((resource_type, resource)):
+                    return
+        except Exception as e:
+            put((ERROR, dict(resource_type=resource_type, error=repr(e))))
+        finally:
+            put(_DONE)
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(resource_types))
+    try:
+        for (resource_type, (service_name, operation)) in resource_types.items():
+            executor.submit(list_resources, resource_type, service_name, operation)
+        remaining = len(resource_types)
+        while remaining:
+            item = resources.get()
+            if item is _DONE:
+                remaining -= 1
+            else:
+                yield item
+    finally:
+        stopped.set()  # release listings blocked on a full queue if the consumer stops early
+        executor.shutdown(wait=False)
+
+
+def snapshot(conn, resource_types=RESOURCE_TYPES, selector=None, page_size=osf.DEFAULT_PAGE_SIZE):
+    """
+    Take an inventory of the resources in one pass, listing every resource type concurrently - see stream.
+    :param conn: The OpenStack SDK connection.Connection (or ConnectionMiddleware).
+    :param resource_types: A dict of resource type to (service, listing operation). Defaults to RESOURCE_TYPES.
+    :param selector: An optional function which selects the resources to include - see stream.
+    :param page_size: The number of resources requested per page by each listing.
+    :return: An OrderedDict of each resource type to a list of its resources, and of ERROR to a list of the failed
+             listings (if any).
+    """
+    resources = collections.OrderedDict((x, []) for x in resource_types)
+    for resource_type, resource in stream(conn, resource_types, selector, page_size=page_size):
+        resources.setdefault(resource_type, []).append(resource)
+    return resources
+
+
+def to_json_line(resource_type, resource):
+    """
+    Represent a resource as a line of JSON, with its resource_type.
+    :param resource_type: The resource type e.g. server
+    :param resource: An OpenStack SDK resource, or a dict.
+    :return: String containing the JSON, without a trailing newline.
+    """
+    data = resource.to_dict() if hasattr(resource, 'to_dict') else dict(resource)
+    return json.dumps(dict(data, resource_type=resource_type), default=str)
+
+
+def write_json_lines(conn, out, resource_types=RESOURCE_TYPES, selector=None, page_size=osf.DEFAULT_PAGE_SIZE):
+    """
+    Stream an inventory to a file as JSON Lines, one resource per line, flushing as the resources arrive.
+    :param conn: The OpenStack SDK connection.Connection (or ConnectionMiddleware).
+    :param out: The file to write to e.g. sys.stdout
+    :param resource_types: A dict of resource type to (service, listing operation). Defaults to RESOURCE_TYPES.
+    :param selector: An optional function which selects the resources to include - see stream.
+    :param page_size: The number of resources requested per page by each listing.
+    :return: A Counter of resource type to the number of resources written, including ERROR for failed listings.
+    """
+    counts = collections.Counter()
+    for resource_type, resource in stream(conn, resource_types, selector, page_size=page_size):
+        out.write(to_json_line(resource_type, resource) + '\n')
+        out.flush()
+        counts[resource_type] += 1
+    return counts
@@ -0,0 +1,589 @@
+# -*- coding: utf-8 -*-
+"""
+middleware.py
+
+Description: Middleware which wraps an OpenStack SDK connection, intercepting every call made through its service
+             proxies e.g. conn.compute.find_server(...), conn.network.ports(...)
+
+Middleware can be stacked, as each one wraps a connection (or another piece of middleware):
+
+    os_facade.conn = ApiProfiler(Retrier(RateLimiter(os_facade.conn)))
+
+"""
+
+import collections
+import email.utils
+import functools
+import json
+import random
+import sys
+import threading
+import time
+import types
+
+from openstack import exceptions
+
+SERVICE_NAMES = ('compute', 'network', 'identity', 'image', 'block_storage')
+CATALOG_OPERATIONS = {  # (service, operation): the (service, operation)s which invalidate its cached results
+    ('compute', 'find_flavor'): (),
+    ('compute', 'get_flavor'): (),
+    ('compute', 'find_image'): (),
+    ('compute', 'get_image'): (),
+    ('compute', 'keypairs'): (('compute', 'create_keypair'), ('compute', 'delete_keypair')),
+}
+SHARED_NETWORK_NAMES = ('public',)
+PAGINATION_PARAMETERS = ('limit', 'marker', 'paginated')  # these change how results are fetched, not what they are
+DEFAULT_RATES = dict(compute=10.0, network=10.0)  # requests per second, by service
+DEFAULT_BURST = 10
+THROTTLE_STATUS_CODES = (413, 429)  # nova reports rate limiting as 413 Request Entity Too Large in older releases
+DEFAULT_THROTTLE_RETRIES = 5
+DEFAULT_THROTTLE_DELAY_SECONDS = 1.0  # used when a throttled response has no Retry-After header
+TRANSIENT_STATUS_CODES = (409, 500, 502, 503, 504)
+NON_IDEMPOTENT_PREFIXES = ('create_',)  # a create which failed may have created something, so is not retried
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_SECONDS = 0.5
+DEFAULT_MAX_BACKOFF_SECONDS = 10.0
+PASS_THROUGH_CODE = set()  # the code of the helpers which calls are not attributed to - see pass_through
+COMPREHENSION_NAMES = ('<listcomp>', '<setcomp>', '<dictcomp>', '<genexpr>')  # these have frames of their own
+
+
+class ConnectionMiddleware(object):
+
+    def __init__(self, conn):
+        """
+        Construct a ConnectionMiddleware.
+        :param conn: The OpenStack SDK connection.Connection (or ConnectionMiddleware) to wrap.
+        """
+        self.conn = conn
+
+    def __getattr__(self, name):
+        attribute = getattr(self.conn, name)
+        if name in SERVICE_NAMES:
+            return ServiceProxy(self, name, attribute)
+        return attribute
+
+    def call(self, service_name, operation, func, args, kwargs):
+        """
+        Make a call through a service proxy. Subclasses override this to do something useful around the call.
+        :param service_name: The name of the service e.g. compute
+        :param operation: The name of the operation e.g. find_server
+        :param func: The function to call.
+        :param args: The positional arguments.
+        :param kwargs: The keyword arguments.
+        :return: The result of the call.
+        """
+        return func(*args, **kwargs)
+
+
+class ServiceProxy(object):
+
+    def __init__(self, middleware, service_name, service):
+        """
+        Construct a ServiceProxy, which passes calls to the service through the middleware.
+        :param middleware: The ConnectionMiddleware
+        :param service_name: The name of the service e.g. compute
+        :param service: The service proxy being wrapped e.g. conn.compute
+        """
+        self._middleware = middleware
+        self._service_name = service_name
+        self._service = service
+
+    def __getattr__(self, name):
+        attribute = getattr(self._service, name)
+        if name.startswith('_') or not callable(attribute):
+            return attribute
+
+        @functools.wraps(attribute)
+        def call(*args, **kwargs):
+            return self._middleware.call(self._service_name, name, attribute, args, kwargs)
+
+        return call
+
+
+class ApiProfiler(ConnectionMiddleware):
+
+    def __init__(self, conn):
+        """
+        Construct an ApiProfiler, which counts and times every call by service, operation and calling facade method.
+        Listing calls return generators which make their requests as they are consumed; the time spent consuming
+        them is included, along with the number of items and the approximate size of the items returned.
+        :param conn: The OpenStack SDK connection.Connection (or ConnectionMiddleware) to wrap.
+        """
+        super().__init__(conn)
+        self.lock = threading.Lock()
+        self.stats = collections.defaultdict(lambda: dict(calls=0, errors=0, seconds=0.0, items=0, bytes=0))
+
+    def call(self, service_name, operation, func, args, kwargs):
+        key = (service_name, operation, calling_function())
+        started = time.time()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record(key, time.time() - started, error=True)
+            raise
+        self.record(key, time.time() - started)
+        if isinstance(result, types.GeneratorType):
+            return self.profile_items(key, result)
+        return result
+
+    def profile_items(self, key, items):
+        """
+        Profile the consumption of the items from a listing call.
+        :param key: The (service, operation, caller) key.
+        :param items: The generator returned by the listing call.
+        :return: A generator of the same items.
+        """
+        while True:
+            started = time.time()
+            try:
+                item = next(items)
+            except StopIteration:
+                self.record(key, time.time() - started, calls=0)
+                return
+            except Exception:
+                self.record(key, time.time() - started, calls=0, error=True)
+                raise
+            self.record(key, time.time() - started, calls=0, items=1, size=approximate_size(item))
+            yield item
+
+    def record(self, key, seconds, calls=1, items=0, size=0, error=False):
+        with self.lock:
+            stats = self.stats[key]
+            stats['calls'] += calls
+            stats['errors'] += 1 if error else 0
+            stats['seconds'] += seconds
+            stats['items'] += items
+            stats['bytes'] += size
+
+    def summary(self):
+        """
+        Summarise the calls made, most expensive first.
+        :return: A list of dicts, each containing service, operation, caller, calls, errors, seconds, items and bytes.
+        """
+        with self.lock:
+            rows = [
+                dict(service=service, operation=operation, caller=caller, **stats)
+                for ((service, operation, caller), stats) in self.stats.items()
+            ]
+        return sorted(rows, key=lambda x: x['seconds'], reverse=True)
+
+    def format_summary(self):
+        """
+        Format the summary as a table, followed by totals by service.
+        :return: String containing the formatted summary.
+        """
+        rows = self.summary()
+        lines = ['%-8s %-32s %-36s %6s %6s %9s %8s %10s' % (
+            'service', 'operation', 'caller', 'calls', 'errors', 'seconds', 'items', 'bytes')]
+        for row in rows:
+            lines.append('%(service)-8s %(operation)-32s %(caller)-36s %(calls)6d %(errors)6d %(seconds)9.3f '
+                         '%(items)8d %(bytes)10d' % row)
+        for service in sorted({x['service'] for x in rows}):
+            service_rows = [x for x in rows if x['service'] == service]
+            lines.append('total %s: %s calls, %.3f seconds' % (
+                service, sum(x['calls'] for x in service_rows), sum(x['seconds'] for x in service_rows)))
+        return '\n'.join(lines)
+
+
+class ConcurrencyLimiter(ConnectionMiddleware):
+
+    def __init__(self, conn, max_concurrency):
+        """
+        Construct a ConcurrencyLimiter, which caps the number of API calls in flight at once, across all threads.
+        The requests made while consuming the generators returned by listing calls are capped too.
+        :param conn: The OpenStack SDK connection.Connection (or ConnectionMiddleware) to wrap.
+        :param max_concurrency: The maximum number of API calls in flight at once.
+        """
+        super().__init__(conn)
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+
+    def call(self, service_name, operation, func, args, kwargs):
+        with self.semaphore:
+            result = func(*args, **kwargs)
+        if isinstance(result, types.GeneratorType):
+            return self.limit_items(result)
+        return result
+
+    def limit_items(self, items):
+        """
+        Cap the requests made while consuming the items from a listing call.
+        :param items: The generator returned by the listing call.
+        :return: A generator of the same items.
+        """
+        while True:
+            with self.semaphore:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+            yield item
+
+
+class CatalogCache(ConnectionMiddleware):
+
+    def __init__(self, conn, operations=CATALOG_OPERATIONS, shared_network_names=SHARED_NETWORK_NAMES):
+        """
+        Construct a CatalogCache, which caches the results of calls which look up the shared catalog (images, flavors,
+        key pairs and shared networks such as public), so that environments built in the same process look each one
+        up only once. Calls which change a cached operation's results (e.g. create_keypair) invalidate it.
+        :param conn: The OpenStack SDK connection.Connection (or ConnectionMiddleware) to wrap.
+        :param operations: A dict of (service, operation) to cache, to the (service, operation)s which invalidate it.
+        :param shared_network_names: The names of the networks whose lookups are cached.
+        """
+        super().__init__(conn)
+        self.operations = operations
+        self.shared_network_names = shared_network_names
+        self.lock = threading.Lock()
+        self.cache = dict()
+        self.hits = 0
+        self.misses = 0
+
+    def cacheable(self, service_name, operation, args, kwargs):
+        if (service_name, operation) == ('network', 'find_network'):
+            return not kwargs and len(args) == 1 and args[0] in self.shared_network_names
+        return (service_name, operation) in self.operations and not set(kwargs).difference(PAGINATION_PARAMETERS)
+
+    def call(self, service_name, operation, func, args, kwargs):
+        self.invalidate(service_name, operation)
+        if not self.cacheable(service_name, operation, args, kwargs):
+            return func(*args, **kwargs)
+        key = (service_name, operation, args)
+        with self.lock:
+            cached = key in self.cache
+            if cached:
+                self.hits += 1
+                result = self.cache[key]
+            else:
+                self.misses += 1
+        if not cached:
+            result = func(*args, **kwargs)
+            if isinstance(result, types.GeneratorType):
+                result = list(result)
+            with self.lock:
+                self.cache[key] = result
+        return iter(result) if isinstance(result, list) else result
+
+    def invalidate(self, service_name, operation):
+        """
+        Drop the cached results of the operations invalidated by a call.
+        :param service_name: The name of the service e.g. compute
+        :param operation: The name of the operation e.g. create_keypair
+        :return: None
+        """
+        invalidated = [x for (x, invalidators) in self.operations.items() if (service_name, operation) in invalidators]
+        if invalidated:
+            with self.lock:
+                for key in [x for x in self.cache if x[:2] in invalidated]:
+                    del self.cache[key]
+
+
+class TokenBucket(object):
+
+    def __init__(self, rate, burst):
+        """
+        Construct a TokenBucket, which allows rate calls per second on average, and up to burst calls at once.
+        :param rate: The number of tokens added per second.
+        :param burst: The maximum number of tokens held.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a token, waiting for one to be added (and for any pause to end) if necessary.
+        :return: The number of seconds waited.
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.tokens + (now - self.updated) * self.rate, self.burst)
+                self.updated = now
+                wait = max(self.paused_until - now, 0.0)
+                if not wait and self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = max(wait, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+            waited += wait
+
+    def pause(self, seconds):
+        """
+        Stop handing out tokens for a number of seconds e.g. as asked by the Retry-After header of a throttled call.
+        :param seconds: The number of seconds.
+        :return: None
+        """
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class RateLimiter(ConnectionMiddleware):
+
+    def __init__(self, conn, rates=DEFAULT_RATES, burst=DEFAULT_BURST, throttle_retries=DEFAULT_THROTTLE_RETRIES):
+        """
+        Construct a RateLimiter, which limits the rate of API calls to each service with a token bucket shared by all
+        threads. A call which is throttled anyway (429, or 413 from nova) was not carried out, so it is retried
+        whatever the operation, after pausing all calls to the service for as long as the Retry-After header asks.
+        Each page requested by a listing call takes a token too, and a throttled page is requested again.
+        :param conn: The OpenStack SDK connection.Connection (or ConnectionMiddleware) to wrap.
+        :param rates: A dict of service name to the number of calls allowed per second. Other services are not limited.
+        :param burst: The number of calls to a service which can be made at once, after a quiet period.
+        :param throttle_retries: The number of times to retry a throttled call.
+        """
+        super().__init__(conn)
+        self.buckets = {service_name: TokenBucket(rate, burst) for (service_name, rate) in rates.items()}
+        self.throttle_retries = throttle_retries
+        self.lock = threading.Lock()
+        self.throttles = collections.Counter()
+        self.waits = collections.Counter()
+
+    def call(self, service_name, operation, func, args, kwargs):
+        for attempt in range(self.throttle_retries + 1):
+            self.acquire(service_name)
+            try:
+                result = func(*args, **kwargs)
+            except exceptions.HttpException as e:
+                if not self.throttled(service_name, operation, e, attempt):
+                    raise
+                continue
+            if isinstance(result, types.GeneratorType):
+                return self.limit_items(service_name, operation, func, args, kwargs, result)
+            return result
+
+    def limit_items(self, service_name, operation, func, args, kwargs, items):
+        """
+        Take a token for each page requested while consuming the items from a listing call, and resume the listing
+        after the last item returned (with marker) if a page is throttled.
+        The SDK requests the next page of limit items once the previous page is used up, so a token is taken before
+        every limit-th item. Without a limit, the listing is taken to be a single request.
+        :param items: The generator returned by the listing call, whose first request has already taken a token.
+        :return: A generator of the same items.
+        """
+        page_size = kwargs.get('limit')
+        returned = 0  # by the current listing call
+        attempt = 0
+        last_item = None
+        while True:
+            if items is None:
+                self.acquire(service_name)
+                items = func(*args, **(dict(kwargs, marker=last_item.id) if last_item is not None else kwargs))
+                returned = 0
+            elif page_size and returned and returned % page_size == 0:
+                self.acquire(service_name)
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            except exceptions.HttpException as e:
+                if not self.throttled(service_name, operation, e, attempt):
+                    raise
+                attempt += 1
+                items = None
+                continue
+            attempt = 0
+            returned += 1
+            last_item = item
+            yield item
+
+    def acquire(self, service_name):
+        """
+        Take a token from the bucket of a service (if it is limited), counting the time waited for it.
+        :param service_name: The name of the service e.g. compute
+        :return: None
+        """
+        bucket = self.buckets.get(service_name)
+        if bucket:
+            waited = bucket.acquire()
+            if waited:
+                with self.lock:
+                    self.waits[service_name] += waited
+
+    def throttled(self, service_name, operation, error, attempt):
+        """
+        If a call was throttled, count it and pause calls to the service before it is retried.
+        :param service_name: The name of the service e.g. compute
+        :param operation: The name of the operation e.g. find_server
+        :param error: The HttpException which the call failed with.
+        :param attempt: The number of the attempt which failed, from 0.
+        :return: True if the call should be retried, False if the error should be raised.
+        """
+        if http_status(error) not in THROTTLE_STATUS_CODES or attempt == self.throttle_retries:
+            return False
+        delay = retry_after(error)
+        if delay is None:
+            delay = DEFAULT_THROTTLE_DELAY_SECONDS * 2 ** attempt
+        with self.lock:
+            self.throttles[(service_name, operation)] += 1
+        bucket = self.buckets.get(service_name)
+        if bucket:
+            bucket.pause(delay)
+        else:
+            time.sleep(delay)
+        return True
+
+
+class Retrier(ConnectionMiddleware):
+
+    def __init__(self, conn, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF_SECONDS,
+                 max_backoff=DEFAULT_MAX_BACKOFF_SECONDS):
+        """
+        Construct a Retrier, which retries idempotent calls which fail with a transient error (409 or 5xx), sleeping
+        for a random time up to an exponentially increasing backoff between attempts (or as long as the Retry-After
+        header asks). Creates are not idempotent, so are never retried. A listing call is retried only if it fails
+        before returning any items.
+        :param conn: The OpenStack SDK connection.Connection (or ConnectionMiddleware) to wrap.
+        :param retries: The number of times to retry a call.
+        :param backoff: The maximum number of seconds to sleep before the first retry, doubling for each retry.
+        :param max_backoff: The maximum number of seconds to sleep before any retry.
+        """
+        super().__init__(conn)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lock = threading.Lock()
+        self.retried = collections.Counter()
+
+    def retryable(self, operation, error, attempt):
+        return (
+            attempt < self.retries and
+            not operation.startswith(NON_IDEMPOTENT_PREFIXES) and
+            isinstance(error, exceptions.HttpException) and
+            http_status(error) in TRANSIENT_STATUS_CODES
+        )
+
+    def sleep_before_retry(self, service_name, operation, error, attempt):
+        """
+        Count the retry, and sleep before it.
+        :param service_name: The name of the service e.g. compute
+        :param operation: The name of the operation e.g. find_server
+        :param error: The error which the call failed with.
+        :param attempt: The number of the attempt which failed, from 0.
+        :return: None
+        """
+        with self.lock:
+            self.retried[(service_name, operation)] += 1
+        delay = retry_after(error)
+        if delay is None:
+            delay = random.uniform(0, min(self.backoff * 2 ** attempt, self.max_backoff))
+        time.sleep(delay)
+
+    def call(self, service_name, operation, func, args, kwargs):
+        attempt = 0
+        while True:
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if not self.retryable(operation, e, attempt):
+                    raise
+                self.sleep_before_retry(service_name, operation, e, attempt)
+                attempt += 1
+                continue
+            if isinstance(result, types.GeneratorType):
+                return self.retry_items(service_name, operation, func, args, kwargs, result, attempt)
+            return result
+
+    def retry_items(self, service_name, operation, func, args, kwargs, items, attempt):
+        """
+        Retry a listing call if consuming its items fails before any are returned.
+        :param items: The generator returned by the listing call.
+        :param attempt: The number of attempts already failed.
+        :return: A generator of the same items.
+        """
+        while True:
+            try:
+                if items is None:
+                    items = iter(func(*args, **kwargs))
+                item = next(items)
+            except StopIteration:
+                return
+            except Exception as e:
+                if not self.retryable(operation, e, attempt):
+                    raise
+                self.sleep_before_retry(service_name, operation, e, attempt)
+                attempt += 1
+                items = None
+                continue
+            break
+        yield item
+        yield from items
+
+
+def format_counts(label, counts):
+    """
+    Format a count of events by (service, operation) e.g. RateLimiter.throttles, for display.
+    :param label: The name of the events e.g. throttled calls
+    :param counts: A Counter of (service, operation) to the number of events.
+    :return: String e.g. 'throttled calls: 3 (compute.create_server 2, network.ports 1)'
+    """
+    total = sum(counts.values())
+    if not total:
+        return '%s: 0' % label
+    return '%s: %s (%s)' % (label, total, ', '.join(
+        '%s.%s %s' % (service_name, operation, count) for ((service_name, operation), count) in counts.most_common()
+    ))
+
+
+def http_status(error):
+    """
+    Return the HTTP status code of an error from the OpenStack SDK.
+    :param error: An openstack.exceptions.HttpException
+    :return: The status code, or None if there is none.
+    """
+    return getattr(error, 'status_code', None) or getattr(error, 'http_status', None)
+
+
+def retry_after(error):
+    """
+    Return the number of seconds which the Retry-After header of a failed call asks to wait.
+    :param error: An openstack.exceptions.HttpException
+    :return: The number of seconds, or None if there is no Retry-After header.
+    """
+    response = getattr(error, 'response', None)
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        retry_at = email.utils.parsedate_to_datetime(value)  # an HTTP date
+        return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+def pass_through(func):
+    """
+    Decorate a helper which makes calls on behalf of its caller (e.g. OpenStackFacade.paginate), so that they are
+    attributed to the caller - see calling_function.
+    :param func: The function (or generator function) to decorate.
+    :return: The function, unchanged.
+    """
+    PASS_THROUGH_CODE.add(func.__code__)
+    return func
+
+
+def calling_function():
+    """
+    Return the name of the function which made the call into the middleware e.g. the facade method, skipping any
+    pass through helpers and comprehensions in between.
+    :return: The function name, or None if it cannot be determined.
+    """
+    frame = sys._getframe(1)
+    while frame and (
+        frame.f_code.co_filename == __file__ or frame.f_code in PASS_THROUGH_CODE or
+        frame.f_code.co_name in COMPREHENSION_NAMES
+    ):
+        frame = frame.f_back
+    return frame.f_code.co_name if frame else None
+
+
+def approximate_size(item):
+    """
+    Return the approximate size in bytes of an item returned by a listing call, as JSON.
+    :param item: An OpenStack SDK resource, or anything else which can be represented as JSON.
+    :return: The approximate size in bytes.
+    """
+    data = item.to_dict() if hasattr(item, 'to_dict') else item
+    return len(json.dumps(data, default=str))
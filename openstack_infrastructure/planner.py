@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+planner.py
+
+Description: Plan the changes a build, scale or destroy would make, from one inventory snapshot of the project,
+without changing anything.
+
+    snapshot = planner.Snapshot(inventory.snapshot(conn), tags=dict(app='blog', environment='dev'))
+    plan = planner.Plan(pooled_floating_ips=len(snapshot.pooled_floating_ips()))
+    plan.find_or_create('router', 'router-blog-dev', snapshot.find('router', 'router-blog-dev'))
+    print(plan.format())
+
+Each action carries a rough estimate of how long it takes, so that the plan can say how long the run will take. The
+estimates are deliberately coarse - booting servers and bootstrapping salt dominate.
+
+"""
+
+import collections
+import math
+
+from openstack_infrastructure import facade as osf
+
+Action = collections.namedtuple('Action', ['verb', 'resource_type', 'name', 'seconds', 'note'])
+
+ESTIMATED_SECONDS = {  # (verb, resource type): seconds. Anything not listed (e.g. reuse) is taken to be instant.
+    ('create', 'router'): 3,
+    ('create', 'network'): 2,
+    ('create', 'subnet'): 2,
+    ('create', 'port'): 2,
+    ('create', 'security_group'): 2,
+    ('create', 'keypair'): 2,
+    ('create', 'floating_ip'): 3,
+    ('claim', 'floating_ip'): 2,
+    ('create', 'server'): 90,  # until it is ACTIVE
+    ('claim', 'server'): 5,  # a standby server is renamed
+    ('delete', 'router'): 2,
+    ('delete', 'network'): 2,
+    ('delete', 'subnet'): 2,
+    ('delete', 'port'): 2,
+    ('delete', 'security_group'): 2,
+    ('delete', 'keypair'): 2,
+    ('delete', 'floating_ip'): 2,
+    ('return', 'floating_ip'): 2,
+    ('delete', 'server'): 30,  # stopped, deleted, and waited for until it vanishes
+    ('configure', 'salt_master'): 300,
+    ('configure', 'salt_minion'): 240,  # per round of ssh_pool_size minions bootstrapped concurrently
+    ('configure', 'load_balancers'): 60,
+    ('configure', 'state'): 300,
+}
+VERBS = ['create', 'claim', 'reuse', 'keep', 'return', 'delete', 'configure']  # the order of the summary
+
+
+class Snapshot(object):
+
+    def __init__(self, resources, tags=None):
+        """
+        Construct a Snapshot, which looks resources up in an inventory taken in one pass e.g. by inventory.snapshot
+        :param resources: A dict of resource type (see inventory.RESOURCE_TYPES) to a list of its resources.
+        :param tags: An optional dict of tag name to value e.g. dict(app='blog', environment='dev'). Resources tagged
+                     for another environment are ignored, even if their names match - see OpenStackFacade.find_servers
+        """
+        self.resources = resources
+        self.tags = tags
+
+    def owned(self, resource):
+        """
+        Return True if the resource is not tagged for another environment.
+        :param resource: The resource.
+        :return: True or False
+        """
+        return not self.tags or not osf.parse_tags(resource) or osf.is_tagged(resource, self.tags)
+
+    def find(self, resource_type, name, shared=False):
+        """
+        Find the named resource, like the SDK find methods.
+        :param resource_type: The resource type e.g. router
+        :param name: The name of the resource.
+        :param shared: Find the resource whichever environment it is tagged for (e.g. the vrrp security group), if
+                       set to True.
+        :return: The resource, or None if not found.
+        """
+        return next((
+            x for x in self.resources.get(resource_type, [])
+            if x.name == name and (shared or self.owned(x))
+        ), None)
+
+    def find_servers(self, name_pattern):
+        """
+        Find the servers whose names match a compiled regular expression.
+        :param name_pattern: A compiled regular expression to match against the server names.
+        :return: A list of servers.
+        """
+        return [x for x in self.resources.get('server', []) if name_pattern.match(x.name) and self.owned(x)]
+
+    def find_numbered_servers(self, name_pattern):
+        """
+        Find the numbered servers whose names match a compiled regular expression, which captures the number.
+        :param name_pattern: A compiled regular expression e.g. from utils.construct_server_name_pattern
+        :return: OrderedDict containing server_number: server, ordered by server number
+        """
+        return collections.OrderedDict(sorted(
+            (int(name_pattern.match(x.name).group(1)), x) for x in self.find_servers(name_pattern)
+        ))
+
+    def find_ports(self, network, subnet):
+        """
+        Find the ports on a network which have a fixed IP address on the subnet.
+        :param network: The network.
+        :param subnet: The subnet.
+        :return: A list of ports.
+        """
+        return [
+            x for x in self.resources.get('port', [])
+            if x.network_id == network.id and any(y['subnet_id'] == subnet.id for y in x.fixed_ips)
+        ]
+
+    def find_floating_ips(self, server, network_name):
+        """
+        Find the floating IP addresses of a server, like OpenStackFacade.get_public_addresses
+        :param server: The server.
+        :param network_name: The name of the network which the addresses are associated with.
+        :return: A list of floating IPs.
+        """
+        fixed_addresses = [x['addr'] for x in (server.addresses or {}).get(network_name, [])[:1]]
+        port_ids = [
+            x.id for x in self.resources.get('port', [])
+            if x.device_id == server.id and any(y['ip_address'] in fixed_addresses for y in x.fixed_ips)
+        ]
+        return [x for x in self.resources.get('floating_ip', []) if x.port_id in port_ids]
+
+    def pooled_floating_ips(self):
+        """
+        Find the floating IP addresses in the pool - see OpenStackFacade.iterate_pooled_floating_ips
+        :return: A list of floating IPs.
+        """
+        return [x for x in self.resources.get('floating_ip', []) if osf.is_pooled_floating_ip(x)]
+
+
+class Plan(object):
+
+    def __init__(self, pooled_floating_ips=0, ssh_pool_size=10):
+        """
+        Construct a Plan, an ordered list of actions.
+        :param pooled_floating_ips: The number of floating IP addresses in the pool, which are claimed before any
+                                    more are allocated.
+        :param ssh_pool_size: The maximum number of salt minions bootstrapped at once.
+        """
+        self.actions = []
+        self.pooled_floating_ips = pooled_floating_ips
+        self.ssh_pool_size = ssh_pool_size
+
+    def add(self, verb, resource_type, name, note='', seconds=None, background=False):
+        """
+        Add an action to the plan.
+        :param verb: What is done e.g. create, reuse, delete
+        :param resource_type: The resource type e.g. server
+        :param name: The name of the resource (or a description, if it has none).
+        :param note: An optional note e.g. by salt-cloud
+        :param seconds: The estimated duration. Defaults to ESTIMATED_SECONDS.
+        :param background: The action runs in the background, so it does not add to the duration, if set to True.
+        :return: The Action
+        """
+        if seconds is None:
+            seconds = ESTIMATED_SECONDS.get((verb, resource_type), 0)
+        if background:
+            seconds = 0
+            note = ', '.join(x for x in [note, 'in the background'] if x)
+        action = Action(verb, resource_type, name, seconds, note)
+        self.actions.append(action)
+        return action
+
+    def find_or_create(self, resource_type, name, existing, note=''):
+        """
+        Add the action of a find-or-create: reuse if the resource exists, otherwise create.
+        :param resource_type: The resource type e.g. router
+        :param name: The name of the resource.
+        :param existing: The existing resource, or None.
+        :param note: An optional note.
+        :return: True if the resource is to be created.
+        """
+        self.add('reuse' if existing else 'create', resource_type, name, note)
+        return not existing
+
+    def add_floating_ip(self, server_name, background=False):
+        """
+        Add the action of assigning a floating IP address to a server, claimed from the pool while it lasts.
+        :param server_name: The name of the server.
+        :param background: See add.
+        :return: The Action
+        """
+        if self.pooled_floating_ips:
+            self.pooled_floating_ips -= 1
+            return self.add('claim', 'floating_ip', server_name, 'from the pool', background=background)
+        return self.add('create', 'floating_ip', server_name, background=background)
+
+    def add_salt_minions(self, minion_names):
+        """
+        Add the action of bootstrapping salt minions, ssh_pool_size at a time.
+        :param minion_names: A list of the minion ids.
+        :return: The Action, or None if there are no minions.
+        """
+        if not minion_names:
+            return None
+        rounds = math.ceil(len(minion_names) / float(self.ssh_pool_size))
+        return self.add(
+            'configure', 'salt_minion', ','.join(minion_names),
+            seconds=rounds * ESTIMATED_SECONDS[('configure', 'salt_minion')]
+        )
+
+    def estimate_seconds(self):
+        """
+        Estimate how long the plan will take to run.
+        :return: The number of seconds.
+        """
+        return sum(x.seconds for x in self.actions)
+
+    def count(self):
+        """
+        Count the actions of each verb, excluding configure.
+        :return: A Counter of verb to the number of actions.
+        """
+        return collections.Counter(x.verb for x in self.actions if x.verb != 'configure')
+
+    def format(self):
+        """
+        Format the plan for display: one line per action, then a summary with the estimated duration.
+        :return: A string.
+        """
+        width = max([len(x.resource_type) for x in self.actions] + [0])
+        lines = [
+            '%-9s %-*s %s%s' % (x.verb, width, x.resource_type, x.name, ' (%s)' % x.note if x.note else '')
+            for x in self.actions
+        ]
+        counts = self.count()
+        minutes, seconds = divmod(self.estimate_seconds(), 60)
+        lines.append('plan: %s, estimated %dm %02ds' % (
+            ', '.join('%s to %s' % (counts[x], x) for x in VERBS if counts[x]) or 'nothing to do', minutes, seconds))
+        return '\n'.join(lines)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+test_batch.py
+
+Description: Tests for batch.py
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import batch
+from build_utils import fab_utils, remote
+from openstack_infrastructure import fake_cloud, middleware
+from tests.test_build import OPENSTACK_PARAMS
+
+
+class TestReadSpecs(unittest.TestCase):
+
+    def test_read_specs(self):
+        """
+        Test that read_specs reads one spec per line, ignoring blank lines and comments.
+        """
+        specs = batch.read_specs(
+            ['# app env num_servers server_size', '', 'blog ci-1 2 m1.small  # first', 'blog ci-2 1 m1.tiny']
+        )
+        self.assertEqual(
+            specs,
+            [batch.EnvironmentSpec('blog', 'ci-1', 2, 'm1.small'), batch.EnvironmentSpec('blog', 'ci-2', 1, 'm1.tiny')]
+        )
+
+    def test_read_specs_rejects_malformed_line(self):
+        """
+        Test that read_specs rejects a line without four fields.
+        """
+        with self.assertRaises(ValueError):
+            batch.read_specs(['blog ci-1 m1.small'])
+
+
+class TestRunBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.sandbox_root = tempfile.TemporaryDirectory()
+        self.previous_backend = fab_utils.get_backend()
+        fab_utils.set_backend(remote.LocalBackend(self.sandbox_root.name))
+        self.conn = fake_cloud.FakeConnection()
+        self.catalog_cache = middleware.CatalogCache(middleware.ConcurrencyLimiter(self.conn, 4))
+        self.checkpoint_directory = os.path.join(self.sandbox_root.name, 'checkpoints')
+
+    def tearDown(self):
+        fab_utils.set_backend(self.previous_backend)
+        self.sandbox_root.cleanup()
+
+    def test_failure_is_isolated_and_catalog_is_shared(self):
+        """
+        Test that an environment which fails does not stop the others, and that the catalog is looked up once.
+        """
+        specs = [
+            batch.EnvironmentSpec('blog', 'ci-1', 2, 'm1.small'),
+            batch.EnvironmentSpec('blog', 'ci-2', 1, 'no.such.flavor'),
+        ]
+        with mock.patch.dict(os.environ, OPENSTACK_PARAMS):
+            results = batch.run_batch(specs, self.catalog_cache, checkpoint_directory=self.checkpoint_directory)
+
+        self.assertEqual([x['outcome'] for x in results], ['ok', 'exit status 1'])
+        self.assertEqual(list(results[0]['servers']), ['salt-blog-ci-1', 'app-0-blog-ci-1', 'app-1-blog-ci-1'])
+        self.assertIsNotNone(results[0]['ha_address'])
+        self.assertEqual(self.conn.calls[('compute', 'find_image')], 1)
+        self.assertGreater(self.catalog_cache.hits, 0)
+
+    def test_builds_are_not_run_in_parallel(self):
+        """
+        Test that run_batch refuses to build environments in parallel, but destroys them in parallel.
+        """
+        specs = [
+            batch.EnvironmentSpec('blog', 'ci-1', 1, 'm1.small'),
+            batch.EnvironmentSpec('blog', 'ci-2', 1, 'm1.small'),
+        ]
+        with self.assertRaises(ValueError):
+            batch.run_batch(specs, self.catalog_cache, parallel=2)
+        self.assertEqual(self.conn.calls, dict())
+        with mock.patch.dict(os.environ, OPENSTACK_PARAMS):
+            results = batch.run_batch(
+                specs, self.catalog_cache, destroy=True, parallel=2, checkpoint_directory=self.checkpoint_directory
+            )
+        self.assertEqual([x['outcome'] for x in results], ['ok', 'ok'])
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+test_benchmarks.py
+
+Description: Tests for benchmarks package.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks import history, stats
+
+
+class TestPercentile(unittest.TestCase):
+
+    def test_percentile_nearest_rank(self):
+        """
+        Test that percentile uses the nearest-rank method.
+        """
+        samples = list(range(1, 101))
+        self.assertEqual(stats.percentile(samples, 50), 50)
+        self.assertEqual(stats.percentile(samples, 95), 95)
+        self.assertEqual(stats.percentile(samples, 99), 99)
+        self.assertEqual(stats.percentile([3, 1, 2], 50), 2)
+
+    def test_percentile_no_samples(self):
+        """
+        Test that percentile returns None when there are no samples.
+        """
+        self.assertIsNone(stats.percentile([], 50))
+
+
+class TestCompare(unittest.TestCase):
+
+    def test_compare_flags_significant_regressions_only(self):
+        """
+        Test that compare flags a consistent increase, but neither noise nor a change below the threshold.
+        """
+        key = ('orchestration', 10, 'build', 0.002)
+        baseline = {key: dict(seconds=[1.0, 1.1, 0.9, 1.0, 1.05], api_calls=[100] * 5, items_listed=[50] * 5,
+                              bytes_listed=[1000] * 5, peak_memory=[500, 520, 480, 510, 490])}
+        candidate = {key: dict(seconds=[2.0, 2.1, 1.9, 2.0, 2.05], api_calls=[102] * 5, items_listed=[60] * 5,
+                               bytes_listed=[1000] * 5, peak_memory=[510, 480, 500, 490, 520])}
+        regressions = {
+            x['metric']: x['regression'] for x in history.compare(baseline, candidate, threshold=0.05)
+        }
+        self.assertEqual(
+            regressions,
+            dict(seconds=True, api_calls=False, items_listed=True, bytes_listed=False, peak_memory=False)
+        )
+
+    def test_compare_treats_a_change_from_zero_as_infinite(self):
+        """
+        Test that an increase from a zero baseline is flagged, rather than treated as no change.
+        """
+        key = ('orchestration', 10, 'scale', 0.002)
+        baseline = {key: dict(remote_calls=[0] * 5, remote_bytes=[0] * 5)}
+        candidate = {key: dict(remote_calls=[3] * 5, remote_bytes=[0] * 5)}
+        comparisons = {x['metric']: x for x in history.compare(baseline, candidate)}
+        self.assertEqual(comparisons['remote_calls']['change'], float('inf'))
+        self.assertTrue(comparisons['remote_calls']['regression'])
+        self.assertEqual(comparisons['remote_bytes']['change'], 0.0)
+        self.assertFalse(comparisons['remote_bytes']['regression'])
+
+
+class TestLoad(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'results.jsonl')
+
+    def write(self, commit, seconds, **metrics):
+        with open(self.path, 'a') as results_file:
+            result = dict(benchmark='orchestration', commit=commit, num_servers=10, phase='build', latency=0.002,
+                          seconds=seconds, **metrics)
+            results_file.write(json.dumps(result) + '\n')
+
+    def test_load_keeps_dirty_results_apart(self):
+        """
+        Test that load only loads the results of exactly the commit asked for, so that results recorded with
+        uncommitted changes are not mixed in with those of the commit.
+        """
+        self.write('e4892a9', 1.0, remote_calls=10, remote_bytes=1000)
+        self.write('e4892a9-dirty', 5.0, remote_calls=20, remote_bytes=2000)
+        self.write('e4892a9', 2.0)  # recorded before the remote metrics existed
+        key = ('orchestration', 10, 'build', 0.002)
+        self.assertEqual(history.load(self.path, 'e4892a9')[key]['seconds'], [1.0, 2.0])
+        self.assertEqual(history.load(self.path, 'e4892a9')[key]['remote_calls'], [10])
+        self.assertEqual(history.load(self.path, 'e4892a9-dirty')[key]['seconds'], [5.0])
+        self.assertEqual(history.load(self.path, 'e4892'), {})
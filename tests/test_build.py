@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+test_build.py
+
+Description: Tests for build.py
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import build
+from build_utils import fab_utils, remote
+from openstack_infrastructure import facade as osf, fake_cloud
+
+OPENSTACK_PARAMS = dict(
+    OS_AUTH_URL='http://fake-cloud/v3',
+    OS_REGION_NAME='RegionOne',
+    OS_USERNAME='test',
+    OS_PASSWORD='test',
+    OS_PROJECT_ID='test',
+    OS_USER_DOMAIN_NAME='default',
+    OS_PROJECT_DOMAIN_NAME='default',
+)
+
+
+class TestInfrastructureManagerDestroy(unittest.TestCase):
+
+    def setUp(self):
+        self.checkpoint_directory = tempfile.TemporaryDirectory()
+        self.conn = fake_cloud.FakeConnection()
+        self.os_facade = osf.OpenStackFacade(conn=self.conn)
+        self.manager = build.InfrastructureManager(
+            dict(app='blog', environment='dev', num_servers=1, server_size='m1.small',
+                 checkpoint_directory=self.checkpoint_directory.name),
+            self.os_facade
+        )
+
+    def tearDown(self):
+        self.checkpoint_directory.cleanup()
+
+    def test_destroy_removes_all_app_servers_and_network(self):
+        """
+        Test that destroy removes every app server (including any beyond num_servers) and the network components.
+        """
+        router = self.os_facade.find_or_create_router('router-blog-dev')
+        network = self.os_facade.find_or_create_network('network-blog-dev')
+        subnet = self.os_facade.find_or_create_subnet('subnet-blog-dev', network=network)
+        port = self.os_facade.find_or_create_port(network, subnet)
+        self.os_facade.add_interface_to_router(router, subnet, port)
+        for server_name in ['salt-blog-dev', 'app-0-blog-dev', 'app-1-blog-dev', 'app-0-blog-prod']:
+            self.os_facade.find_or_create_server(server_name, network, subnet, port)
+
+        self.manager.destroy()
+
+        self.assertEqual([x.name for x in self.conn.compute.servers()], ['app-0-blog-prod'])
+        self.assertEqual(list(self.conn.network.routers()), [])
+        self.assertEqual(list(self.conn.network.subnets()), [])
+
+    def test_destroy_keeps_load_balancers_of_another_environment(self):
+        """
+        Test that destroy leaves the load balancers, security groups and key pair alone if the load balancers are
+        tagged for another environment, as their names are shared by every environment of the project.
+        """
+        prod_facade = osf.OpenStackFacade(conn=self.conn)
+        prod_facade.set_tag_context(app='blog', environment='prod')
+        network = prod_facade.find_or_create_network('network-blog-prod')
+        subnet = prod_facade.find_or_create_subnet('subnet-blog-prod', network=network)
+        port = prod_facade.find_or_create_port(network, subnet)
+        with prod_facade.tag_context(role=build.LOAD_BALANCER_ROLE):
+            for server_name in build.LOAD_BALANCER_SERVER_NAMES:
+                prod_facade.find_or_create_server(server_name, network, subnet, port)
+            prod_facade.get_or_create_vrrp_security_group()
+        prod_facade.get_or_create_key_pair(build.SALT_CLOUD_KEY_PAIR_NAME)
+
+        with mock.patch.dict(os.environ, OPENSTACK_PARAMS):
+            destroy_plan = self.manager.plan('destroy')
+            self.manager.destroy()
+
+        self.assertEqual(sorted(x.name for x in self.conn.compute.servers()), build.LOAD_BALANCER_SERVER_NAMES)
+        self.assertIsNotNone(self.conn.network.find_security_group('vrrp'))
+        self.assertIsNotNone(self.conn.compute.find_keypair(build.SALT_CLOUD_KEY_PAIR_NAME))
+        self.assertEqual(destroy_plan.count().get('delete', 0), 0)
+
+
+class TestInfrastructureManagerBuild(unittest.TestCase):
+
+    def setUp(self):
+        self.sandbox_root = tempfile.TemporaryDirectory()
+        self.backend = remote.LocalBackend(self.sandbox_root.name)
+        self.previous_backend = fab_utils.get_backend()
+        fab_utils.set_backend(self.backend)
+        self.conn = fake_cloud.FakeConnection()
+        self.checkpoint_file = os.path.join(self.sandbox_root.name, 'checkpoint.json')
+        self.manager = build.InfrastructureManager(
+            dict(app='blog', environment='dev', num_servers=2, server_size='m1.small',
+                 checkpoint_file=self.checkpoint_file, **OPENSTACK_PARAMS),
+            osf.OpenStackFacade(conn=self.conn)
+        )
+
+    def tearDown(self):
+        fab_utils.set_backend(self.previous_backend)
+        self.sandbox_root.cleanup()
+
+    def test_build_configures_salt_master_offline(self):
+        """
+        Test that build runs end to end against the fake cloud and the local remote backend, placing the haproxy
+        pillar for every app server on the salt master.
+        """
+        with mock.patch.dict(os.environ, OPENSTACK_PARAMS):
+            self.manager.build()
+
+        salt_master_address = self.manager.get_salt_master_address()
+        haproxy_pillar = self.backend.read(salt_master_address, '/srv/pillar/haproxy.sls')
+        for server_name in ['app-0-blog-dev', 'app-1-blog-dev']:
+            self.assertIn(server_name, haproxy_pillar)
+        self.assertIn(
+            dict(command='sh /srv/apply_state.sh', sudo=True, cwd=None), self.backend.commands[salt_master_address]
+        )
+        self.assertEqual(
+            {x.name: osf.parse_tags(x)['role'] for x in self.conn.compute.servers()},
+            {'salt-blog-dev': 'salt', 'app-0-blog-dev': 'app', 'app-1-blog-dev': 'app',
+             'vrrp-primary': 'load-balancer', 'vrrp-secondary': 'load-balancer'}
+        )
+        self.assertEqual(
+            [x.name for x in self.conn.network.routers(tags='gdl100:app=blog,gdl100:environment=dev')],
+            ['router-blog-dev']
+        )
+
+    def test_build_fails_fast_on_quota_shortfall(self):
+        """
+        Test that build exits before creating anything if the quotas do not allow the environment's servers.
+        """
+        conn = fake_cloud.FakeConnection(cloud=fake_cloud.FakeCloud(quotas=dict(instances=4, floating_ips=10)))
+        manager = build.InfrastructureManager(
+            dict(app='blog', environment='dev', num_servers=2, server_size='m1.small', **OPENSTACK_PARAMS),
+            osf.OpenStackFacade(conn=conn)
+        )
+        with mock.patch.dict(os.environ, OPENSTACK_PARAMS), self.assertLogs(build.logger, 'CRITICAL') as logs:
+            with self.assertRaises(SystemExit):
+                manager.build()
+        self.assertEqual(
+            logs.output,
+            ['CRITICAL:build:Quota for instances would be exceeded by 1: 5 required, 4 available (0 of 4 used)']
+        )
+        self.assertEqual(list(conn.network.routers()), [])
+        self.assertEqual(list(conn.compute.servers()), [])
+
+    def test_build_refuses_load_balancers_of_another_environment(self):
+        """
+        Test that build (and its plan) exit before creating anything if the load balancers are tagged for another
+        environment of the project, and that the untagged load balancers created by salt-cloud are claimed.
+        """
+        salt_cloud_facade = osf.OpenStackFacade(conn=self.conn)  # salt-cloud does not tag what it creates
+        network = salt_cloud_facade.find_or_create_network('network-blog-dev')
+        subnet = salt_cloud_facade.find_or_create_subnet('subnet-blog-dev', network=network)
+        port = salt_cloud_facade.find_or_create_port(network, subnet)
+        salt_cloud_facade.find_or_create_server('vrrp-primary', network, subnet, port)
+        with mock.patch.dict(os.environ, OPENSTACK_PARAMS):
+            self.manager.build()
+        self.assertEqual(
+            [x.name for x in self.conn.compute.servers(tags='gdl100:environment=dev,gdl100:role=load-balancer')],
+            build.LOAD_BALANCER_SERVER_NAMES
+        )
+        servers_before = len(list(self.conn.compute.servers()))
+
+        prod_manager = build.InfrastructureManager(
+            dict(app='blog', environment='prod', num_servers=1, server_size='m1.small', **OPENSTACK_PARAMS),
+            osf.OpenStackFacade(conn=self.conn)
+        )
+        with mock.patch.dict(os.environ, OPENSTACK_PARAMS), self.assertLogs(build.logger, 'CRITICAL') as logs:
+            with self.assertRaises(SystemExit):
+                prod_manager.plan('build')
+            with self.assertRaises(SystemExit):
+                prod_manager.build()
+        self.assertEqual(len(logs.output), 2)
+        self.assertIn('vrrp-primary, vrrp-secondary belong to another environment', logs.output[1])
+        self.assertEqual(len(list(self.conn.compute.servers())), servers_before)
+        self.assertIsNone(self.conn.network.find_router('router-blog-prod'))
+
+    def test_scale_out_claims_standby_servers(self):
+        """
+        Test that scaling out renames an idle standby server into the new app server, configuring its minion id, and
+        that the standby pool is refilled.
+        """
+        self.manager.params.update(num_servers=1, standby_pool_size=2)
+        with mock.patch.dict(os.environ, OPENSTACK_PARAMS):
+            self.manager.build()
+            standby_servers = self.manager.find_standby_servers()
+            self.assertEqual(
+                [x.name for x in standby_servers.values()],
+                ['standby-m1-small-0-blog-dev', 'standby-m1-small-1-blog-dev']
+            )
+            creates_before = self.conn.calls[('compute', 'create_server')]
+
+            self.manager.params['num_servers'] = 2
+            servers = self.manager.scale()
+
+        self.assertEqual(list(servers), ['app-0-blog-dev', 'app-1-blog-dev'])
+        app_server = self.manager.find_app_servers()[1]
+        self.assertEqual(app_server.id, standby_servers[0].id)
+        self.assertEqual(osf.parse_tags(app_server), dict(app='blog', environment='dev', role='app'))
+        [minion_address] = servers['app-1-blog-dev']
+        [bootstrap] = [x['command'] for x in self.backend.commands[minion_address] if 'minion_id' in x['command']][-1:]
+        self.assertIn('printf "app-1-blog-dev" > /etc/salt/minion_id', bootstrap)
+        self.assertEqual(len(self.manager.find_standby_servers()), 2)
+        self.assertEqual(self.conn.calls[('compute', 'create_server')], creates_before + 1)  # the refill only
+
+    def test_scale_in_drains_surplus_servers_before_deleting_them(self):
+        """
+        Test that scaling in waits for the load balancers' connections to the surplus app server to drain, and only
+        then deletes it.
+        """
+        with mock.patch.dict(os.environ, OPENSTACK_PARAMS):
+            self.manager.build()
+            surplus_server = self.manager.find_app_servers()[1]
+            [surplus_address] = [
+                x.floating_ip_address
+                for x in self.manager.os_facade.get_public_addresses(surplus_server, 'network-blog-dev')
+            ]
+            self.backend.responses.extend([
+                (r'ss -tn', 'vrrp-primary: 2\nvrrp-secondary: 0', 0),
+                (r'ss -tn', 'vrrp-primary: 0\nvrrp-secondary: 0', 0),
+            ])
+            existing_servers = []
+
+            def drained(seconds):
+                existing_servers.append([x.name for x in self.conn.compute.servers()])
+                self.backend.responses.pop(0)
+
+            self.manager.params['num_servers'] = 1
+            with mock.patch.object(fab_utils.time, 'sleep', side_effect=drained) as sleep:
+                servers = self.manager.scale()
+
+        self.assertEqual(list(servers), ['app-0-blog-dev'])
+        self.assertEqual(sleep.call_count, 1)
+        self.assertIn('app-1-blog-dev', existing_servers[0])  # still there while its connections drain
+        self.assertNotIn('app-1-blog-dev', [x.name for x in self.conn.compute.servers()])
+        salt_master_address = self.manager.get_salt_master_address()
+        drain_checks = [x['command'] for x in self.backend.commands[salt_master_address] if 'ss -tn' in x['command']]
+        self.assertEqual(len(drain_checks), 2)
+        self.assertIn('dst %s' % surplus_address, drain_checks[0])
+
+    def test_interrupted_build_resumes_from_first_incomplete_phase(self):
+        """
+        Test that resuming an interrupted build skips the phases it completed, re-validating their outputs cheaply,
+        and removes the checkpoint once the build completes.
+        """
+        with mock.patch.dict(os.environ, OPENSTACK_PARAMS):
+            with mock.patch.object(fab_utils, 'apply_state', side_effect=remote.RemoteCommandError(
+                    '10.0.0.1', 'sh /srv/apply_state.sh', remote.RemoteResult('timed out', 124))):
+                with self.assertRaises(remote.RemoteCommandError):
+                    self.manager.build()
+            self.assertTrue(os.path.exists(self.checkpoint_file))
+            creates_before = self.conn.calls[('compute', 'create_server')]
+            find_routers_before = self.conn.calls[('network', 'routers')]
+            salt_master_address = self.manager.get_salt_master_address()
+            commands_before = len(self.backend.commands[salt_master_address])
+
+            servers, ha_address = self.manager.build(resume=True)
+
+        self.assertEqual(list(servers), ['salt-blog-dev', 'app-0-blog-dev', 'app-1-blog-dev'])
+        self.assertEqual(self.conn.calls[('compute', 'create_server')], creates_before)
+        self.assertEqual(self.conn.calls[('network', 'routers')], find_routers_before)
+        resumed_commands = [x['command'] for x in self.backend.commands[salt_master_address][commands_before:]]
+        self.assertEqual(resumed_commands[0], 'sh /srv/apply_state.sh')  # the phases before apply_state are skipped
+        self.assertFalse(any('bootstrap' in x or 'salt-key' in x for x in resumed_commands))
+        self.assertFalse(os.path.exists(self.checkpoint_file))
+
+    def test_plan_makes_no_changes(self):
+        """
+        Test that planning a build of an existing environment reuses what exists, creates only what is missing, and
+        that neither planning a build nor a destroy makes any mutating call.
+        """
+        self.manager.params['num_servers'] = 1
+        with mock.patch.dict(os.environ, OPENSTACK_PARAMS):
+            self.manager.build()
+            calls_before = dict(self.conn.calls)
+
+            self.manager.params['num_servers'] = 2
+            build_plan = self.manager.plan('build')
+            destroy_plan = self.manager.plan('destroy')
+
+        called = [x for (x, count) in self.conn.calls.items() if count != calls_before.get(x, 0)]
+        self.assertEqual(
+            [x for x in called if x[1].split('_')[0] in ('create', 'update', 'delete', 'add', 'remove', 'set', 'put')],
+            []
+        )
+        created = [(x.resource_type, x.name) for x in build_plan.actions if x.verb == 'create']
+        self.assertEqual(created, [('server', 'app-1-blog-dev'), ('floating_ip', 'app-1-blog-dev')])
+        self.assertIn(('reuse', 'router-blog-dev'), [(x.verb, x.name) for x in build_plan.actions])
+        self.assertGreater(build_plan.estimate_seconds(), 0)
+        self.assertIn('2 to create', build_plan.format().splitlines()[-1])
+        deleted_servers = [x.name for x in destroy_plan.actions if (x.verb, x.resource_type) == ('delete', 'server')]
+        self.assertEqual(sorted(deleted_servers), ['app-0-blog-dev', 'salt-blog-dev', 'vrrp-primary', 'vrrp-secondary'])
+        self.assertEqual(destroy_plan.count()['delete'], 16)  # servers, addresses, groups, key pair, port, network
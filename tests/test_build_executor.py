@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+test_build_executor.py
+
+Description: Tests for build_utils.executor module.
+"""
+
+import collections
+import threading
+import time
+import unittest
+
+from build_utils import executor
+
+
+class TestRunOnHosts(unittest.TestCase):
+
+    def test_hosts_run_concurrently(self):
+        """
+        Test that the hosts run concurrently, so the total time is roughly that of the slowest host.
+        """
+        hosts = ['10.0.0.%s' % x for x in range(10)]
+        started = time.time()
+        results = executor.run_on_hosts(lambda host: time.sleep(0.2) or host.upper(), hosts, pool_size=10)
+        self.assertLess(time.time() - started, 1.0)
+        self.assertEqual(list(results), hosts)
+        self.assertTrue(all(x.succeeded and x.value == x.host.upper() for x in results.values()))
+
+    def test_pool_size_bounds_concurrency(self):
+        """
+        Test that no more than pool_size hosts run at once.
+        """
+        lock = threading.Lock()
+        running = collections.Counter()
+
+        def task(host):
+            with lock:
+                running['now'] += 1
+                running['peak'] = max(running['peak'], running['now'])
+            time.sleep(0.05)
+            with lock:
+                running['now'] -= 1
+
+        executor.run_on_hosts(task, ['10.0.0.%s' % x for x in range(12)], pool_size=3)
+        self.assertEqual(running['peak'], 3)
+
+    def test_failed_host_is_retried(self):
+        """
+        Test that a failed host is retried, without affecting the other hosts.
+        """
+        attempts = collections.Counter()
+
+        def task(host):
+            attempts[host] += 1
+            if host == 'flaky' and attempts[host] == 1:
+                raise IOError('connection refused')
+
+        results = executor.run_on_hosts(task, ['flaky', 'steady'], retries=2, retry_interval=0)
+        self.assertEqual(executor.failures(results), [])
+        self.assertEqual(results['flaky'].attempts, 2)
+        self.assertEqual(results['steady'].attempts, 1)
+
+    def test_failures_and_timeouts_are_reported_per_host(self):
+        """
+        Test that hosts which fail on every attempt, or time out, are reported with their errors, and that an attempt
+        which timed out (and may still be running) is not retried.
+        """
+        started = collections.Counter()
+
+        def task(host):
+            started[host] += 1
+            if host == 'broken':
+                raise IOError('connection refused')
+            if host == 'slow':
+                time.sleep(1)
+
+        results = executor.run_on_hosts(task, ['broken', 'slow', 'fine'], retries=1, timeout=0.1, retry_interval=0)
+        failures = executor.failures(results)
+        self.assertEqual([x.host for x in failures], ['broken', 'slow'])
+        self.assertIsInstance(results['broken'].error, IOError)
+        self.assertIsInstance(results['slow'].error, executor.HostTimeoutError)
+        self.assertEqual(results['broken'].attempts, 2)
+        self.assertEqual(results['slow'].attempts, 1)
+        self.assertEqual(started['slow'], 1)
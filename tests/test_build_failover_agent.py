@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+test_build_failover_agent.py
+
+Description: Tests for build_utils.failover_agent module.
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import unittest
+
+from build_utils import fab_utils, failover_agent
+
+
+class RecordingSession(object):
+    """
+    Stands in for a keystoneauth1 Session, recording the requests made.
+    """
+
+    def __init__(self, error=None):
+        self.requests = []
+        self.error = error
+
+    def put(self, url, **kwargs):
+        self.requests.append(('PUT', url, kwargs))
+        if self.error:
+            raise self.error
+
+
+class TestFailoverAgent(unittest.TestCase):
+
+    def setUp(self):
+        self.session = RecordingSession()
+        self.agent = failover_agent.FailoverAgent(self.session, 'fip-1', region_name='RegionOne', interface='internal')
+
+    def test_handle_reassigns_floating_ip_with_single_update(self):
+        """
+        Test that handle moves the floating IP address to the requested port with a single PUT.
+        """
+        self.agent.handle('port-2 1500000000.25\n')
+        self.assertEqual(
+            self.session.requests,
+            [
+                (
+                    'PUT',
+                    '/v2.0/floatingips/fip-1',
+                    dict(
+                        endpoint_filter=dict(service_type='network', interface='internal', region_name='RegionOne'),
+                        json={'floatingip': {'port_id': 'port-2'}},
+                    )
+                )
+            ]
+        )
+
+    def test_handle_ignores_blank_messages(self):
+        """
+        Test that handle ignores blank lines written to the FIFO.
+        """
+        self.agent.handle('\n')
+        self.assertEqual(self.session.requests, [])
+
+    def test_handle_acknowledges_the_result(self):
+        """
+        Test that handle writes ok to the acknowledgement FIFO named by the notify script once the PUT succeeds, and
+        failed if it raises.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        ack_path = os.path.join(directory, 'ack')
+        os.mkfifo(ack_path)
+        reader = os.open(ack_path, os.O_RDONLY | os.O_NONBLOCK)  # as the notify script holds it open
+        self.addCleanup(os.close, reader)
+
+        self.assertTrue(self.agent.handle('port-2 1500000000.25 %s\n' % ack_path))
+        self.assertEqual(os.read(reader, 100), b'ok\n')
+
+        self.session.error = IOError('neutron is unavailable')
+        with self.assertLogs(failover_agent.logger, 'ERROR'):
+            self.assertFalse(self.agent.handle('port-1 1500000001.25 %s\n' % ack_path))
+        self.assertEqual(os.read(reader, 100), b'failed\n')
+
+    def test_acknowledgement_is_dropped_if_nobody_waits(self):
+        """
+        Test that handle does not block if the notify script has already given up waiting for the acknowledgement.
+        """
+        ack_path = os.path.join(tempfile.mkdtemp(), 'ack')
+        self.addCleanup(shutil.rmtree, os.path.dirname(ack_path))
+        os.mkfifo(ack_path)
+        with self.assertLogs(failover_agent.logger, 'WARNING'):
+            self.assertTrue(self.agent.handle('port-2 1500000000.25 %s\n' % ack_path))
+
+
+@unittest.skipUnless(shutil.which('bash') and shutil.which('timeout'), 'needs bash and timeout')
+class TestFailoverScript(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.fifo = os.path.join(self.directory, 'failover.fifo')
+        self.cli_log = os.path.join(self.directory, 'neutron.log')
+        bin_directory = os.path.join(self.directory, 'bin')
+        os.mkdir(bin_directory)
+        with open(os.path.join(bin_directory, 'neutron'), 'w') as neutron:
+            neutron.write('#!/bin/sh\necho "$@" >> %s\n' % self.cli_log)
+        os.chmod(os.path.join(bin_directory, 'neutron'), 0o755)
+        self.env = dict(os.environ, PATH=os.pathsep.join([bin_directory, os.environ.get('PATH', '')]))
+        self.script = os.path.join(self.directory, 'failover-primary-to-secondary.sh')
+        with open(self.script, 'w') as script:
+            script.write(fab_utils._generate_failover_sh(
+                'failover-primary-to-secondary.sh', 'fip-1', 'port-1', 'port-2', fifo=self.fifo
+            ))
+
+    def serve_one(self, session):
+        """
+        Serve a single request from the FIFO with an agent using the given session, in a daemon thread.
+        """
+        agent = failover_agent.FailoverAgent(session, 'fip-1')
+        os.mkfifo(self.fifo)
+
+        def serve():
+            with open(self.fifo) as fifo:
+                agent.handle(fifo.readline())
+
+        thread = threading.Thread(target=serve)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def cli_calls(self):
+        if not os.path.exists(self.cli_log):
+            return []
+        with open(self.cli_log) as cli_log:
+            return cli_log.read().splitlines()
+
+    def test_acknowledged_failover_does_not_use_the_cli(self):
+        """
+        Test that the notify script exits without running the neutron CLI once the agent acknowledges the update.
+        """
+        session = RecordingSession()
+        thread = self.serve_one(session)
+        self.assertEqual(subprocess.call(['bash', self.script], env=self.env), 0)
+        thread.join(5)
+        self.assertEqual(len(session.requests), 1)
+        self.assertEqual(self.cli_calls(), [])
+
+    def test_failed_put_falls_back_to_the_cli(self):
+        """
+        Test that the notify script moves the floating IP address with the neutron CLI when the agent's PUT fails,
+        rather than leaving it on the failed host.
+        """
+        session = RecordingSession(error=IOError('neutron is unavailable'))
+        thread = self.serve_one(session)
+        with self.assertLogs(failover_agent.logger, 'ERROR'):
+            self.assertEqual(subprocess.call(['bash', self.script], env=self.env), 0)
+            thread.join(5)
+        self.assertEqual(len(session.requests), 1)
+        self.assertEqual(
+            self.cli_calls(),
+            [
+                '--os-cloud 100percentit floatingip-disassociate fip-1 port-1',
+                '--os-cloud 100percentit floatingip-associate fip-1 port-2',
+            ]
+        )
+        self.assertEqual([x for x in os.listdir(self.directory) if '.ack.' in x], [])  # the ack FIFO is removed
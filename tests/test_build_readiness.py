@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+test_build_readiness.py
+
+Description: Tests for build_utils.readiness module.
+"""
+
+import socket
+import threading
+import time
+import unittest
+
+from build_utils import readiness
+
+
+class FakeSSHServer(object):
+    """
+    Listens on a local port, sending the given banner to each connection.
+    """
+
+    def __init__(self, banner=b'SSH-2.0-OpenSSH_7.2\r\n', port=0):
+        self.banner = banner
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('127.0.0.1', port))
+        self.listener.listen(5)
+        self.port = self.listener.getsockname()[1]
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                connection, _ = self.listener.accept()
+            except OSError:
+                return
+            if self.banner:
+                connection.sendall(self.banner)
+            time.sleep(0.05)
+            connection.close()
+
+    def close(self):
+        self.listener.close()
+
+
+def unused_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class TestProbe(unittest.TestCase):
+
+    def test_probe_states(self):
+        """
+        Test that probe distinguishes a ready sshd, a refused connection and a connection without a banner.
+        """
+        ssh_server = FakeSSHServer()
+        silent_server = FakeSSHServer(banner=None)
+        try:
+            self.assertEqual(readiness.probe('127.0.0.1', ssh_server.port), readiness.READY)
+            self.assertEqual(readiness.probe('127.0.0.1', silent_server.port, timeout=0.2), readiness.NO_BANNER)
+            self.assertEqual(readiness.probe('127.0.0.1', unused_port()), readiness.REFUSED)
+        finally:
+            ssh_server.close()
+            silent_server.close()
+
+
+class TestWaitForSSH(unittest.TestCase):
+
+    def test_wait_for_ssh_returns_once_sshd_starts(self):
+        """
+        Test that wait_for_ssh keeps probing a refusing host at the short interval, returning soon after sshd starts.
+        """
+        port = unused_port()
+        servers = []
+        starter = threading.Timer(0.5, lambda: servers.append(FakeSSHServer(port=port)))
+        starter.start()
+        try:
+            waited = readiness.wait_for_ssh('127.0.0.1', port, timeout=5, initial_interval=0.05)
+        finally:
+            starter.join()
+            for server in servers:
+                server.close()
+        self.assertGreaterEqual(waited, 0.5)
+        self.assertLess(waited, 1.5)
+
+    def test_wait_for_ssh_times_out(self):
+        """
+        Test that wait_for_ssh raises NotReadyError if the host does not become ready in time.
+        """
+        with self.assertRaises(readiness.NotReadyError):
+            readiness.wait_for_ssh('127.0.0.1', unused_port(), timeout=0.3, initial_interval=0.05)
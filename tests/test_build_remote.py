@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+test_build_remote.py
+
+Description: Tests for build_utils.remote module.
+"""
+
+import concurrent.futures
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import paramiko
+import yaml
+
+from build_utils import fab_utils, remote
+
+
+class TestLocalBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.sandbox_root = tempfile.TemporaryDirectory()
+        self.backend = remote.LocalBackend(self.sandbox_root.name, responses=[(r'^false', 'nope', 1)])
+        self.session = self.backend.session('10.0.0.1')
+
+    def tearDown(self):
+        self.sandbox_root.cleanup()
+
+    def test_put_writes_into_host_sandbox_relative_to_cd(self):
+        """
+        Test that put writes the file into the host's sandbox, resolving the remote path against cd.
+        """
+        with self.session.cd('/etc/salt'):
+            self.session.put(io.StringIO('master: 10.0.0.2'), 'minion', use_sudo=True, mode=0o600)
+        self.assertEqual(self.backend.read('10.0.0.1', '/etc/salt/minion'), 'master: 10.0.0.2')
+        self.assertEqual(
+            os.stat(os.path.join(self.sandbox_root.name, '10.0.0.1', 'etc/salt/minion')).st_mode & 0o777, 0o600
+        )
+        self.assertEqual(self.backend.puts['10.0.0.1'], [dict(path='/etc/salt/minion', sudo=True, mode=0o600)])
+        self.assertEqual(self.backend.bytes_sent['10.0.0.1'], len('master: 10.0.0.2'))
+
+    def test_commands_are_recorded_with_round_trips(self):
+        """
+        Test that commands are recorded with their directory, and each counts as a round trip.
+        """
+        with self.session.cd('/tmp'):
+            self.session.run('ls')
+        self.session.sudo('systemctl restart salt-minion')
+        self.assertEqual(
+            self.backend.commands['10.0.0.1'],
+            [
+                dict(command='ls', sudo=False, cwd='/tmp'),
+                dict(command='systemctl restart salt-minion', sudo=True, cwd=None),
+            ]
+        )
+        self.assertEqual(self.backend.round_trips['10.0.0.1'], 2)
+
+    def test_failed_command_raises_unless_warn_only(self):
+        """
+        Test that a failed command raises RemoteCommandError, unless warn_only is set.
+        """
+        result = self.session.run('false', warn_only=True)
+        self.assertTrue(result.failed)
+        self.assertEqual(result, 'nope')
+        with self.assertRaises(remote.RemoteCommandError):
+            self.session.run('false')
+
+
+class TestSSHSession(unittest.TestCase):
+
+    def test_wrap_runs_in_directory_in_login_shell_as_root(self):
+        """
+        Test that commands are wrapped as Fabric wraps them: in the current directory, in a login shell, and with
+        sudo -S for root.
+        """
+        session = remote.SSHBackend().session('10.0.0.1')
+        self.assertEqual(session.wrap('ls -l', use_sudo=False), '/bin/bash -l -c "ls -l"')
+        with session.cd('/srv'):
+            self.assertEqual(session.wrap('git pull', use_sudo=False), '/bin/bash -l -c "cd /srv && git pull"')
+            self.assertEqual(
+                session.wrap('git pull', use_sudo=True),
+                "sudo -S -p 'sudo password:' /bin/bash -l -c \"cd /srv && git pull\""
+            )
+
+    def test_wrap_escapes_the_command(self):
+        """
+        Test that the command is escaped so that the login shell, not the outer one, expands it.
+        """
+        session = remote.SSHBackend().session('10.0.0.1')
+        self.assertEqual(
+            session.wrap('echo "$HOME" `id -u` \\', use_sudo=False),
+            '/bin/bash -l -c "echo \\"\\$HOME\\" \\`id -u\\` \\\\"'
+        )
+
+
+class TestWarningHostKeyPolicy(unittest.TestCase):
+
+    def test_unknown_host_key_is_accepted_with_a_warning(self):
+        """
+        Test that the key of an unknown host is added to the client's host keys, and its fingerprint logged.
+        """
+        client = paramiko.SSHClient()
+        key = mock.Mock(get_name=lambda: 'ssh-ed25519', get_fingerprint=lambda: b'\x01\xab')
+        with mock.patch.object(client.get_host_keys(), 'add') as add:
+            with self.assertLogs(remote.logger, 'WARNING') as logs:
+                remote.WarningHostKeyPolicy().missing_host_key(client, '10.0.0.1', key)
+        add.assert_called_once_with('10.0.0.1', 'ssh-ed25519', key)
+        self.assertIn('ssh-ed25519 host key 01:ab', logs.output[0])
+
+
+class TestFabUtilsWithLocalBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.sandbox_root = tempfile.TemporaryDirectory()
+        self.backend = remote.LocalBackend(self.sandbox_root.name)
+        self.previous_backend = fab_utils.get_backend()
+        fab_utils.set_backend(self.backend)
+
+    def tearDown(self):
+        fab_utils.set_backend(self.previous_backend)
+        self.sandbox_root.cleanup()
+
+    def test_update_haproxy_backends(self):
+        """
+        Test that update_haproxy_backends places the pillar on the salt master and then applies the haproxy state.
+        """
+        servers = {'app-0-blog-dev': ['10.0.0.5'], 'salt-blog-dev': ['10.0.0.1']}
+        fab_utils.update_haproxy_backends('10.0.0.1', servers, 'app', ['vrrp-primary', 'vrrp-secondary'])
+        self.assertEqual(
+            yaml.safe_load(self.backend.read('10.0.0.1', '/srv/pillar/haproxy.sls')),
+            dict(backend_servers={'app-0-blog-dev': dict(ip_address='10.0.0.5')})
+        )
+        self.assertEqual(
+            [x['command'] for x in self.backend.commands['10.0.0.1']],
+            [
+                "salt -L 'vrrp-primary,vrrp-secondary' state.apply haproxy --state-output=terse && "
+                "salt -L 'vrrp-primary,vrrp-secondary' service.reload haproxy"
+            ]
+        )
+
+    def test_bootstrap_salt_minions_concurrently(self):
+        """
+        Test that minions can be bootstrapped from parallel threads, each host getting only its own bootstrap script,
+        in a single round trip.
+        """
+        minion_addresses = ['10.0.1.%s' % x for x in range(16)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda x: fab_utils.bootstrap_salt_minion(x, '10.0.0.1'), minion_addresses))
+        for minion_address in minion_addresses:
+            self.assertEqual(self.backend.round_trips[minion_address], 1)
+            [command] = self.backend.commands[minion_address]
+            self.assertTrue(command['sudo'])
+            self.assertIn('printf "master: 10.0.0.1" > /etc/salt/minion', command['command'])
+
+    def test_bootstrap_salt_minion_reports_steps(self):
+        """
+        Test that bootstrap_salt_minion returns the results of the steps, and raises if the script fails.
+        """
+        self.backend.responses.append(
+            (r'^bash -s', '@@step install_salt 0 100.0 130.5\n@@step configure_master 0 130.5 130.75', 0)
+        )
+        self.assertEqual(
+            fab_utils.bootstrap_salt_minion('10.0.1.1', '10.0.0.1'),
+            [
+                dict(name='install_salt', return_code=0, seconds=30.5),
+                dict(name='configure_master', return_code=0, seconds=0.25),
+            ]
+        )
+        self.backend.responses.insert(0, (r'^bash -s', '@@step install_salt 7 100.0 101.0', 7))
+        with self.assertRaises(remote.RemoteCommandError):
+            fab_utils.bootstrap_salt_minion('10.0.1.1', '10.0.0.1')
+
+
+class TestWaitForBackendDrain(unittest.TestCase):
+
+    def setUp(self):
+        self.sandbox_root = tempfile.TemporaryDirectory()
+        self.backend = remote.LocalBackend(self.sandbox_root.name)
+        self.previous_backend = fab_utils.get_backend()
+        fab_utils.set_backend(self.backend)
+        self.now = 1000.0
+        self.sleeps = []
+        self.clock = mock.patch.object(fab_utils, 'time', mock.Mock(time=lambda: self.now, sleep=self.sleep))
+        self.clock.start()
+
+    def tearDown(self):
+        self.clock.stop()
+        fab_utils.set_backend(self.previous_backend)
+        self.sandbox_root.cleanup()
+
+    def sleep(self, seconds):
+        """
+        Advance the fake clock, and move on to the next connection counts (if any), as if the connections drained.
+        """
+        self.sleeps.append(seconds)
+        self.now += seconds
+        if len(self.backend.responses) > 1:
+            self.backend.responses.pop(0)
+
+    def wait(self, timeout=60):
+        return fab_utils.wait_for_backend_drain(
+            '10.0.0.1', ['vrrp-primary', 'vrrp-secondary'], ['10.0.0.5'], timeout=timeout, interval=5
+        )
+
+    def count_commands(self):
+        return [x['command'] for x in self.backend.commands['10.0.0.1'] if 'ss -tn' in x['command']]
+
+    def test_waits_while_connections_remain_then_returns(self):
+        """
+        Test that wait_for_backend_drain keeps checking while the load balancers report connections, and returns
+        True as soon as they all report none.
+        """
+        self.backend.responses.extend([
+            (r'ss -tn', 'vrrp-primary: 3\nvrrp-secondary: 1', 0),
+            (r'ss -tn', 'vrrp-primary: 1\nvrrp-secondary: 0', 0),
+            (r'ss -tn', 'vrrp-primary: 0\nvrrp-secondary: 0', 0),
+        ])
+        self.assertTrue(self.wait())
+        self.assertEqual(self.sleeps, [5, 5])
+        self.assertEqual(len(self.count_commands()), 3)
+        self.assertIn("dst 10.0.0.5", self.count_commands()[0])
+
+    def test_returns_immediately_when_drained(self):
+        """
+        Test that wait_for_backend_drain does not sleep if there are no connections to begin with.
+        """
+        self.backend.responses.append((r'ss -tn', 'vrrp-primary: 0\nvrrp-secondary: 0', 0))
+        self.assertTrue(self.wait())
+        self.assertEqual(self.sleeps, [])
+
+    def test_gives_up_after_timeout(self):
+        """
+        Test that wait_for_backend_drain returns False once the timeout is reached, without sleeping past it.
+        """
+        self.backend.responses.append((r'ss -tn', 'vrrp-primary: 2\nvrrp-secondary: 0', 0))
+        self.assertFalse(self.wait(timeout=12))
+        self.assertEqual(self.sleeps, [5, 5])
+        self.assertEqual(len(self.count_commands()), 3)
+        self.assertLessEqual(sum(self.sleeps), 12)
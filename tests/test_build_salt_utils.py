@@ -59,3 +59,16 @@ openstack:
 
         self.assertEqual(type(returned), type(io.StringIO()))
         self.assertEqual(expected, yaml.load(returned.read()))
+
+
+class TestParseTxtOutput(unittest.TestCase):
+
+    def test_parse_txt_output(self):
+        """
+        Test that parse_txt_output returns a dict of minion id to value, ignoring lines without a minion id.
+        """
+        output = 'vrrp-primary: 3\nvrrp-secondary: 0\n\n[ERROR   ] something went wrong\n'
+        self.assertEqual(
+            salt_utils.parse_txt_output(output),
+            {'vrrp-primary': '3', 'vrrp-secondary': '0'}
+        )
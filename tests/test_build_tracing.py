@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+test_build_tracing.py
+
+Description: Tests for build_utils.tracing module.
+"""
+
+import unittest
+
+from build_utils import tracing
+
+
+class TestTracer(unittest.TestCase):
+
+    def setUp(self):
+        self.tracer = tracing.Tracer()
+
+    def test_instrument_function_records_host_resource_and_outcome(self):
+        """
+        Test that an instrumented function records a span with the host and resource taken from its arguments.
+        """
+        def bootstrap_salt_minion(salt_minion_address, salt_master_address):
+            return salt_master_address
+
+        def delete_server(server_name, network_name):
+            raise KeyError(server_name)
+
+        traced_bootstrap = self.tracer.instrument_function(bootstrap_salt_minion, 'fab')
+        traced_delete = self.tracer.instrument_function(delete_server, 'facade')
+
+        self.assertEqual(traced_bootstrap('10.0.0.2', salt_master_address='10.0.0.1'), '10.0.0.1')
+        with self.assertRaises(KeyError):
+            traced_delete('app-0-blog-dev', 'network-blog-dev')
+
+        self.assertEqual(
+            [(x.name, x.category, x.host, x.resource, x.outcome) for x in self.tracer.spans],
+            [
+                ('bootstrap_salt_minion', 'fab', '10.0.0.2', None, 'ok'),
+                ('delete_server', 'facade', None, 'app-0-blog-dev', 'KeyError'),
+            ]
+        )
+
+    def test_instrument_object_skips_generator_methods(self):
+        """
+        Test that the generator methods of an object are not recorded, as their spans would end before their work.
+        """
+        class Facade(object):
+
+            def find_server(self, server_name):
+                return next(self.paginate(), None)
+
+            def paginate(self):
+                yield 'app-0-blog-dev'
+
+        facade = Facade()
+        self.tracer.instrument_object(facade, 'facade')
+
+        self.assertEqual(facade.find_server('app-0-blog-dev'), 'app-0-blog-dev')
+        self.assertEqual([x.name for x in self.tracer.spans], ['facade.find_server'])
+
+    def test_to_chrome_trace(self):
+        """
+        Test that the recorded spans are exported as complete events, preceded by thread name metadata.
+        """
+        class Server(object):
+            name = 'salt-blog-dev'
+
+        with self.tracer.span('create_salt_server', 'phase', resource=Server().name):
+            pass
+
+        events = self.tracer.to_chrome_trace()['traceEvents']
+        self.assertEqual([x['ph'] for x in events], ['M', 'X'])
+        self.assertEqual(events[1]['name'], 'create_salt_server')
+        self.assertEqual(events[1]['cat'], 'phase')
+        self.assertEqual(events[1]['args'], dict(host=None, resource='salt-blog-dev', outcome='ok'))
+        self.assertGreaterEqual(events[1]['dur'], 0)
@@ -6,6 +6,7 @@ Description: Tests for build_utils.utils module.
 Written by:  maharg101 on 25th February 2018
 """
 
+import subprocess
 import unittest
 
 from build_utils import utils
@@ -130,4 +131,75 @@ class TestPopulateOpenStackParamsFromEnviron(unittest.TestCase):
             OS_PASSWORD='hackme',
         )
         utils.populate_openstack_params_from_environ(params, env_dict)  # updates in place
-        self.assertEqual(params, expected_params)
\ No newline at end of file
+        self.assertEqual(params, expected_params)
+
+
+class TestConstructServerNamePattern(unittest.TestCase):
+
+    def test_construct_server_name_pattern_matches_numbered_servers(self):
+        """
+        Test that construct_server_name_pattern matches numbered server names and captures the server number.
+        """
+        params = dict(
+            server_base_name='hello-world-dev',
+        )
+        pattern = utils.construct_server_name_pattern(params, 'app')
+        self.assertEqual(pattern.match('app-0-hello-world-dev').group(1), '0')
+        self.assertEqual(pattern.match('app-12-hello-world-dev').group(1), '12')
+
+    def test_construct_server_name_pattern_ignores_other_servers(self):
+        """
+        Test that construct_server_name_pattern does not match servers from other environments or roles.
+        """
+        params = dict(
+            server_base_name='hello-world-dev',
+        )
+        pattern = utils.construct_server_name_pattern(params, 'app')
+        self.assertIsNone(pattern.match('app-0-hello-world-dev-2'))
+        self.assertIsNone(pattern.match('app-x-hello-world-dev'))
+        self.assertIsNone(pattern.match('salt-hello-world-dev'))
+        self.assertIsNone(pattern.match('vrrp-primary'))
+
+
+class TestStepScript(unittest.TestCase):
+
+    def test_step_script_stops_at_first_failure(self):
+        """
+        Test that a rendered step script reports each step which ran, and stops with the exit code of the first step
+        to fail.
+        """
+        script = utils.render_step_script(
+            'test', [('one', 'echo "one\'s output"'), ('two', 'cd /tmp && exit 3'), ('three', 'true')]
+        )
+        completed = subprocess.run(['bash', '-s'], input=script, stdout=subprocess.PIPE, universal_newlines=True)
+        self.assertEqual(completed.returncode, 3)
+        self.assertIn("one's output", completed.stdout)
+        results = utils.parse_step_script_output(completed.stdout)
+        self.assertEqual([(x['name'], x['return_code']) for x in results], [('one', 0), ('two', 3)])
+        self.assertTrue(all(x['seconds'] >= 0 for x in results))
+
+    def test_parse_step_script_output_ignores_other_lines(self):
+        """
+        Test that parse_step_script_output ignores lines which are not step results.
+        """
+        self.assertEqual(
+            utils.parse_step_script_output('installing\n@@step pull 0 10.0 12.5\n@@step broken\n'),
+            [dict(name='pull', return_code=0, seconds=2.5)]
+        )
+
+
+class TestCalculateQuotaShortfall(unittest.TestCase):
+
+    def test_calculate_quota_shortfall(self):
+        """
+        Test that only the resources whose demand exceeds the remaining quota are reported, ignoring unlimited ones.
+        """
+        usage = dict(
+            instances=dict(limit=10, used=8),
+            ram=dict(limit=20480, used=4096),
+            ports=dict(limit=-1, used=500),
+        )
+        self.assertEqual(
+            utils.calculate_quota_shortfall(dict(instances=5, ram=10240, ports=1000), usage),
+            [dict(resource='instances', demand=5, limit=10, used=8, available=2, shortfall=3)]
+        )
@@ -6,15 +6,24 @@ Description: Tests for openstack_infrastructure package.
 Written by:  maharg101 on 25th February 2018
 """
 
+import collections
+import io
+import json
+import re
+import threading
+import time
 import unittest
+from unittest import mock
 
-from openstack_infrastructure import facade as osf
+import requests
+from openstack import exceptions
+from openstack_infrastructure import facade as osf, fake_cloud, inventory, middleware, planner
 
 
 class TestValidateImageFlavorCombination(unittest.TestCase):
 
     def setUp(self):
-        self.os_facade = osf.OpenStackFacade()
+        self.os_facade = osf.OpenStackFacade(conn=fake_cloud.FakeConnection())
 
     def test_valid_image_flavour_ram_disk_ok(self):
         """
@@ -92,3 +101,664 @@ class TestValidateImageFlavorCombination(unittest.TestCase):
             'm1.pico does not have the minimum recommended disk for Foo OS'
         )
 
+
+class TestApiProfiler(unittest.TestCase):
+
+    def test_api_profiler_counts_calls_and_listed_items(self):
+        """
+        Test that ApiProfiler counts calls by service, operation and caller, including the items listed.
+        """
+        class Network(object):
+            @staticmethod
+            def ports():
+                yield dict(id='port-1')
+                yield dict(id='port-2')
+
+            @staticmethod
+            def find_router(name):
+                return dict(name=name)
+
+        class Connection(object):
+            network = Network()
+
+        profiler = middleware.ApiProfiler(Connection())
+
+        def find_or_create_port():
+            return list(profiler.network.ports())
+
+        self.assertEqual(len(find_or_create_port()), 2)
+        self.assertEqual(profiler.network.find_router('r1'), dict(name='r1'))
+
+        rows = {(x['service'], x['operation'], x['caller']): x for x in profiler.summary()}
+        ports_row = rows[('network', 'ports', 'find_or_create_port')]
+        self.assertEqual((ports_row['calls'], ports_row['items'], ports_row['errors']), (1, 2, 0))
+        self.assertEqual(ports_row['bytes'], 2 * len('{"id": "port-1"}'))
+        router_row = rows[('network', 'find_router', 'test_api_profiler_counts_calls_and_listed_items')]
+        self.assertEqual((router_row['calls'], router_row['items']), (1, 0))
+
+
+class TestCatalogCache(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = fake_cloud.FakeConnection()
+        self.catalog_cache = middleware.CatalogCache(self.conn)
+
+    def test_catalog_lookups_are_cached(self):
+        """
+        Test that flavor and public network lookups are cached, but lookups of other networks are not.
+        """
+        for _ in range(3):
+            self.assertEqual(self.catalog_cache.compute.find_flavor('m1.small').name, 'm1.small')
+            self.assertEqual(self.catalog_cache.network.find_network('public').name, 'public')
+            self.assertIsNone(self.catalog_cache.network.find_network('network-blog-dev'))
+        self.assertEqual(self.conn.calls[('compute', 'find_flavor')], 1)
+        self.assertEqual(self.conn.calls[('network', 'find_network')], 4)
+        self.assertEqual((self.catalog_cache.hits, self.catalog_cache.misses), (4, 2))
+
+    def test_key_pair_listing_is_invalidated_by_create(self):
+        """
+        Test that the cached key pair listing is dropped when a key pair is created through the cache.
+        """
+        self.assertEqual(list(self.catalog_cache.compute.keypairs()), [])
+        self.catalog_cache.compute.create_keypair(name='salt-cloud')
+        self.assertEqual([x.name for x in self.catalog_cache.compute.keypairs()], ['salt-cloud'])
+        self.assertEqual([x.name for x in self.catalog_cache.compute.keypairs()], ['salt-cloud'])
+        self.assertEqual(self.conn.calls[('compute', 'keypairs')], 2)
+
+
+class TestConcurrencyLimiter(unittest.TestCase):
+
+    def test_calls_in_flight_are_capped(self):
+        """
+        Test that no more than max_concurrency calls are in flight at once, across threads.
+        """
+        lock = threading.Lock()
+        in_flight = collections.Counter()
+
+        class Compute(object):
+            @staticmethod
+            def find_server(name):
+                with lock:
+                    in_flight['now'] += 1
+                    in_flight['peak'] = max(in_flight['peak'], in_flight['now'])
+                time.sleep(0.02)
+                with lock:
+                    in_flight['now'] -= 1
+
+        class Connection(object):
+            compute = Compute()
+
+        limiter = middleware.ConcurrencyLimiter(Connection(), 2)
+        threads = [threading.Thread(target=limiter.compute.find_server, args=('app-%s' % x,)) for x in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(in_flight['peak'], 2)
+
+
+def http_error(status_code, retry_after=None):
+    """
+    Construct an HttpException for the given status code, with an optional Retry-After header.
+    """
+    response = requests.Response()
+    response.status_code = status_code
+    if retry_after is not None:
+        response.headers['Retry-After'] = retry_after
+    return exceptions.HttpException('injected %s' % status_code, response=response)
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_token_bucket_limits_rate(self):
+        """
+        Test that once the burst is used up, calls are spaced out at the rate of the bucket.
+        """
+        bucket = middleware.TokenBucket(rate=100.0, burst=2)
+        started = time.monotonic()
+        for _ in range(7):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.045)
+
+    def test_throttled_call_is_retried_after_retry_after(self):
+        """
+        Test that a throttled call is retried (even a create) after the Retry-After delay, and counted.
+        """
+        conn = fake_cloud.FakeConnection()
+        rate_limiter = middleware.RateLimiter(conn, rates=dict(network=1000.0))
+        conn.fail('create_network', http_error(429, retry_after='0.05'))
+        started = time.monotonic()
+        network = rate_limiter.network.create_network(name='network-blog-dev')
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+        self.assertEqual(network.name, 'network-blog-dev')
+        self.assertEqual(conn.calls[('network', 'create_network')], 2)
+        self.assertEqual(
+            middleware.format_counts('throttled calls', rate_limiter.throttles),
+            'throttled calls: 1 (network.create_network 1)'
+        )
+
+    def test_each_page_takes_a_token_and_a_throttled_page_is_resumed(self):
+        """
+        Test that each page requested while consuming a listing takes a token, and that a throttled second page is
+        requested again after the last item returned, rather than the error reaching the caller.
+        """
+        ports = [fake_cloud.FakeResource(id='port-%s' % x) for x in range(5)]
+        requests_made = []
+        throttled_pages = [2]
+
+        class Network(object):
+            @staticmethod
+            def ports(limit=None, marker=None):
+                start = 0 if marker is None else [x.id for x in ports].index(marker) + 1
+                page = 1
+                while True:
+                    requests_made.append(start)
+                    if page in throttled_pages:
+                        throttled_pages.remove(page)
+                        raise http_error(429, retry_after='0')
+                    for port in ports[start:start + limit]:
+                        yield port
+                    if len(ports[start:start + limit]) < limit:
+                        return
+                    start += limit
+                    page += 1
+
+        class Connection(object):
+            network = Network()
+
+        rate_limiter = middleware.RateLimiter(Connection(), rates=dict(network=1000.0))
+        with mock.patch.object(rate_limiter.buckets['network'], 'acquire', return_value=0.0) as acquire:
+            self.assertEqual([x.id for x in rate_limiter.network.ports(limit=2)], [x.id for x in ports])
+        self.assertEqual(requests_made, [0, 2, 2, 4])  # the offsets of the pages requested
+        self.assertEqual(acquire.call_count, 4)  # one per page requested, including the throttled one
+        self.assertEqual(
+            middleware.format_counts('throttled calls', rate_limiter.throttles),
+            'throttled calls: 1 (network.ports 1)'
+        )
+
+    def test_other_errors_are_not_retried(self):
+        """
+        Test that errors other than throttling are raised at once.
+        """
+        conn = fake_cloud.FakeConnection()
+        rate_limiter = middleware.RateLimiter(conn)
+        conn.fail('find_router', http_error(503))
+        with self.assertRaises(exceptions.HttpException):
+            rate_limiter.network.find_router('router-blog-dev')
+        self.assertEqual(sum(rate_limiter.throttles.values()), 0)
+
+
+class TestRetrier(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = fake_cloud.FakeConnection()
+        self.retrier = middleware.Retrier(self.conn, retries=2, backoff=0.001)
+
+    def test_transient_errors_of_idempotent_calls_are_retried(self):
+        """
+        Test that idempotent calls, including listing calls which fail before returning items, are retried.
+        """
+        self.conn.fail('find_router', http_error(503), times=2)
+        self.assertIsNone(self.retrier.network.find_router('router-blog-dev'))
+        self.conn.fail('networks', http_error(502))
+        self.assertEqual([x.name for x in self.retrier.network.networks()], ['public'])
+        self.assertEqual(
+            middleware.format_counts('retried calls', self.retrier.retried),
+            'retried calls: 3 (network.find_router 2, network.networks 1)'
+        )
+
+    def test_creates_and_persistent_errors_are_not_retried(self):
+        """
+        Test that creates are not retried, and that other calls give up after the configured number of retries.
+        """
+        self.conn.fail('create_router', http_error(503))
+        with self.assertRaises(exceptions.HttpException):
+            self.retrier.network.create_router(name='router-blog-dev')
+        self.conn.fail('find_router', http_error(500), times=3)
+        with self.assertRaises(exceptions.HttpException):
+            self.retrier.network.find_router('router-blog-dev')
+        self.assertEqual(self.conn.calls[('network', 'create_router')], 1)
+        self.assertEqual(self.conn.calls[('network', 'find_router')], 3)
+
+
+class TestFacadeWithFakeCloud(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = fake_cloud.FakeConnection()
+        self.os_facade = osf.OpenStackFacade(conn=self.conn)
+
+    def build_network(self):
+        router = self.os_facade.find_or_create_router('router-blog-dev')
+        network = self.os_facade.find_or_create_network('network-blog-dev')
+        subnet = self.os_facade.find_or_create_subnet('subnet-blog-dev', network=network)
+        port = self.os_facade.find_or_create_port(network, subnet)
+        self.os_facade.add_interface_to_router(router, subnet, port)
+        return network, subnet, port
+
+    def test_find_or_create_server_assigns_floating_ip(self):
+        """
+        Test that find_or_create_server creates an active server with a floating IP, and finds it the second time.
+        """
+        network, subnet, port = self.build_network()
+        server = self.os_facade.find_or_create_server('app-0-blog-dev', network, subnet, port)
+        self.assertEqual(server.status, 'ACTIVE')
+
+        public_addresses = self.os_facade.get_public_addresses(server, 'network-blog-dev')
+        self.assertEqual(len(public_addresses), 1)
+
+        creates_before = self.conn.calls[('compute', 'create_server')]
+        found_server = self.os_facade.find_or_create_server('app-0-blog-dev', network, subnet, port)
+        self.assertEqual(found_server.id, server.id)
+        self.assertEqual(self.conn.calls[('compute', 'create_server')], creates_before)
+
+    def test_get_public_addresses_filters_on_the_server_side(self):
+        """
+        Test that get_public_addresses lists only the server's own port and floating IP address, however many servers
+        there are, and does not return the address of another environment's server with the same fixed address.
+        """
+        servers = []
+        for environment in ('dev', 'test'):
+            router = self.os_facade.find_or_create_router('router-blog-%s' % environment)
+            network = self.os_facade.find_or_create_network('network-blog-%s' % environment)
+            subnet = self.os_facade.find_or_create_subnet('subnet-blog-%s' % environment, network=network)
+            port = self.os_facade.find_or_create_port(network, subnet)
+            self.os_facade.add_interface_to_router(router, subnet, port)
+            for index in range(5):
+                servers.append(self.os_facade.find_or_create_server(
+                    'app-%s-blog-%s' % (index, environment), network, subnet, port
+                ))
+        dev_server, test_server = servers[0], servers[5]
+        self.assertEqual(
+            dev_server.addresses['network-blog-dev'][0]['addr'], test_server.addresses['network-blog-test'][0]['addr']
+        )
+
+        self.os_facade.conn = middleware.ApiProfiler(self.conn)
+        dev_addresses = self.os_facade.get_public_addresses(dev_server, 'network-blog-dev')
+        test_addresses = self.os_facade.get_public_addresses(test_server, 'network-blog-test')
+        self.assertEqual(len(dev_addresses), 1)
+        self.assertEqual(len(test_addresses), 1)
+        self.assertNotEqual(dev_addresses[0].id, test_addresses[0].id)
+        self.assertEqual(sum(x['items'] for x in self.os_facade.conn.summary()), 4)  # a port and an address each
+
+    def test_delete_server_releases_floating_ip(self):
+        """
+        Test that delete_server deletes the server and releases its floating IP.
+        """
+        network, subnet, port = self.build_network()
+        self.os_facade.find_or_create_server('app-0-blog-dev', network, subnet, port)
+        self.os_facade.delete_server('app-0-blog-dev', 'network-blog-dev')
+        self.assertIsNone(self.os_facade.find_server('app-0-blog-dev'))
+        self.assertEqual(list(self.conn.network.ips()), [])
+
+    def test_delete_network_components(self):
+        """
+        Test that the network components can be deleted in the order used by build.py
+        """
+        self.build_network()
+        self.os_facade.delete_subnet('subnet-blog-dev', 'router-blog-dev')
+        self.os_facade.delete_network('network-blog-dev')
+        self.os_facade.delete_router('router-blog-dev')
+        self.assertEqual(list(self.conn.network.routers()), [])
+        self.assertEqual([x.name for x in self.conn.network.networks()], ['public'])
+
+    def test_injected_failure(self):
+        """
+        Test that an injected failure is raised by the next call only.
+        """
+        self.conn.fail('routers')
+        with self.assertRaises(exceptions.HttpException):
+            self.os_facade.find_or_create_router('router-blog-dev')
+        self.assertEqual(self.os_facade.find_or_create_router('router-blog-dev').name, 'router-blog-dev')
+
+    def test_silent_mode_is_per_facade(self):
+        """
+        Test that a silent facade does not silence other facades.
+        """
+        noisy_facade = osf.OpenStackFacade(conn=self.conn, silent=False)
+        with mock.patch('builtins.print') as mock_print:
+            self.os_facade.display('silent')
+            noisy_facade.display('noisy', ['data'])
+        self.assertEqual(mock_print.call_args_list, [mock.call("\nnoisy\n-----\n['data']\n")])
+
+    def test_recycled_floating_ip_is_claimed_from_the_pool(self):
+        """
+        Test that a recycled floating IP address is returned to the pool, and claimed by the next server.
+        """
+        self.os_facade.recycle_floating_ips = True
+        network, subnet, port = self.build_network()
+        server = self.os_facade.find_or_create_server('app-0-blog-dev', network, subnet, port)
+        address = self.os_facade.get_public_addresses(server, 'network-blog-dev')[0].floating_ip_address
+        self.os_facade.delete_server('app-0-blog-dev', 'network-blog-dev')
+        public_network = self.os_facade.find_network('public')
+        self.assertEqual(
+            [x.floating_ip_address for x in self.os_facade.get_pooled_floating_ips(public_network)], [address]
+        )
+
+        server = self.os_facade.find_or_create_server('app-1-blog-dev', network, subnet, port)
+        self.assertEqual(
+            [x.floating_ip_address for x in self.os_facade.get_public_addresses(server, 'network-blog-dev')], [address]
+        )
+        self.assertEqual(self.os_facade.get_pooled_floating_ips(public_network), [])
+        self.assertEqual(self.conn.calls[('network', 'create_ip')], 1)
+        self.assertEqual(
+            osf.format_floating_ip_pool_stats(self.os_facade.floating_ip_pool_stats),
+            'floating IP pool: 1 hits, 1 misses (50% hit rate), 1 returned'
+        )
+
+    def test_only_returned_addresses_are_pooled(self):
+        """
+        Test that allocated and claimed addresses do not carry the pool description, and that an address tagged for an
+        environment (e.g. its HA address, while disassociated during a failover) is never claimed from the pool.
+        """
+        self.os_facade.recycle_floating_ips = True
+        network, subnet, port = self.build_network()
+        public_network = self.os_facade.find_network('public')
+        with self.os_facade.tag_context(app='blog', environment='dev', role='load-balancer'):
+            server = self.os_facade.find_or_create_server('vrrp-primary', network, subnet, port)
+            ha_address = self.os_facade.assign_floating_ip(network, port, server, subnet)
+        self.assertFalse(ha_address.description)
+        self.conn.network.update_ip(ha_address, port_id=None, description=osf.FLOATING_IP_POOL_DESCRIPTION)
+        self.assertEqual(self.os_facade.get_pooled_floating_ips(public_network), [])
+
+        self.os_facade.delete_server('vrrp-primary', 'network-blog-dev')
+        pooled = self.os_facade.get_pooled_floating_ips(public_network)
+        self.assertEqual(len(pooled), 1)  # the server's own address, not the HA address
+        self.assertNotEqual(pooled[0].id, ha_address.id)
+        server = self.os_facade.find_or_create_server('app-0-blog-dev', network, subnet, port)
+        claimed = self.os_facade.get_public_addresses(server, 'network-blog-dev')
+        self.assertEqual(len(claimed), 1)
+        self.assertFalse(claimed[0].description)
+        self.assertEqual(self.os_facade.floating_ip_pool_stats['hits'], 1)
+
+    def test_address_claimed_by_another_process_is_not_taken_from_it(self):
+        """
+        Test that a pooled floating IP address claimed by another process after it was listed is neither moved to
+        this process's server nor counted as a hit: the claim is a compare-and-swap on its revision number.
+        """
+        network, subnet, port = self.build_network()
+        public_network = self.os_facade.find_network('public')
+        for _ in range(2):
+            self.conn.network.create_ip(
+                floating_network_id=public_network.id, description=osf.FLOATING_IP_POOL_DESCRIPTION
+            )
+        listed = [  # as listed before the other process claims one (the fake cloud lists the live resources)
+            fake_cloud.FakeResource(**x.to_dict()) for x in self.os_facade.get_pooled_floating_ips(public_network)
+        ]
+        other_facade = osf.OpenStackFacade(conn=self.conn)
+        other_port = self.conn.network.create_port(network_id=network.id)
+        taken = other_facade.claim_pooled_floating_ip(public_network, other_port, '10.0.0.99')
+        self.assertEqual(taken.id, listed[0].id)
+
+        with mock.patch.object(self.os_facade, 'iterate_pooled_floating_ips', return_value=iter(listed)):
+            claimed = self.os_facade.claim_pooled_floating_ip(public_network, port, '10.0.0.10')
+        self.assertEqual(claimed.id, listed[1].id)
+        self.assertEqual(claimed.port_id, port.id)
+        self.assertEqual(self.conn.network.get_ip(taken.id).port_id, other_port.id)
+        self.assertEqual(self.os_facade.floating_ip_pool_stats['hits'], 1)
+
+        listed = [fake_cloud.FakeResource(**self.conn.network.get_ip(taken.id).to_dict())]  # nor one changed since
+        self.conn.network.update_ip(taken, description='changed since listed')
+        with mock.patch.object(self.os_facade, 'iterate_pooled_floating_ips', return_value=iter(listed)):
+            self.assertIsNone(self.os_facade.claim_pooled_floating_ip(public_network, port, '10.0.0.10'))
+        self.assertEqual(self.os_facade.floating_ip_pool_stats['misses'], 1)
+
+
+class TestTagging(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = fake_cloud.FakeConnection()
+        self.os_facade = osf.OpenStackFacade(conn=self.conn)
+        self.os_facade.set_tag_context(app='blog', environment='dev')
+
+    def test_created_resources_are_tagged(self):
+        """
+        Test that the network resources created are given neutron tags, and the servers nova tags, for their role.
+        """
+        with self.os_facade.tag_context(role='network'):
+            router = self.os_facade.find_or_create_router('router-blog-dev')
+            network = self.os_facade.find_or_create_network('network-blog-dev')
+            subnet = self.os_facade.find_or_create_subnet('subnet-blog-dev', network=network)
+            port = self.os_facade.find_or_create_port(network, subnet)
+        with self.os_facade.tag_context(role='app'):
+            server = self.os_facade.find_or_create_server('app-0-blog-dev', network, subnet, port)
+        self.assertEqual(router.tags, ['gdl100', 'gdl100:app=blog', 'gdl100:environment=dev', 'gdl100:role=network'])
+        self.assertEqual(
+            [x.name for x in self.conn.network.subnets(tags='gdl100:environment=dev,gdl100:role=network')],
+            ['subnet-blog-dev']
+        )
+        self.assertEqual(osf.parse_tags(server), dict(app='blog', environment='dev', role='app'))
+        self.assertEqual(
+            [x.name for x in self.conn.compute.servers(tags='gdl100:environment=dev,gdl100:role=app')],
+            ['app-0-blog-dev']
+        )
+        floating_ip = self.os_facade.get_public_addresses(server, 'network-blog-dev')[0]
+        self.assertEqual(osf.parse_tags(floating_ip), dict(app='blog', environment='dev', role='app'))
+        self.assertEqual(self.os_facade.current_tags(), dict(app='blog', environment='dev'))
+
+    def test_tag_context_is_per_thread(self):
+        """
+        Test that the tags added by a tag context do not leak into other threads.
+        """
+        seen = []
+        with self.os_facade.tag_context(role='app'):
+            thread = threading.Thread(target=lambda: seen.append(self.os_facade.current_tags()))
+            thread.start()
+            thread.join()
+        self.assertEqual(seen, [dict(app='blog', environment='dev')])
+
+    def test_find_servers_excludes_servers_tagged_for_another_environment(self):
+        """
+        Test that a server tagged for another environment is not found by name, while an untagged one still is.
+        """
+        network = self.os_facade.find_or_create_network('network-blog-dev')
+        subnet = self.os_facade.find_or_create_subnet('subnet-blog-dev', network=network)
+        port = self.os_facade.find_or_create_port(network, subnet)
+        with self.os_facade.tag_context(environment='prod', role='app'):
+            self.os_facade.find_or_create_server('app-0-blog-dev', network, subnet, port)
+        untagged_facade = osf.OpenStackFacade(conn=self.conn)
+        untagged_facade.find_or_create_server('app-1-blog-dev', network, subnet, port)
+
+        name_pattern = re.compile(r'^app-(\d+)-blog-dev$')
+        servers = self.os_facade.find_servers(name_pattern, dict(self.os_facade.tags, role='app'))
+        self.assertEqual([x.name for x in servers], ['app-1-blog-dev'])
+        self.assertEqual(len(self.os_facade.find_servers(name_pattern)), 2)
+        prod_server = self.conn.compute.find_server('app-0-blog-dev')
+        self.assertTrue(inventory.EnvironmentSelector(self.conn, 'blog-prod')('server', prod_server))
+
+    def test_resources_of_another_environment_are_not_found_by_name(self):
+        """
+        Test that resources are found with tag filters on the server side: one of the same name tagged for another
+        environment is neither reused nor deleted, while an untagged one (built before resources were tagged) is.
+        """
+        prod_facade = osf.OpenStackFacade(conn=self.conn)
+        prod_facade.set_tag_context(app='blog', environment='prod')
+        prod_router = prod_facade.find_or_create_router('router-blog')
+        network = prod_facade.find_or_create_network('network-blog')
+        subnet = prod_facade.find_or_create_subnet('subnet-blog', network=network)
+        port = prod_facade.find_or_create_port(network, subnet)
+        prod_server = prod_facade.find_or_create_server('vrrp-primary', network, subnet, port)
+
+        self.assertNotEqual(self.os_facade.find_or_create_router('router-blog').id, prod_router.id)
+        self.assertIsNone(self.os_facade.find_server('vrrp-primary'))
+        self.assertEqual(self.os_facade.find_server('vrrp-primary', tags=dict()).id, prod_server.id)
+        self.os_facade.delete_server('vrrp-primary', 'network-blog')
+        self.assertEqual([x.id for x in self.conn.compute.servers()], [prod_server.id])
+
+        untagged_server = self.conn.compute.create_server('vrrp-secondary', image_id=prod_server.image_id,
+                                                          flavor_id=prod_server.flavor_id, networks=[])
+        self.assertEqual(self.os_facade.find_server('vrrp-secondary').id, untagged_server.id)
+        self.assertIsNone(self.os_facade.find_server('vrrp'))  # nova matches a name filter as a pattern
+
+    def test_servers_are_tagged_at_the_tags_microversion(self):
+        """
+        Test that server tags are replaced in one call at the microversion which introduced them, and that a renamed
+        server is retagged.
+        """
+        network = self.os_facade.find_or_create_network('network-blog-dev')
+        subnet = self.os_facade.find_or_create_subnet('subnet-blog-dev', network=network)
+        port = self.os_facade.find_or_create_port(network, subnet)
+        with self.os_facade.tag_context(role='standby'):
+            server = self.os_facade.find_or_create_server('standby-0-blog-dev', network, subnet, port)
+        with self.os_facade.tag_context(role='app'):
+            server = self.os_facade.rename_server(server, 'app-0-blog-dev')
+        self.assertEqual(osf.parse_tags(server), dict(app='blog', environment='dev', role='app'))
+        self.assertEqual(self.conn.calls[('compute', 'put')], 2)
+        with mock.patch.object(osf, 'SERVER_TAGS_MICROVERSION', '2.1'), self.assertRaises(exceptions.HttpException):
+            self.os_facade.tag_server(server)  # a failure is raised, as the proxy returns the response of a raw PUT
+
+
+class TestPaginate(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = fake_cloud.FakeConnection()
+        self.api_profiler = middleware.ApiProfiler(self.conn)
+        self.os_facade = osf.OpenStackFacade(conn=self.api_profiler, page_size=25)
+
+    def items_listed(self, operation):
+        return sum(x['items'] for x in self.api_profiler.summary() if x['operation'] == operation)
+
+    def test_pages_are_requested_lazily_and_stop_at_the_limit(self):
+        """
+        Test that paginate passes the page size, and stops consuming the listing once the limit has matched.
+        """
+        requests = []
+
+        def listing(**query):
+            requests.append(query)
+            for number in range(1000):
+                yield number
+
+        odd_numbers = self.os_facade.paginate(listing, predicate=lambda x: x % 2, limit=3, marker='abc')
+        self.assertEqual(list(odd_numbers), [1, 3, 5])
+        self.assertEqual(requests, [dict(limit=25, marker='abc')])
+
+    def test_first_key_pair_stops_at_the_first(self):
+        """
+        Test that get_name_of_first_key_pair consumes only the first key pair, however many there are.
+        """
+        for number in range(100):
+            self.conn.compute.create_keypair(name='key-%s' % number)
+        self.assertEqual(self.os_facade.get_name_of_first_key_pair(), 'key-0')
+        self.assertEqual(self.items_listed('keypairs'), 1)
+
+    def test_find_or_create_port_filters_by_network_on_the_server_side(self):
+        """
+        Test that find_or_create_port only lists the ports of its network.
+        """
+        networks = []
+        for name in ('network-blog-dev', 'network-blog-prod'):
+            network = self.os_facade.find_or_create_network(name)
+            subnet = self.os_facade.find_or_create_subnet(name.replace('network', 'subnet'), network=network)
+            networks.append((network, subnet, self.os_facade.find_or_create_port(network, subnet)))
+        for _ in range(10):
+            self.conn.network.create_port(network_id=networks[1][0].id)
+        network, subnet, port = networks[0]
+        self.assertEqual(self.os_facade.find_or_create_port(network, subnet).id, port.id)
+        self.assertEqual(self.items_listed('ports'), 1)
+
+    def test_listing_calls_are_attributed_to_the_facade_method(self):
+        """
+        Test that the listing calls made through the pagination helpers are attributed to the facade method which
+        used them, not to the helpers.
+        """
+        self.conn.compute.create_keypair(name='key-0')
+        router = self.os_facade.find_or_create_router('router-blog-dev')
+        network = self.os_facade.find_or_create_network('network-blog-dev')
+        subnet = self.os_facade.find_or_create_subnet('subnet-blog-dev', network=network)
+        port = self.os_facade.find_or_create_port(network, subnet)
+        server = self.os_facade.find_or_create_server('app-0-blog-dev', network, subnet, port)
+        self.os_facade.get_name_of_first_key_pair()
+        list(self.os_facade.get_ports_for_server(server))
+        self.os_facade.get_public_addresses(server, 'network-blog-dev')
+        self.os_facade.delete_subnet('subnet-blog-dev', router.name)
+
+        callers = collections.defaultdict(set)
+        for row in self.api_profiler.summary():
+            callers[row['operation']].add(row['caller'])
+        self.assertEqual(callers['routers'], {'find_or_create_router', 'delete_subnet'})
+        self.assertEqual(callers['servers'], {'find_or_create_server'})
+        self.assertEqual(callers['keypairs'], {'get_name_of_first_key_pair'})
+        self.assertEqual(
+            callers['ports'],
+            {'find_or_create_port', 'get_ports_for_server', 'get_public_addresses', 'delete_ports'}
+        )
+        self.assertEqual(callers['ips'], {'claim_pooled_floating_ip', 'get_public_addresses'})
+
+
+class TestInventory(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = fake_cloud.FakeConnection()
+        os_facade = osf.OpenStackFacade(conn=self.conn)
+        for environment in ('blog-dev', 'blog-prod'):
+            router = os_facade.find_or_create_router('router-%s' % environment)
+            network = os_facade.find_or_create_network('network-%s' % environment)
+            subnet = os_facade.find_or_create_subnet('subnet-%s' % environment, network=network)
+            port = os_facade.find_or_create_port(network, subnet)
+            os_facade.add_interface_to_router(router, subnet, port)
+            for server_name in ['salt-%s' % environment, 'app-0-%s' % environment]:
+                os_facade.find_or_create_server(server_name, network, subnet, port)
+        os_facade.find_or_create_server('vrrp-primary', network, subnet, port)  # on network-blog-prod
+
+    def test_environment_inventory_is_streamed_as_json_lines(self):
+        """
+        Test that the inventory of an environment includes its named resources, and the unnamed resources on its
+        network, but nothing from other environments.
+        """
+        out = io.StringIO()
+        counts = inventory.write_json_lines(
+            self.conn, out, selector=inventory.EnvironmentSelector(self.conn, 'blog-prod')
+        )
+        records = [json.loads(x) for x in out.getvalue().splitlines()]
+        self.assertEqual(
+            sorted(x['name'] for x in records if x['resource_type'] == 'server'),
+            ['app-0-blog-prod', 'salt-blog-prod', 'vrrp-primary']
+        )
+        self.assertEqual([x['name'] for x in records if x['resource_type'] == 'network'], ['network-blog-prod'])
+        self.assertEqual(counts['floating_ip'], 3)
+        self.assertEqual(counts['port'], 4)  # the router port and one per server
+        self.assertEqual(counts['flavor'], 0)
+        self.assertEqual(sum(counts.values()), len(records))
+
+    def test_failed_listing_does_not_stop_the_others(self):
+        """
+        Test that a failed listing is reported as an error, while the other listings complete.
+        """
+        self.conn.fail('ports')
+        resources = list(inventory.stream(self.conn))
+        errors = [x for (resource_type, x) in resources if resource_type == inventory.ERROR]
+        self.assertEqual([x['resource_type'] for x in errors], ['port'])
+        self.assertEqual(len([x for x in resources if x[0] == 'server']), 5)
+
+    def test_early_termination_releases_the_listings(self):
+        """
+        Test that the consumer can stop early without leaving the listings blocked on a full queue.
+        """
+        threads_before = threading.active_count()
+        resources = inventory.stream(self.conn, queue_size=1)
+        next(resources)
+        resources.close()
+        started = time.time()
+        while threading.active_count() > threads_before and time.time() - started < 2:
+            time.sleep(0.01)
+        self.assertLessEqual(threading.active_count(), threads_before)
+
+
+class TestPlanner(unittest.TestCase):
+
+    def test_floating_ips_are_claimed_from_the_pool_while_it_lasts(self):
+        """
+        Test that planned floating IP addresses are claimed from the pool before any are created, and that salt
+        minions are estimated in rounds of ssh_pool_size.
+        """
+        plan = planner.Plan(pooled_floating_ips=1, ssh_pool_size=2)
+        for server_name in ['app-0-blog-dev', 'app-1-blog-dev']:
+            plan.add('create', 'server', server_name)
+            plan.add_floating_ip(server_name)
+        plan.add_salt_minions(['app-0-blog-dev', 'app-1-blog-dev', 'app-2-blog-dev'])
+        self.assertEqual(
+            [(x.verb, x.resource_type) for x in plan.actions if x.resource_type == 'floating_ip'],
+            [('claim', 'floating_ip'), ('create', 'floating_ip')]
+        )
+        self.assertEqual(plan.actions[-1].seconds, 2 * planner.ESTIMATED_SECONDS[('configure', 'salt_minion')])
+        self.assertEqual(plan.format().splitlines()[-1], 'plan: 3 to create, 1 to claim, estimated 11m 05s')
@@ -2,66 +2,50 @@
 """
 examine_environment.py
 
-Description: Examine the environment set up via quick start using the OpenStack SDK
+Description: Print an inventory of the resources in the project (or just those of one environment) as JSON Lines,
+             one resource per line, streamed as the resources arrive. Every resource type is listed concurrently.
+
+examine_environment.py [--environment <app>-<environment>] [--type <resource type> ...] [--page-size <n>]
+
+    python examine_environment.py --environment blog-dev > blog-dev.jsonl
+
 Written by:  maharg101 on 24th February 2018
 
 Related links:
  - https://docs.openstack.org/python-openstacksdk/latest/user/
 """
 
-import os
-import pprint
-
-from openstack import connection
-
-conn = connection.Connection(
-    region_name=os.environ['OS_REGION_NAME'],
-    auth=dict(
-        auth_url=os.environ['OS_AUTH_URL'],
-        username=os.environ['OS_USERNAME'],
-        password=os.environ['OS_PASSWORD'],
-        project_id=os.environ['OS_PROJECT_ID'],
-        user_domain_id=os.environ['OS_USER_DOMAIN_NAME'],
-    ),
-    compute_api_version='2',
-    identity_interface='internal',
-)
+import argparse
+import collections
+import sys
+sys.path.insert(1, '..')  # adjust path to enable 'learning' utilities to remain isolated from core deliverables.
 
-pp = pprint.PrettyPrinter(indent=4)
-
-
-def display(label, data):
-    """
-    Display a formatted label and data
-    :param label: A short textual label for the data
-    :param data: The data to be displayed. Typically a single, or list of objects.
-    :return:
-    """
-    print(label)
-    print('-' * len(label))
-    pp.pprint(data)
-    print()
+from openstack_infrastructure import facade as osf, inventory  # noqa: E402
 
 
 def main():
-    display('routers', list(conn.network.routers()))
-    display('router r1', conn.network.find_router('r1'))
-    display('networks', list(conn.network.networks()))
-    display('network net1', conn.network.find_network('net1'))
-    display('subnets', list(conn.network.subnets()))
-    display('subnet net1', conn.network.find_subnet('net1'))
-    display('security groups', list(conn.network.security_groups()))
-    display('security group default', conn.network.find_security_group('default'))
-    display(
-        'security group rules',
-        list(conn.network.security_group_rules(security_group_id=conn.network.find_security_group('default').id))
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--environment", metavar="APP-ENVIRONMENT",
+        help="only include the resources of the environment built by build.py e.g. blog-dev"
+    )
+    parser.add_argument(
+        "--type", dest="resource_types", action="append", choices=list(inventory.RESOURCE_TYPES),
+        help="only include resources of this type (may be repeated)"
+    )
+    parser.add_argument(
+        "--page-size", type=int, default=osf.DEFAULT_PAGE_SIZE, help="the number of resources requested per page"
+    )
+    args = parser.parse_args()
+    conn = osf.OpenStackFacade.create_connection_from_environ()
+    resource_types = collections.OrderedDict(
+        (x, y) for (x, y) in inventory.RESOURCE_TYPES.items() if not args.resource_types or x in args.resource_types
     )
-    display('servers', list(conn.compute.servers()))
-    display('server blog_app_1', conn.compute.find_server('blog_app_1'))
-    display('flavors', list(conn.compute.flavors()))
-    display('flavor m1.tiny', conn.compute.find_flavor('m1.tiny'))
-    display('images', list(conn.compute.images()))
-    display('image Ubuntu 16.04 LTS', conn.compute.find_image('Ubuntu 16.04 LTS'))
+    selector = inventory.EnvironmentSelector(conn, args.environment) if args.environment else None
+    counts = inventory.write_json_lines(conn, sys.stdout, resource_types, selector, page_size=args.page_size)
+    print(', '.join('%s %s' % x for x in sorted(counts.items())) or 'no resources found', file=sys.stderr)
+    if counts[inventory.ERROR]:
+        sys.exit(1)
 
 
 if __name__ == '__main__':